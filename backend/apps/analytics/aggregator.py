@@ -0,0 +1,303 @@
+"""
+Incremental aggregates maintained from the ``events`` change stream.
+
+``manage.py aggregate_events`` tails the inserts of the ``events``
+collection (resuming from the last stored resume token) and keeps three
+kinds of documents up to date in the Mongo ``aggregates`` collection:
+
+* ``heatmap``: per URL and heatmap type (``click``/``move``), weighted
+  counts of ``GRID_SIZE`` px cells at ``RESOLUTION``, the same cells as
+  ``generate_heatmap`` and the daily rollups (apps.analytics.retention);
+* ``session``: per session, event counts per type, page views, first/last
+  event time and the last page seen;
+* ``transition``: per pair of consecutive page views of a session, a count.
+
+Events are accumulated in memory and written every ``FLUSH_EVENTS`` events
+or ``FLUSH_SECONDS`` as one unordered bulk of upserting ``$inc`` updates.
+Increments are not idempotent, so the bulk also replaces the state document
+holding the resume token and runs in a transaction: a crash either loses the
+whole flush (replayed from the previous token) or none of it, and events
+are counted exactly once.
+
+Change streams need a replica set and are not available on time-series
+collections. With ``TRACKING_TRAJECTORIES['KEEP_EVENTS']`` off, mouse_move
+points only go to the trajectory buckets and are not counted here.
+"""
+
+import logging
+import re
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from pymongo import DESCENDING, ReplaceOne, UpdateOne
+
+from apps.tracking.store import naive_utc
+from apps.tracking.utils.mongo_client import get_collection
+from .retention import GRID_SIZE, HEATMAP_TYPES, RESOLUTION
+
+logger = logging.getLogger(__name__)
+
+AGGREGATOR_DEFAULTS = {
+    'FLUSH_EVENTS': 5000,
+    'FLUSH_SECONDS': 2,
+    'SESSION_CACHE_SIZE': 100000,   # last pages kept in memory for transitions
+}
+
+STATE_ID = 'aggregator_state'
+TRANSITION_SEPARATOR = '\t'
+
+
+def get_aggregator_settings():
+    return {**AGGREGATOR_DEFAULTS, **getattr(settings, 'TRACKING_AGGREGATOR', {})}
+
+
+def _aggregates():
+    collection = get_collection('aggregates')
+    if collection is None:
+        raise RuntimeError('MongoDB aggregates collection is not available')
+    return collection
+
+
+def _field(name):
+    """``name`` usable as one segment of an update path."""
+    return str(name).replace('.', '_').replace('$', '_')
+
+
+class IncrementalAggregator:
+    """Buffers events and flushes them as ``$inc`` upserts into ``aggregates``."""
+
+    def __init__(self, collection, cache_size=AGGREGATOR_DEFAULTS['SESSION_CACHE_SIZE']):
+        self.collection = collection
+        self.cache_size = cache_size
+        self.cols = RESOLUTION[0] // GRID_SIZE
+        self.rows = RESOLUTION[1] // GRID_SIZE
+        # session_id -> (timestamp, url) of the last page view already counted
+        self.last_pages = OrderedDict()
+        self.reset()
+
+    def reset(self):
+        self.heatmaps = {}
+        self.sessions = {}
+        self.page_views = {}
+        self.events = 0
+        self._pending_last_pages = {}
+
+    def add(self, doc):
+        timestamp = naive_utc(doc.get('timestamp'))
+        if not isinstance(timestamp, datetime):
+            return
+        session_id = str(doc.get('session_id', ''))
+        event_type = doc.get('event_type') or 'unknown'
+        url = doc.get('url') or ''
+        weight = doc.get('weight') or 1
+        self.events += 1
+
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = {
+                'events': 0, 'event_counts': Counter(), 'first_seen': timestamp, 'last_seen': timestamp,
+            }
+        session['events'] += 1
+        session['event_counts'][_field(event_type)] += 1
+        session['first_seen'] = min(session['first_seen'], timestamp)
+        session['last_seen'] = max(session['last_seen'], timestamp)
+
+        if event_type == 'page_view':
+            self.page_views.setdefault(session_id, []).append((timestamp, url))
+
+        heatmap_type = HEATMAP_TYPES.get(event_type)
+        data = doc.get('data')
+        if heatmap_type and isinstance(data, dict):
+            x, y = data.get('x'), data.get('y')
+            if isinstance(x, (int, float)) and isinstance(y, (int, float)) \
+                    and 0 <= x < RESOLUTION[0] and 0 <= y < RESOLUTION[1]:
+                row = min(int(y // GRID_SIZE), self.rows - 1)
+                col = min(int(x // GRID_SIZE), self.cols - 1)
+                self.heatmaps.setdefault((heatmap_type, url), Counter())[f"{row}_{col}"] += weight
+
+    def _previous_pages(self, session_ids):
+        """Last counted page of each session, from the cache or the session documents."""
+        pages = {session_id: self.last_pages.get(session_id) for session_id in session_ids}
+        missing = [session_id for session_id, page in pages.items() if page is None]
+        if missing:
+            for doc in self.collection.find(
+                {'_id': {'$in': [f"session:{session_id}" for session_id in missing]}, 'last_page': {'$exists': True}},
+                {'session_id': 1, 'last_page': 1, 'last_page_at': 1},
+            ):
+                pages[doc['session_id']] = (doc['last_page_at'], doc['last_page'])
+        return pages
+
+    def _remember(self, session_id, page):
+        self.last_pages[session_id] = page
+        self.last_pages.move_to_end(session_id)
+        while len(self.last_pages) > self.cache_size:
+            self.last_pages.popitem(last=False)
+
+    def operations(self, now=None):
+        """The bulk of updates for everything buffered since the last flush."""
+        now = now or datetime.utcnow()
+        operations = []
+
+        for (heatmap_type, url), cells in self.heatmaps.items():
+            operations.append(UpdateOne(
+                {'_id': f"heatmap:{heatmap_type}:{url}"},
+                {
+                    '$inc': {**{f"cells.{cell}": count for cell, count in cells.items()},
+                             'total_events': sum(cells.values())},
+                    '$set': {'updated_at': now},
+                    '$setOnInsert': {'kind': 'heatmap', 'url': url, 'heatmap_type': heatmap_type,
+                                     'grid_size': GRID_SIZE, 'cols': self.cols, 'rows': self.rows},
+                },
+                upsert=True,
+            ))
+
+        transitions = Counter()
+        previous_pages = self._previous_pages(list(self.page_views))
+        last_pages = {}
+        for session_id, views in self.page_views.items():
+            previous = previous_pages[session_id]
+            for view in sorted(views, key=lambda view: view[0]):
+                # A page view older than the last counted one arrived late; count it, no transition
+                if previous is not None and view[0] < previous[0]:
+                    continue
+                if previous is not None:
+                    transitions[(previous[1], view[1])] += 1
+                previous = view
+            if previous is not None and previous is not previous_pages[session_id]:
+                last_pages[session_id] = previous
+
+        for session_id, session in self.sessions.items():
+            update = {
+                '$inc': {'events': session['events'],
+                         'page_views': len(self.page_views.get(session_id, ())),
+                         **{f"event_counts.{name}": count for name, count in session['event_counts'].items()}},
+                '$min': {'first_seen': session['first_seen']},
+                '$max': {'last_seen': session['last_seen']},
+                '$setOnInsert': {'kind': 'session', 'session_id': session_id},
+            }
+            if session_id in last_pages:
+                timestamp, url = last_pages[session_id]
+                update['$set'] = {'last_page': url, 'last_page_at': timestamp}
+            operations.append(UpdateOne({'_id': f"session:{session_id}"}, update, upsert=True))
+
+        for (source, target), count in transitions.items():
+            operations.append(UpdateOne(
+                {'_id': f"transition:{source}{TRANSITION_SEPARATOR}{target}"},
+                {'$inc': {'count': count},
+                 '$setOnInsert': {'kind': 'transition', 'source': source, 'target': target}},
+                upsert=True,
+            ))
+
+        self._pending_last_pages = last_pages
+        return operations
+
+    def flush(self, state=None):
+        """Write the buffered increments, and ``state`` in the same transaction.
+
+        Returns the number of events flushed.
+        """
+        events = self.events
+        if not events:
+            return 0
+        operations = self.operations()
+        if state is not None:
+            operations.append(ReplaceOne(
+                {'_id': STATE_ID}, {**state, '_id': STATE_ID, 'updated_at': datetime.utcnow()}, upsert=True
+            ))
+        with self.collection.database.client.start_session() as session:
+            session.with_transaction(
+                lambda session: self.collection.bulk_write(operations, ordered=False, session=session)
+            )
+        for session_id, page in self._pending_last_pages.items():
+            self._remember(session_id, page)
+        self.reset()
+        return events
+
+    def load_state(self):
+        return self.collection.find_one({'_id': STATE_ID}) or {}
+
+
+def run_aggregator(aggregator, source, flush_events, flush_seconds, idle_exit=False, should_run=lambda: True):
+    """Fold ``source`` (apps.tracking.archive.ChangeStreamSource) into ``aggregator``.
+
+    Runs until stopped (or idle, with ``idle_exit``); returns the number of
+    aggregated events.
+    """
+    state = {key: value for key, value in aggregator.load_state().items() if key not in ('_id', 'updated_at')}
+    aggregated = 0
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal aggregated, last_flush
+        source.checkpoint(state)
+        aggregated += aggregator.flush(state)
+        last_flush = time.monotonic()
+
+    try:
+        while should_run():
+            documents = source.poll(flush_events)
+            for doc in documents:
+                aggregator.add(doc)
+            if aggregator.events >= flush_events or \
+                    (aggregator.events and time.monotonic() - last_flush >= flush_seconds):
+                flush()
+            if not documents and idle_exit:
+                break
+        if aggregator.events:
+            flush()
+    finally:
+        source.close()
+    return aggregated
+
+
+# Dashboard reads -------------------------------------------------------------
+
+def live_heatmap(url_pattern, heatmap_type):
+    """Heatmap of every URL containing ``url_pattern``, in ``Heatmap.data`` format."""
+    grid = [[0] * (RESOLUTION[0] // GRID_SIZE) for _ in range(RESOLUTION[1] // GRID_SIZE)]
+    query = {'kind': 'heatmap', 'heatmap_type': heatmap_type}
+    if url_pattern:
+        query['url'] = {'$regex': re.escape(url_pattern)}
+    for doc in _aggregates().find(query, {'cells': 1}):
+        for cell, count in doc.get('cells', {}).items():
+            row, col = map(int, cell.split('_'))
+            grid[row][col] += count
+    return {
+        'grid': grid,
+        'grid_size': GRID_SIZE,
+        'max_value': max([max(row) for row in grid]) if grid else 0,
+        'total_events': sum([sum(row) for row in grid]) if grid else 0,
+        'resolution': {
+            'width': RESOLUTION[0],
+            'height': RESOLUTION[1]
+        }
+    }
+
+
+def session_summary(session_id):
+    """Aggregated counters of one session, or ``None``."""
+    doc = _aggregates().find_one({'_id': f"session:{session_id}"})
+    if doc is None:
+        return None
+    doc.pop('_id')
+    doc.pop('kind', None)
+    return doc
+
+
+def recent_sessions(limit=50):
+    """Summaries of the sessions with the most recent events."""
+    cursor = _aggregates().find({'kind': 'session'}, {'_id': 0, 'kind': 0}) \
+        .sort('last_seen', DESCENDING).limit(limit)
+    return list(cursor)
+
+
+def top_transitions(source=None, limit=50):
+    """Most frequent page transitions, optionally from one URL."""
+    query = {'kind': 'transition'}
+    if source:
+        query['source'] = source
+    cursor = _aggregates().find(query, {'_id': 0, 'source': 1, 'target': 1, 'count': 1}) \
+        .sort('count', DESCENDING).limit(limit)
+    return list(cursor)
@@ -0,0 +1,403 @@
+"""
+Offline batch analytics over archived event files.
+
+Computes the outputs of ``generate_heatmap``, ``generate_path_analysis``
+and ``generate_funnel_analysis`` (apps.analytics.tasks) from files on disk
+instead of the live event store, so backfills over months of data never
+query the production databases. Two formats are read:
+
+* Parquet files of the event archive (apps.tracking.archive), laid out as
+  ``date=YYYY-MM-DD/event_type=<type>/*.parquet``; the partition keys prune
+  whole directories before anything is opened;
+* JSON-lines files (``*.jsonl``/``*.json``), one event document per line
+  (``session_id``, ``event_type``, ``timestamp``, ``url``, ``data``), e.g. a
+  ``mongoexport`` or the sink connector output, in the same layout or flat.
+
+Each partition (file) is read with memory mapping and reduced to a small
+partial result (a heatmap grid, page views, first-seen times of sessions)
+in a pool of ``WORKERS`` processes; the partials are merged in the parent.
+Inside a daemonic process (a Celery prefork worker) partitions are read
+in-process instead, since daemons may not have children.
+
+Differences from the live tasks, inherent to the archive: a session
+"starts" at its first archived event (looked up to ``SESSION_LOOKBACK_DAYS``
+before ``date_from``) rather than at the ``Session`` row, and Parquet
+coordinates are whole pixels.
+"""
+
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from bson import json_util
+from django.conf import settings
+
+from apps.tracking.store import naive_utc
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+BATCH_DEFAULTS = {
+    'PATH': None,                   # None = TRACKING_ARCHIVE['PATH']
+    'WORKERS': os.cpu_count() or 1,
+    'SESSION_LOOKBACK_DAYS': 1,
+}
+
+GRID_SIZE = 10
+PARQUET_SUFFIXES = ('.parquet',)
+JSONL_SUFFIXES = ('.jsonl', '.json')
+HEATMAP_EVENT_TYPES = {'click': 'mouse_click', 'move': 'mouse_move'}
+
+
+def get_batch_settings():
+    config = {**BATCH_DEFAULTS, **getattr(settings, 'ANALYTICS_BATCH', {})}
+    if not config['PATH']:
+        from apps.tracking.archive import get_archive_settings
+        config['PATH'] = get_archive_settings()['PATH']
+    return config
+
+
+# ---------------------------------------------------------------------------
+# Partitions
+# ---------------------------------------------------------------------------
+
+def _hive_keys(directory, root):
+    keys = {}
+    for part in os.path.relpath(directory, root).split(os.sep):
+        name, sep, value = part.partition('=')
+        if sep:
+            keys[name] = value
+    return keys
+
+
+def discover_partitions(root, event_types=None, day_from=None, day_to=None):
+    """Data files under ``root`` as ``(path, format, day, event_type)`` tuples.
+
+    ``day``/``event_type`` come from ``date=``/``event_type=`` directories
+    (``None`` when the layout has none); files of other days or types are
+    skipped. Hidden files (``.``/``_`` prefixes) are ignored.
+    """
+    partitions = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(d for d in subdirectories if not d.startswith(('.', '_')))
+        keys = _hive_keys(directory, root)
+        day = date.fromisoformat(keys['date']) if 'date' in keys else None
+        event_type = keys.get('event_type')
+        if day is not None and ((day_from and day < day_from) or (day_to and day > day_to)):
+            subdirectories[:] = []
+            continue
+        if event_type is not None and event_types and event_type not in event_types:
+            subdirectories[:] = []
+            continue
+        for name in sorted(files):
+            if name.startswith(('.', '_')):
+                continue
+            if name.endswith(PARQUET_SUFFIXES):
+                file_format = 'parquet'
+            elif name.endswith(JSONL_SUFFIXES):
+                file_format = 'jsonl'
+            else:
+                continue
+            partitions.append((os.path.join(directory, name), file_format, day, event_type))
+    return partitions
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return naive_utc(value)
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value / 1000)
+    if isinstance(value, str):
+        return naive_utc(datetime.fromisoformat(value.replace('Z', '+00:00')))
+    return None
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+def read_jsonl(path, event_type=None):
+    """Columns of a JSON-lines file, read through a memory map."""
+    timestamps, session_ids, event_types, urls, xs, ys, weights = [], [], [], [], [], [], []
+    if os.path.getsize(path):
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b''):
+                line = line.strip()
+                if not line:
+                    continue
+                doc = json_util.loads(line)
+                timestamp = _timestamp(doc.get('timestamp'))
+                if timestamp is None:
+                    continue
+                data = doc.get('data')
+                if isinstance(data, str):
+                    try:
+                        data = json.loads(data)
+                    except ValueError:
+                        data = None
+                data = data if isinstance(data, dict) else {}
+                timestamps.append(timestamp)
+                session_ids.append(str(doc.get('session_id', '')))
+                event_types.append(doc.get('event_type') or event_type)
+                urls.append(doc.get('url') or '')
+                xs.append(_number(data.get('x')))
+                ys.append(_number(data.get('y')))
+                weights.append(doc.get('weight') or 1)
+    return {
+        'timestamp': np.array(timestamps, dtype='datetime64[ms]'),
+        'session_id': np.array(session_ids, dtype=object),
+        'event_type': np.array(event_types, dtype=object),
+        'url': np.array(urls, dtype=object),
+        'x': np.array(xs, dtype=np.float64),
+        'y': np.array(ys, dtype=np.float64),
+        'weight': np.array(weights, dtype=np.int64),
+    }
+
+
+def read_parquet(path, event_type=None, columns=None):
+    """Columns of an archive Parquet file, memory mapped; ``columns`` limits what is decoded."""
+    if pq is None:
+        raise RuntimeError('pyarrow is required to read Parquet archives (pip install pyarrow)')
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    available = set(parquet_file.schema_arrow.names)
+    wanted = [name for name in (columns or available) if name in available]
+    table = parquet_file.read(columns=wanted)
+    chunk = {}
+    for name in wanted:
+        values = table.column(name).to_numpy()
+        if name in ('x', 'y'):
+            values = values.astype(np.float64)
+        elif name == 'weight':
+            values = values.astype(np.int64)
+        elif name == 'timestamp':
+            values = values.astype('datetime64[ms]')
+        chunk[name] = values
+    if 'event_type' not in chunk and (columns is None or 'event_type' in columns):
+        chunk['event_type'] = np.full(table.num_rows, event_type, dtype=object)
+    return chunk
+
+
+def read_partition(partition, columns=None):
+    path, file_format, _, event_type = partition
+    if file_format == 'parquet':
+        return read_parquet(path, event_type, columns)
+    return read_jsonl(path, event_type)
+
+
+def _select(chunk, start, end, event_types=None):
+    """Row mask of ``start <= timestamp < end`` (``datetime64[ms]`` bounds) and the event types."""
+    timestamps = chunk['timestamp']
+    keep = (timestamps >= start) & (timestamps < end)
+    if event_types:
+        keep &= np.isin(chunk['event_type'], list(event_types))
+    return keep
+
+
+# ---------------------------------------------------------------------------
+# Per-partition reducers (run in worker processes)
+# ---------------------------------------------------------------------------
+
+def heatmap_partition(partition, start, end, event_type, url_pattern, width, height, grid_size):
+    """Weighted ``(rows, cols)`` grid of one partition's events."""
+    cols, rows = width // grid_size, height // grid_size
+    grid = np.zeros((rows, cols), dtype=np.int64)
+    chunk = read_partition(partition, ('timestamp', 'url', 'x', 'y', 'weight', 'event_type'))
+    keep = _select(chunk, start, end, [event_type])
+    if url_pattern:
+        urls = chunk['url']
+        matching = [url for url in set(urls[keep].tolist()) if url_pattern in url]
+        keep &= np.isin(urls, matching)
+    x, y = chunk['x'][keep], chunk['y'][keep]
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    col = np.minimum((x[inside] // grid_size).astype(np.int64), cols - 1)
+    row = np.minimum((y[inside] // grid_size).astype(np.int64), rows - 1)
+    np.add.at(grid, (row, col), chunk['weight'][keep][inside])
+    return grid
+
+
+def page_views_partition(partition, start, end):
+    """``(session_ids, timestamps, urls)`` of one partition's page views."""
+    chunk = read_partition(partition, ('timestamp', 'session_id', 'url', 'event_type'))
+    keep = _select(chunk, start, end, ['page_view'])
+    return (
+        chunk['session_id'][keep].tolist(),
+        chunk['timestamp'][keep].astype(np.int64),
+        chunk['url'][keep].tolist(),
+    )
+
+
+def session_starts_partition(partition, start, end):
+    """``{session_id: first event time (ms)}`` of one partition."""
+    chunk = read_partition(partition, ('timestamp', 'session_id', 'event_type'))
+    keep = _select(chunk, start, end)
+    starts = {}
+    for session_id, timestamp in zip(chunk['session_id'][keep].tolist(),
+                                     chunk['timestamp'][keep].astype(np.int64).tolist()):
+        if timestamp < starts.get(session_id, timestamp + 1):
+            starts[session_id] = timestamp
+    return starts
+
+
+def map_partitions(function, partitions, args, workers):
+    """``[function(partition, *args) for partition in partitions]``, in a process pool when possible."""
+    if workers > 1 and len(partitions) > 1 and not multiprocessing.current_process().daemon:
+        with multiprocessing.Pool(min(workers, len(partitions))) as pool:
+            return pool.starmap(function, [(partition, *args) for partition in partitions])
+    return [function(partition, *args) for partition in partitions]
+
+
+# ---------------------------------------------------------------------------
+# Analyses
+# ---------------------------------------------------------------------------
+
+def _bounds(date_from, date_to):
+    """``datetime64[ms]`` scan bounds; ``date_to`` is inclusive like the live tasks."""
+    start = naive_utc(date_from)
+    end = naive_utc(date_to) + timedelta(milliseconds=1)
+    return np.datetime64(start, 'ms'), np.datetime64(end, 'ms'), start.date(), end.date()
+
+
+class BatchEngine:
+    """Batch versions of the analytics tasks over the files under ``path``."""
+
+    def __init__(self, path=None, workers=None):
+        config = get_batch_settings()
+        self.path = os.path.abspath(str(path or config['PATH']))
+        self.workers = workers or config['WORKERS']
+        self.lookback = timedelta(days=config['SESSION_LOOKBACK_DAYS'])
+        if not os.path.isdir(self.path):
+            raise FileNotFoundError(f"Archive directory not found: {self.path}")
+
+    def heatmap(self, url_pattern, heatmap_type, date_from, date_to, width=1920, height=1080):
+        """``Heatmap.data`` as produced by ``generate_heatmap``."""
+        event_type = HEATMAP_EVENT_TYPES[heatmap_type]
+        start, end, day_from, day_to = _bounds(date_from, date_to)
+        partitions = discover_partitions(self.path, [event_type], day_from, day_to)
+        grid = np.zeros((height // GRID_SIZE, width // GRID_SIZE), dtype=np.int64)
+        for partial in map_partitions(heatmap_partition, partitions,
+                                      (start, end, event_type, url_pattern, width, height, GRID_SIZE),
+                                      self.workers):
+            grid += partial
+        grid = grid.tolist()
+        return {
+            'grid': grid,
+            'grid_size': GRID_SIZE,
+            'max_value': max([max(row) for row in grid]) if grid else 0,
+            'total_events': sum([sum(row) for row in grid]) if grid else 0,
+            'resolution': {
+                'width': width,
+                'height': height
+            }
+        }
+
+    def session_ids(self, date_from, date_to):
+        """Sessions whose first archived event falls in ``[date_from, date_to]``."""
+        start, end, _, day_to = _bounds(date_from, date_to)
+        lookback = start - np.timedelta64(self.lookback)
+        partitions = discover_partitions(self.path, None, (naive_utc(date_from) - self.lookback).date(), day_to)
+        starts = {}
+        for partial in map_partitions(session_starts_partition, partitions, (lookback, end), self.workers):
+            for session_id, timestamp in partial.items():
+                if timestamp < starts.get(session_id, timestamp + 1):
+                    starts[session_id] = timestamp
+        start_ms, end_ms = start.astype(np.int64), end.astype(np.int64)
+        return {session_id for session_id, timestamp in starts.items() if start_ms <= timestamp < end_ms}
+
+    def page_views(self, date_from, date_to=None):
+        """``{session_id: [url, ...]}`` in timestamp order; sessions ordered by first view.
+
+        Without ``date_to`` every page view from ``date_from`` on is read.
+        """
+        if date_to is None:
+            start, day_from = np.datetime64(naive_utc(date_from), 'ms'), naive_utc(date_from).date()
+            end, day_to = np.datetime64(datetime.max, 'ms'), None
+        else:
+            start, end, day_from, day_to = _bounds(date_from, date_to)
+        partitions = discover_partitions(self.path, ['page_view'], day_from, day_to)
+        session_ids, timestamps, urls = [], [], []
+        for partial_sessions, partial_timestamps, partial_urls in map_partitions(
+                page_views_partition, partitions, (start, end), self.workers):
+            session_ids.extend(partial_sessions)
+            timestamps.append(partial_timestamps)
+            urls.extend(partial_urls)
+        if not session_ids:
+            return {}
+        session_pages = {}
+        for i in np.argsort(np.concatenate(timestamps), kind='stable').tolist():
+            session_pages.setdefault(session_ids[i], []).append(urls[i])
+        return session_pages
+
+    def path_analysis(self, date_from, date_to):
+        """``PathAnalysis.data`` as produced by ``generate_path_analysis``."""
+        session_ids = self.session_ids(date_from, date_to)
+        # Like the live task, page views are read from date_from on
+        session_pages = {
+            session_id: path for session_id, path in self.page_views(date_from).items()
+            if session_id in session_ids
+        }
+        paths = {}
+        for path in session_pages.values():
+            path_key = ' -> '.join(path)
+            if path_key in paths:
+                paths[path_key]['count'] += 1
+            else:
+                paths[path_key] = {'path': path, 'count': 1}
+        return {
+            'paths': sorted(paths.values(), key=lambda x: x['count'], reverse=True),
+            'total_sessions': len(session_pages),
+        }
+
+    def funnel_analysis(self, steps, date_from, date_to):
+        """``FunnelAnalysis.data`` as produced by ``generate_funnel_analysis``.
+
+        ``steps`` are ``(name, url_pattern, step_order)`` in step order.
+        """
+        from .retention import summarize_funnel
+
+        sessions = self.session_ids(date_from, date_to)
+        session_urls = {
+            session_id: urls for session_id, urls in self.page_views(date_from, date_to).items()
+            if session_id in sessions
+        }
+        return {**summarize_funnel(steps, session_urls), 'total_sessions': len(sessions)}
+
+
+def run_batch_analysis(kind, object_id, path=None, workers=None, force=False):
+    """Compute a ``Heatmap``/``PathAnalysis``/``FunnelAnalysis`` from the archive and save it.
+
+    Returns the saved ``data``, or ``None`` if it was already processed and
+    ``force`` is off.
+    """
+    from .models import FunnelAnalysis, Heatmap, PathAnalysis
+
+    model = {'heatmap': Heatmap, 'path': PathAnalysis, 'funnel': FunnelAnalysis}[kind]
+    analysis = model.objects.get(id=object_id)
+    if analysis.is_processed and not force:
+        return None
+
+    engine = BatchEngine(path, workers)
+    if kind == 'heatmap':
+        data = engine.heatmap(analysis.url_pattern, analysis.heatmap_type, analysis.date_from, analysis.date_to,
+                              analysis.resolution_width, analysis.resolution_height)
+    elif kind == 'path':
+        data = engine.path_analysis(analysis.date_from, analysis.date_to)
+    else:
+        steps = [(step.name, step.url_pattern, step.step_order)
+                 for step in analysis.funnel.steps.order_by('step_order')]
+        if not steps:
+            raise ValueError(f"Funnel {analysis.funnel_id} has no steps")
+        data = engine.funnel_analysis(steps, analysis.date_from, analysis.date_to)
+
+    analysis.data = data
+    analysis.is_processed = True
+    analysis.save()
+    logger.info(f"Batch {kind} analysis {object_id} computed from {engine.path}")
+    return data
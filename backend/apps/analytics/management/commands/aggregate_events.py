@@ -0,0 +1,57 @@
+"""Keep the incremental aggregates up to date from the events change stream."""
+
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.analytics.aggregator import (
+    IncrementalAggregator, get_aggregator_settings, run_aggregator,
+)
+from apps.tracking.archive import ChangeStreamSource
+from apps.tracking.utils.mongo_client import get_collection, get_mongo_db
+from apps.tracking.utils.timeseries import is_timeseries
+
+
+class Command(BaseCommand):
+    help = (
+        "Tail the events change stream and fold new events into per-URL heatmap cells, "
+        "per-session summaries and page transitions (batched $inc writes to `aggregates`)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flush-events', type=int, default=None, help='Events buffered before a flush.')
+        parser.add_argument('--flush-seconds', type=float, default=None, help='Maximum seconds between flushes.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Forget the stored resume token and start from new events only.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the change stream is idle instead of running until interrupted.')
+
+    def handle(self, *args, **options):
+        db = get_mongo_db()
+        events, aggregates = get_collection('events'), get_collection('aggregates')
+        if db is None or events is None or aggregates is None:
+            raise CommandError('MongoDB is not available')
+        if is_timeseries(db, settings.MONGODB_COLLECTIONS.get('events', 'events')):
+            raise CommandError('Change streams are not supported on time-series collections')
+
+        config = get_aggregator_settings()
+        aggregator = IncrementalAggregator(aggregates, config['SESSION_CACHE_SIZE'])
+        state = {} if options['reset'] else aggregator.load_state()
+        source = ChangeStreamSource(events, resume_token=state.get('resume_token'))
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        aggregated = run_aggregator(
+            aggregator, source,
+            flush_events=options['flush_events'] or config['FLUSH_EVENTS'],
+            flush_seconds=options['flush_seconds'] or config['FLUSH_SECONDS'],
+            idle_exit=options['once'],
+            should_run=lambda: self.running,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Aggregated {aggregated} event(s)"))
+
+    def stop(self, signum, frame):
+        self.running = False
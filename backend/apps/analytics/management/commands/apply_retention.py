@@ -0,0 +1,54 @@
+"""Roll closed days up into ``rollups`` and expire raw events past their retention."""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.analytics.retention import rollup_day, run_retention
+from apps.tracking.utils.mongo_client import get_mongo_db
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute daily rollups (heatmap grids, hourly counts, paths, funnels) for every "
+        "closed day not rolled up yet, then expire raw events per TRACKING_RETENTION."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rollup-only', action='store_true',
+                            help='Compute rollups but do not expire anything.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report how many raw events would expire; write nothing.')
+        parser.add_argument('--day', default=None,
+                            help='Recompute the rollups of one day (YYYY-MM-DD) and exit.')
+
+    def handle(self, *args, **options):
+        if get_mongo_db() is None:
+            raise CommandError('MongoDB is not available')
+
+        if options['day']:
+            try:
+                day = date.fromisoformat(options['day'])
+            except ValueError:
+                raise CommandError(f"Invalid day: {options['day']}")
+            events = rollup_day(day)
+            self.stdout.write(self.style.SUCCESS(f"Rolled up {events} event(s) of {day}"))
+            return
+
+        report = run_retention(rollup_only=options['rollup_only'], dry_run=options['dry_run'])
+        for day, events in report['rolled_up'].items():
+            self.stdout.write(f"Rolled up {day}: {events} event(s)")
+        self.stdout.write(f"Rollups cover every day through {report['rolled_up_through']}")
+
+        verb = 'would expire' if options['dry_run'] else 'expired'
+        for event_type, entry in report['expired'].items():
+            if event_type == 'trajectories':
+                self.stdout.write(f"trajectories: {entry} bucket(s) expired")
+                continue
+            if 'error' in entry:
+                self.stdout.write(self.style.WARNING(f"{event_type} before {entry['cutoff']}: {entry['error']}"))
+            elif 'deleted' in entry:
+                self.stdout.write(f"{event_type} before {entry['cutoff']}: {verb} {entry['deleted']}")
+            else:
+                self.stdout.write(f"{event_type} before {entry['cutoff']}: left to the TTL index")
+        self.stdout.write(self.style.SUCCESS('Retention applied'))
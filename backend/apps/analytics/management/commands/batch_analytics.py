@@ -0,0 +1,37 @@
+"""Compute analyses from archived event files instead of the live event store."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.analytics.batch import run_batch_analysis
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute Heatmap, PathAnalysis or FunnelAnalysis objects from archived Parquet/JSON-lines "
+        "event files (same output as the live analytics tasks, without querying the databases)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['heatmap', 'path', 'funnel'])
+        parser.add_argument('ids', nargs='+', type=int, help='Ids of the analyses to compute.')
+        parser.add_argument('--path', default=None,
+                            help="Archive directory (default: ANALYTICS_BATCH['PATH']).")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Processes reading partitions (default: ANALYTICS_BATCH['WORKERS']).")
+        parser.add_argument('--force', action='store_true',
+                            help='Recompute analyses that are already processed.')
+
+    def handle(self, *args, **options):
+        for object_id in options['ids']:
+            try:
+                data = run_batch_analysis(options['kind'], object_id, path=options['path'],
+                                          workers=options['workers'], force=options['force'])
+            except FileNotFoundError as e:
+                raise CommandError(str(e))
+            except Exception as e:
+                self.stderr.write(f"{options['kind']} {object_id}: {e}")
+                continue
+            if data is None:
+                self.stdout.write(f"{options['kind']} {object_id}: already processed (use --force)")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{options['kind']} {object_id}: done"))
@@ -0,0 +1,418 @@
+"""
+Tiered retention: compact rollups first, then expiry of raw events.
+
+Every closed UTC day is rolled up once into the Mongo ``rollups``
+collection before any of its raw events may expire. A day counts as closed
+``ROLLUP_DELAY_SECONDS`` after its end: with the broker enabled, events are
+stamped when the API receives them but inserted by the loader later, and a
+rollup that ran before they arrived would never count them.
+
+Rollups:
+
+* ``heatmap``: per URL and heatmap type (``click``/``move``), a sparse
+  ``GRID_SIZE`` px grid of event counts (weighted by the simplification
+  ``weight``), the same cells ``generate_heatmap`` produces;
+* ``hourly``: per URL, 24 hourly counts per event type;
+* ``paths``: the day's page_view paths (``generate_path_analysis`` format)
+  and URL-to-URL transition counts, which add up across days;
+* ``funnel``: per configured funnel, the day's ``generate_funnel_analysis``
+  result.
+
+Raw events are scanned from the configured event store (apps.tracking.store).
+Rollup documents have deterministic ids and are replaced on re-run, so
+rolling a day up twice is harmless.
+
+Raw events then expire per event type (apps.tracking.utils.expiry), never
+past the last rolled-up day: SQLite rows are deleted in batches and Mongo
+events either deleted the same way (``MODE='delete'``) or left to the
+``expire_at`` TTL index (``MODE='ttl'``).
+"""
+
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ReplaceOne
+
+from apps.tracking.models import Event
+from apps.tracking.store import get_event_store, naive_utc
+from apps.tracking.utils.expiry import (
+    get_retention_settings, retention_days, ttl_enabled
+)
+from apps.tracking.utils.mongo_client import get_collection, get_mongo_db
+from apps.tracking.utils.mongo_schema import ensure_expiry_index
+from apps.tracking.utils.timeseries import is_timeseries
+
+logger = logging.getLogger(__name__)
+
+GRID_SIZE = 10
+RESOLUTION = (1920, 1080)
+MAX_PATHS = 500
+MAX_DAYS_PER_RUN = 31
+STATE_ID = 'retention_state'
+
+HEATMAP_TYPES = {'mouse_click': 'click', 'mouse_move': 'move'}
+
+
+def _orm_datetime(value):
+    return timezone.make_aware(value, dt_timezone.utc) if settings.USE_TZ else value
+
+
+def day_bounds(day):
+    start = datetime(day.year, day.month, day.day)
+    return start, start + timedelta(days=1)
+
+
+# Raw event sources -----------------------------------------------------------
+
+def day_chunks(start, end):
+    """Columnar chunks of every raw event in ``[start, end)`` (see apps.tracking.store)."""
+    return get_event_store().scan(start=start, end=end)
+
+
+def earliest_event_time():
+    """Timestamp (naive UTC) of the oldest raw event, or ``None``."""
+    for chunk in get_event_store().scan(columns=('timestamp',), limit=1):
+        if len(chunk['timestamp']):
+            return chunk['timestamp'][0].astype(datetime)
+    return None
+
+
+# Rollups ---------------------------------------------------------------------
+
+class DayRollup:
+    """Accumulates one day of raw events into rollup documents."""
+
+    def __init__(self, day, funnels=()):
+        self.day = day
+        self.funnels = funnels
+        self.cols = RESOLUTION[0] // GRID_SIZE
+        self.rows = RESOLUTION[1] // GRID_SIZE
+        self.heatmaps = {}
+        self.hourly = {}
+        self.page_views = {}
+        self.events = 0
+
+    def add_chunk(self, chunk):
+        """Add a columnar chunk of raw events."""
+        timestamps = chunk['timestamp']
+        self.events += len(timestamps)
+        hours = ((timestamps - timestamps.astype('datetime64[D]')) // np.timedelta64(1, 'h')).astype(np.int64)
+        event_types = chunk['event_type']
+        urls = chunk['url']
+        weights = chunk['weight']
+
+        for url, event_type, hour, weight in zip(urls.tolist(), event_types.tolist(), hours.tolist(),
+                                                 weights.tolist()):
+            counts = self.hourly.setdefault(url or '', {}).setdefault(event_type or 'unknown', [0] * 24)
+            counts[hour] += weight
+
+        x, y = chunk['x'], chunk['y']
+        inside = (x >= 0) & (x < RESOLUTION[0]) & (y >= 0) & (y < RESOLUTION[1])
+        for event_type, heatmap_type in HEATMAP_TYPES.items():
+            keep = inside & (event_types == event_type)
+            if not keep.any():
+                continue
+            cols = np.minimum((x[keep] // GRID_SIZE).astype(np.int64), self.cols - 1)
+            rows = np.minimum((y[keep] // GRID_SIZE).astype(np.int64), self.rows - 1)
+            for url, row, col, weight in zip(urls[keep].tolist(), rows.tolist(), cols.tolist(),
+                                             weights[keep].tolist()):
+                self.heatmaps.setdefault((heatmap_type, url or ''), Counter())[(row, col)] += weight
+
+        views = event_types == 'page_view'
+        for session_id, timestamp, url in zip(chunk['session_id'][views].tolist(), timestamps[views].tolist(),
+                                              urls[views].tolist()):
+            self.page_views.setdefault(str(session_id), []).append((timestamp, url or ''))
+
+    def session_paths(self):
+        return {
+            session_id: [url for _, url in sorted(views, key=lambda view: view[0])]
+            for session_id, views in self.page_views.items()
+        }
+
+    def documents(self):
+        day = datetime(self.day.year, self.day.month, self.day.day)
+        key = self.day.isoformat()
+        documents = []
+
+        for (heatmap_type, url), cells in self.heatmaps.items():
+            documents.append({
+                '_id': f"heatmap:{heatmap_type}:{key}:{url}",
+                'kind': 'heatmap', 'day': day, 'url': url, 'heatmap_type': heatmap_type,
+                'grid_size': GRID_SIZE, 'cols': self.cols, 'rows': self.rows,
+                'cells': [[row, col, count] for (row, col), count in cells.items()],
+                'total_events': sum(cells.values()),
+            })
+
+        for url, counts in self.hourly.items():
+            documents.append({
+                '_id': f"hourly:{key}:{url}",
+                'kind': 'hourly', 'day': day, 'url': url, 'counts': counts,
+            })
+
+        paths = self.session_paths()
+        documents.append(dict(_id=f"paths:{key}", kind='paths', day=day, **summarize_paths(paths)))
+        for funnel_id, steps in self.funnels:
+            documents.append({
+                '_id': f"funnel:{funnel_id}:{key}",
+                'kind': 'funnel', 'day': day, 'funnel_id': funnel_id,
+                **summarize_funnel(steps, paths),
+            })
+        return documents
+
+
+def summarize_paths(paths):
+    """``generate_path_analysis``-style summary plus additive transition counts."""
+    counts = Counter(tuple(path) for path in paths.values())
+    transitions = Counter()
+    for path in paths.values():
+        transitions.update(zip(path, path[1:]))
+    return {
+        'paths': [{'path': list(path), 'count': count} for path, count in counts.most_common(MAX_PATHS)],
+        'distinct_paths': len(counts),
+        'total_sessions': len(paths),
+        'transitions': [[source, target, count] for (source, target), count in transitions.most_common()],
+    }
+
+
+def summarize_funnel(steps, paths):
+    """``generate_funnel_analysis`` for one day; ``steps`` are ``(name, url_pattern, step_order)``."""
+    step_data = []
+    step_counts = []
+    prev_sessions = set()
+    for i, (name, url_pattern, step_order) in enumerate(steps):
+        current_sessions = {
+            session_id for session_id, urls in paths.items()
+            if any(url_pattern in url for url in urls)
+        }
+        if i == 0:
+            conversion_rate = 100.0
+            prev_sessions = current_sessions
+        else:
+            continued_sessions = current_sessions & prev_sessions
+            conversion_rate = (len(continued_sessions) / len(prev_sessions) * 100) if prev_sessions else 0
+            prev_sessions = continued_sessions
+        step_counts.append(len(current_sessions))
+        step_data.append({
+            'name': name,
+            'url_pattern': url_pattern,
+            'step_order': step_order,
+            'sessions_count': len(current_sessions),
+            'conversion_rate': round(conversion_rate, 2),
+            'drop_off_rate': round(100 - conversion_rate, 2) if i > 0 else 0,
+        })
+    return {
+        'steps': step_data,
+        'total_sessions': len(paths),
+        'completion_rate': round(step_counts[-1] / step_counts[0] * 100, 2) if step_counts and step_counts[0] else 0,
+    }
+
+
+def funnel_definitions():
+    from .models import Funnel
+    return [
+        (funnel.id, [(step.name, step.url_pattern, step.step_order) for step in funnel.steps.order_by('step_order')])
+        for funnel in Funnel.objects.prefetch_related('steps')
+    ]
+
+
+def rollup_day(day, funnels=None):
+    """Compute and store the rollups of one UTC day; returns the number of raw events."""
+    rollups = get_collection('rollups')
+    if rollups is None:
+        raise RuntimeError('MongoDB is not available')
+
+    rollup = DayRollup(day, funnel_definitions() if funnels is None else funnels)
+    for chunk in day_chunks(*day_bounds(day)):
+        rollup.add_chunk(chunk)
+
+    documents = rollup.documents()
+    rollups.bulk_write([ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in documents], ordered=False)
+    logger.info(f"Rolled up {rollup.events} event(s) of {day} into {len(documents)} document(s)")
+    return rollup.events
+
+
+def rolled_up_through():
+    """Last day whose rollups are stored (all earlier days are too), or ``None``."""
+    rollups = get_collection('rollups')
+    state = rollups.find_one({'_id': STATE_ID}) if rollups is not None else None
+    return state['through'].date() if state and state.get('through') else None
+
+
+def _record_rolled_up(day):
+    get_collection('rollups').update_one(
+        {'_id': STATE_ID},
+        {'$set': {'through': datetime(day.year, day.month, day.day), 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def pending_days(now, delay_seconds=0):
+    """Days closed for ``delay_seconds`` and not rolled up yet (at most ``MAX_DAYS_PER_RUN``)."""
+    last_closed = (now - timedelta(days=1, seconds=delay_seconds)).date()
+    through = rolled_up_through()
+    if through is None:
+        earliest = earliest_event_time()
+        if earliest is None:
+            return []
+        first = earliest.date()
+    else:
+        first = through + timedelta(days=1)
+    days = []
+    day = first
+    while day <= last_closed and len(days) < MAX_DAYS_PER_RUN:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+# Expiry ----------------------------------------------------------------------
+
+def expiry_cutoffs(now, through, config):
+    """``{event_type: cutoff}`` for configured types plus ``None`` for all others.
+
+    Cutoffs never pass the end of the last rolled-up day.
+    """
+    safe = datetime(through.year, through.month, through.day) + timedelta(days=1) if through else None
+    cutoffs = {}
+    for event_type in list(config['EVENT_TYPES']) + [None]:
+        days = retention_days(event_type, config)
+        if days is None or safe is None:
+            continue
+        cutoffs[event_type] = min(now - timedelta(days=days), safe)
+    return cutoffs
+
+
+def delete_sqlite_events(event_type, cutoff, configured, batch_size, dry_run=False):
+    queryset = Event.objects.filter(timestamp__lt=_orm_datetime(cutoff))
+    queryset = queryset.filter(event_type=event_type) if event_type else queryset.exclude(event_type__in=configured)
+    if dry_run:
+        return queryset.count()
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Event.objects.filter(id__in=ids).delete()[0]
+
+
+def delete_mongo_events(event_type, cutoff, configured, dry_run=False):
+    collection = get_collection('events')
+    if collection is None:
+        return 0
+    db = get_mongo_db()
+    field = 'meta.event_type' if db is not None and is_timeseries(db, collection.name) else 'event_type'
+    query = {'timestamp': {'$lt': cutoff}, field: event_type if event_type else {'$nin': configured}}
+    if dry_run:
+        return collection.count_documents(query)
+    return collection.delete_many(query).deleted_count
+
+
+def expire_raw_events(now, through, config=None, dry_run=False):
+    """Delete raw events past their retention (never past ``through``).
+
+    Only the configured event store is touched: it is the one rollups read.
+    """
+    config = config or get_retention_settings()
+    configured = list(config['EVENT_TYPES'])
+    store = get_event_store()
+    report = {}
+    for event_type, cutoff in expiry_cutoffs(now, through, config).items():
+        label = event_type or '*'
+        entry = {'cutoff': cutoff.isoformat()}
+        if store.name == 'sqlite':
+            entry['deleted'] = delete_sqlite_events(
+                event_type, cutoff, configured, config['DELETE_BATCH_SIZE'], dry_run
+            )
+        elif not ttl_enabled(config):
+            try:
+                entry['deleted'] = delete_mongo_events(event_type, cutoff, configured, dry_run)
+            except Exception as e:
+                # e.g. MongoDB 6.0 only deletes from time-series collections by metaField
+                logger.warning(f"Could not expire Mongo {label} events: {str(e)}")
+                entry['error'] = str(e)
+        report[label] = entry
+
+    move_cutoff = report.get('mouse_move', {}).get('cutoff')
+    trajectories = get_collection('trajectories') if store.name == 'mongo' else None
+    if move_cutoff and trajectories is not None and not dry_run:
+        report['trajectories'] = trajectories.delete_many(
+            {'t_max': {'$lt': datetime.fromisoformat(move_cutoff)}}
+        ).deleted_count
+    return report
+
+
+def run_retention(now=None, rollup_only=False, dry_run=False):
+    """Roll up every pending closed day, then expire raw events.
+
+    Returns a report with the rolled-up days and the expiry counts.
+    """
+    config = get_retention_settings()
+    now = now or datetime.utcnow()
+    report = {'rolled_up': {}, 'expired': {}}
+
+    days = pending_days(now, config['ROLLUP_DELAY_SECONDS'])
+    if days and not dry_run:
+        funnels = funnel_definitions()
+        for day in days:
+            report['rolled_up'][day.isoformat()] = rollup_day(day, funnels)
+            _record_rolled_up(day)
+    through = rolled_up_through()
+    report['rolled_up_through'] = through.isoformat() if through else None
+
+    if rollup_only or not config['ENABLED']:
+        return report
+
+    if ttl_enabled(config):
+        db = get_mongo_db()
+        if db is not None:
+            ensure_expiry_index(db)
+        shortest = min(d for d in (retention_days(t, config) for t in config['EVENT_TYPES']) if d is not None)
+        if through is None or datetime(through.year, through.month, through.day) < now - timedelta(days=shortest - 1):
+            logger.warning("Rollups are close to or behind the shortest TTL; raw events may expire un-rolled")
+
+    report['expired'] = expire_raw_events(now, through, config, dry_run=dry_run)
+    return report
+
+
+# Reading rollups -------------------------------------------------------------
+
+def heatmap_rollup_cells(url_pattern, heatmap_type, date_from, date_to):
+    """Sum rollup grid cells of URLs containing ``url_pattern`` for days in ``[date_from, date_to)``.
+
+    Returns a ``Counter`` of ``(row, col) -> count`` on the ``GRID_SIZE`` grid.
+    """
+    rollups = get_collection('rollups')
+    cells = Counter()
+    if rollups is None:
+        return cells
+    date_from = naive_utc(date_from)
+    cursor = rollups.find({
+        'kind': 'heatmap',
+        'heatmap_type': heatmap_type,
+        'url': {'$regex': re.escape(url_pattern)},
+        'day': {'$gte': datetime(date_from.year, date_from.month, date_from.day), '$lt': naive_utc(date_to)},
+    }, {'cells': 1})
+    for doc in cursor:
+        for row, col, count in doc['cells']:
+            cells[(row, col)] += count
+    return cells
+
+
+def raw_retention_start(event_type, now=None):
+    """Earliest time raw ``event_type`` events are still guaranteed to exist, or ``None``.
+
+    Aware when ``USE_TZ``, for ORM filters. Earlier days are read from rollups.
+    """
+    days = retention_days(event_type)
+    through = rolled_up_through()
+    if days is None or through is None:
+        return None
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    # Whole days only, and never beyond what the rollups cover
+    cutoff = datetime(cutoff.year, cutoff.month, cutoff.day) + timedelta(days=1)
+    return _orm_datetime(min(cutoff, datetime(through.year, through.month, through.day) + timedelta(days=1)))
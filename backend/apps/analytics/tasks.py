@@ -1,11 +1,17 @@
 """Celery tasks for the analytics app."""
 
+from collections import Counter
+
+import numpy as np
 from celery import shared_task
+from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 from datetime import timedelta
 
+from .batch import run_batch_analysis
 from .models import Heatmap, PathAnalysis, FunnelAnalysis, Funnel
-from apps.tracking.models import Event, Session
+from .retention import heatmap_rollup_cells, raw_retention_start, run_retention
+from apps.tracking.store import get_event_store
 
 @shared_task
 def generate_heatmap(heatmap_id):
@@ -19,32 +25,43 @@ def generate_heatmap(heatmap_id):
         
         event_type = 'mouse_click' if heatmap.heatmap_type == 'click' else 'mouse_move'
         
-        # Get events matching criteria
-        events = Event.objects.filter(
-            event_type=event_type,
-            timestamp__gte=heatmap.date_from,
-            timestamp__lte=heatmap.date_to,
-            url__contains=heatmap.url_pattern
-        )
-        
         # Process events to generate heatmap data
         grid_size = 10  # 10x10 pixels per cell
         cols = heatmap.resolution_width // grid_size
         rows = heatmap.resolution_height // grid_size
         
         # Initialize empty grid
-        grid = [[0 for _ in range(cols)] for _ in range(rows)]
-        
-        # Count events in each cell
-        for event in events:
-            if 'x' in event.data and 'y' in event.data:
-                x, y = event.data['x'], event.data['y']
-                
-                # Ensure coordinates are within bounds
-                if 0 <= x < heatmap.resolution_width and 0 <= y < heatmap.resolution_height:
-                    col = min(int(x // grid_size), cols - 1)
-                    row = min(int(y // grid_size), rows - 1)
-                    grid[row][col] += 1
+        grid = np.zeros((rows, cols), dtype=np.int64)
+        
+        # Những ngày mà dữ liệu thô đã hết hạn được lấy từ rollups
+        scan_from = heatmap.date_from
+        raw_start = raw_retention_start(event_type)
+        if raw_start is not None and heatmap.date_from < raw_start:
+            cells = heatmap_rollup_cells(
+                heatmap.url_pattern, heatmap.heatmap_type, heatmap.date_from, min(heatmap.date_to, raw_start)
+            )
+            for (row, col), count in cells.items():
+                if row < rows and col < cols:
+                    grid[row, col] += count
+            scan_from = raw_start
+        
+        # Count events in each cell, one columnar chunk at a time
+        for chunk in get_event_store().scan(
+            start=scan_from,
+            end=heatmap.date_to + timedelta(milliseconds=1),
+            event_types=[event_type],
+            url_contains=heatmap.url_pattern,
+            columns=('x', 'y', 'weight'),
+        ):
+            x, y = chunk['x'], chunk['y']
+            
+            # Ensure coordinates are within bounds (nan = no coordinates)
+            inside = (x >= 0) & (x < heatmap.resolution_width) & (y >= 0) & (y < heatmap.resolution_height)
+            col = np.minimum((x[inside] // grid_size).astype(np.int64), cols - 1)
+            row = np.minimum((y[inside] // grid_size).astype(np.int64), rows - 1)
+            np.add.at(grid, (row, col), chunk['weight'][inside])
+        
+        grid = grid.tolist()
         
         # Format data for visualization
         heatmap_data = {
@@ -81,36 +98,33 @@ def generate_path_analysis(path_analysis_id):
             return f"Path analysis {path_analysis_id} already processed"
         
         # Get sessions in the date range
-        sessions = Session.objects.filter(
-            start_time__gte=path_analysis.date_from,
-            start_time__lte=path_analysis.date_to
-        )
+        store = get_event_store()
+        session_ids = store.session_ids(path_analysis.date_from, path_analysis.date_to + timedelta(milliseconds=1))
         
-        # Get all page_view events for each session, ordered by timestamp
-        paths = {}
-        total_sessions = 0
+        # Page views of those sessions, in one timestamp-ordered scan (a session
+        # has no events before it starts)
+        session_pages = {}
+        for chunk in store.scan(
+            start=path_analysis.date_from,
+            event_types=['page_view'],
+            columns=('session_id', 'url'),
+        ):
+            for session_id, url in zip(chunk['session_id'].tolist(), chunk['url'].tolist()):
+                if session_id in session_ids:
+                    session_pages.setdefault(session_id, []).append(url)
         
-        for session in sessions:
-            events = Event.objects.filter(
-                session=session,
-                event_type='page_view'
-            ).order_by('timestamp')
-            
-            if events.exists():
-                total_sessions += 1
-                
-                # Extract path as sequence of URLs
-                path = [event.url for event in events]
-                path_key = ' -> '.join(path)
-                
-                # Count occurrences of each path
-                if path_key in paths:
-                    paths[path_key]['count'] += 1
-                else:
-                    paths[path_key] = {
-                        'path': path,
-                        'count': 1
-                    }
+        # Count occurrences of each path (sequence of URLs)
+        paths = {}
+        total_sessions = len(session_pages)
+        for path in session_pages.values():
+            path_key = ' -> '.join(path)
+            if path_key in paths:
+                paths[path_key]['count'] += 1
+            else:
+                paths[path_key] = {
+                    'path': path,
+                    'count': 1
+                }
         
         # Sort paths by count
         sorted_paths = sorted(paths.values(), key=lambda x: x['count'], reverse=True)
@@ -150,10 +164,20 @@ def generate_funnel_analysis(funnel_analysis_id):
             return f"Funnel {funnel.id} has no steps"
         
         # Get sessions that started within the analysis period
-        sessions = Session.objects.filter(
-            start_time__gte=funnel_analysis.date_from,
-            start_time__lte=funnel_analysis.date_to
-        )
+        store = get_event_store()
+        sessions = store.session_ids(funnel_analysis.date_from, funnel_analysis.date_to + timedelta(milliseconds=1))
+        
+        # URLs viewed by each of those sessions during the period, in one scan
+        session_urls = {}
+        for chunk in store.scan(
+            start=funnel_analysis.date_from,
+            end=funnel_analysis.date_to + timedelta(milliseconds=1),
+            event_types=['page_view'],
+            columns=('session_id', 'url'),
+        ):
+            for session_id, url in zip(chunk['session_id'].tolist(), chunk['url'].tolist()):
+                if session_id in sessions:
+                    session_urls.setdefault(session_id, set()).add(url)
         
         step_data = []
         step_counts = []
@@ -162,20 +186,10 @@ def generate_funnel_analysis(funnel_analysis_id):
         # Process each step
         for i, step in enumerate(steps):
             # Find sessions that visited this step's URL
-            current_sessions = set()
-            
-            for session in sessions:
-                # Check if session had a page_view event for this URL pattern
-                has_view = Event.objects.filter(
-                    session=session,
-                    event_type='page_view',
-                    url__contains=step.url_pattern,
-                    timestamp__gte=funnel_analysis.date_from,
-                    timestamp__lte=funnel_analysis.date_to
-                ).exists()
-                
-                if has_view:
-                    current_sessions.add(session.session_id)
+            current_sessions = {
+                session_id for session_id, urls in session_urls.items()
+                if any(step.url_pattern in url for url in urls)
+            }
             
             # Calculate conversion rate
             total_count = len(current_sessions)
@@ -230,14 +244,17 @@ def generate_daily_analytics():
     date_to = timezone.datetime.combine(yesterday, timezone.time.max)
     
     # Create heatmaps for popular URLs
-    popular_urls = Event.objects.filter(
-        event_type='page_view',
-        timestamp__gte=date_from,
-        timestamp__lte=date_to
-    ).values('url').annotate(count=Count('id')).order_by('-count')[:5]
+    url_counts = Counter()
+    for chunk in get_event_store().scan(
+        start=date_from,
+        end=date_to + timedelta(milliseconds=1),
+        event_types=['page_view'],
+        columns=('url',),
+    ):
+        url_counts.update(chunk['url'].tolist())
+    popular_urls = [url for url, _ in url_counts.most_common(5)]
     
-    for url_data in popular_urls:
-        url = url_data['url']
+    for url in popular_urls:
         
         # Create click heatmap
         click_heatmap = Heatmap.objects.create(
@@ -276,4 +293,22 @@ def generate_daily_analytics():
         )
         generate_funnel_analysis.delay(funnel_analysis.id)
     
-    return "Daily analytics generation scheduled" 
\ No newline at end of file
+    return "Daily analytics generation scheduled"
+
+@shared_task
+def apply_retention():
+    """Roll up closed days, then expire raw events past their retention."""
+    report = run_retention()
+    return f"Rolled up {len(report['rolled_up'])} day(s) through {report['rolled_up_through']}"
+
+@shared_task
+def generate_batch_analysis(kind, object_id, path=None, force=False):
+    """Compute a heatmap, path or funnel analysis from archived event files (apps.analytics.batch)."""
+    try:
+        if run_batch_analysis(kind, object_id, path=path, force=force) is None:
+            return f"{kind} analysis {object_id} already processed"
+        return f"{kind} analysis {object_id} processed from the archive"
+    except ObjectDoesNotExist:
+        return f"{kind} analysis {object_id} not found"
+    except Exception as e:
+        return f"Error processing {kind} analysis {object_id} from the archive: {str(e)}"
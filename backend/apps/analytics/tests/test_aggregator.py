@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from apps.analytics.aggregator import STATE_ID, IncrementalAggregator, run_aggregator
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+START = datetime(2026, 10, 18, 12, 0, 0)
+
+
+def event(event_type, seconds, url='/a', **data):
+    return {'session_id': SESSION, 'event_type': event_type, 'url': url,
+            'timestamp': START + timedelta(seconds=seconds), 'data': data}
+
+
+class ListSource:
+    """Change stream stand-in: one batch per poll, the batch index as resume token."""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.resume_token = None
+
+    def poll(self, max_documents):
+        if not self.batches:
+            return []
+        self.resume_token = (self.resume_token or 0) + 1
+        return self.batches.pop(0)
+
+    def checkpoint(self, state):
+        state['resume_token'] = self.resume_token
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def aggregates(mongo):
+    return mongo['aggregates']
+
+
+def test_operations_fold_events_into_upserts(aggregates):
+    aggregator = IncrementalAggregator(aggregates)
+    for doc in (event('page_view', 0, '/a'), event('mouse_click', 1, '/a', x=25, y=45),
+                event('mouse_click', 2, '/a', x=5000, y=5), event('page_view', 3, '/b')):
+        aggregator.add(doc)
+
+    operations = {operation._filter['_id']: operation._doc for operation in aggregator.operations(now=START)}
+
+    assert set(operations) == {'heatmap:click:/a', f'session:{SESSION}', 'transition:/a\t/b'}
+    # x beyond the heatmap resolution is counted for the session, not the heatmap
+    assert operations['heatmap:click:/a']['$inc'] == {'cells.4_2': 1, 'total_events': 1}
+    session = operations[f'session:{SESSION}']
+    assert session['$inc'] == {'events': 4, 'page_views': 2, 'event_counts.page_view': 2,
+                               'event_counts.mouse_click': 2}
+    assert session['$min'] == {'first_seen': START} and session['$max'] == {'last_seen': START + timedelta(seconds=3)}
+    assert session['$set'] == {'last_page': '/b', 'last_page_at': START + timedelta(seconds=3)}
+    assert operations['transition:/a\t/b']['$inc'] == {'count': 1}
+
+
+def test_transitions_continue_across_flushes(aggregates):
+    aggregator = IncrementalAggregator(aggregates)
+    aggregator.add(event('page_view', 0, '/a'))
+    aggregator.flush()
+
+    # A fresh aggregator reads the last page back from the session document
+    aggregator = IncrementalAggregator(aggregates)
+    aggregator.add(event('page_view', 5, '/b'))
+    aggregator.add(event('page_view', -5, '/late'))
+    aggregator.flush()
+
+    transitions = [doc for doc in aggregates.docs if doc.get('kind') == 'transition']
+    assert [(doc['source'], doc['target'], doc['count']) for doc in transitions] == [('/a', '/b', 1)]
+    assert aggregates.find_one({'_id': f'session:{SESSION}'})['page_views'] == 3
+
+
+def test_flush_writes_state_with_the_increments(aggregates):
+    aggregator = IncrementalAggregator(aggregates)
+    aggregator.add(event('mouse_click', 0, x=1, y=1))
+
+    assert aggregator.flush({'resume_token': 'token-1'}) == 1
+    assert aggregates.bulk_writes == 1
+    assert aggregator.load_state()['resume_token'] == 'token-1'
+
+
+def test_failed_flush_keeps_previous_state_and_counts(aggregates, monkeypatch):
+    aggregator = IncrementalAggregator(aggregates)
+    aggregator.add(event('mouse_click', 0, x=1, y=1))
+    aggregator.flush({'resume_token': 'token-1'})
+
+    aggregator.add(event('mouse_click', 1, x=1, y=1))
+    write = aggregates.bulk_write
+
+    def crash(requests, ordered=True, session=None):
+        write(requests, ordered, session)
+        raise RuntimeError('connection lost')
+
+    monkeypatch.setattr(aggregates, 'bulk_write', crash)
+    with pytest.raises(RuntimeError):
+        aggregator.flush({'resume_token': 'token-2'})
+
+    assert aggregator.load_state()['resume_token'] == 'token-1'
+    assert aggregates.find_one({'_id': f'session:{SESSION}'})['events'] == 1
+
+
+def test_run_aggregator_resumes_from_stored_token(aggregates):
+    batches = [[event('page_view', 0, '/a')], [event('page_view', 1, '/b'), event('page_view', 2, '/c')]]
+    source = ListSource(batches)
+
+    assert run_aggregator(IncrementalAggregator(aggregates), source, 1, 0, idle_exit=True) == 3
+    state = aggregates.find_one({'_id': STATE_ID})
+    assert state['resume_token'] == 2
+    assert sorted(doc['count'] for doc in aggregates.docs if doc.get('kind') == 'transition') == [1, 1]
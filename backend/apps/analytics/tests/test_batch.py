@@ -0,0 +1,86 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from apps.analytics.batch import BatchEngine, discover_partitions  # noqa: E402
+from apps.tracking.archive import ArchiveWriter, run_archiver  # noqa: E402
+
+DAY = datetime(2026, 10, 18)
+
+
+def doc(session_id, event_type, minutes, url='http://localhost:3000/', **data):
+    return {'session_id': session_id, 'event_type': event_type, 'url': url,
+            'timestamp': DAY + timedelta(minutes=minutes), 'data': data}
+
+
+EVENTS = [
+    doc('a', 'page_view', 0, title='Home'),
+    doc('a', 'mouse_click', 1, x=15, y=25),
+    {**doc('a', 'mouse_move', 2, x=15.4, y=25), 'weight': 3},
+    doc('a', 'page_view', 3, url='http://localhost:3000/pricing'),
+    doc('b', 'page_view', 5),
+    doc('b', 'mouse_click', 6, x=15, y=25),
+    # An aware timestamp is archived in UTC: 2026-10-18 23:10
+    {**doc('b', 'page_view', 0, url='http://localhost:3000/pricing'),
+     'timestamp': datetime(2026, 10, 19, 1, 10, tzinfo=timezone(timedelta(hours=2)))},
+]
+
+
+class ListSource:
+    name = 'list'
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+        self.position = 0
+        self.closed = False
+
+    def poll(self, max_documents):
+        documents = self.documents[self.position:self.position + max_documents]
+        self.position += len(documents)
+        return documents
+
+    def checkpoint(self, state):
+        state['position'] = self.position
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def archive(tmp_path):
+    writer = ArchiveWriter(tmp_path)
+    source = ListSource(EVENTS + [{'session_id': 'c', 'event_type': 'page_view'}])
+    assert run_archiver(writer, source, flush_rows=4, flush_seconds=60, idle_exit=True) == len(EVENTS)
+    assert source.closed and writer.skipped == 1
+    return tmp_path
+
+
+def test_archive_is_partitioned_by_day_and_type(archive):
+    partitions = discover_partitions(str(archive))
+
+    assert {(day.isoformat(), event_type) for _, _, day, event_type in partitions} == {
+        ('2026-10-18', 'page_view'), ('2026-10-18', 'mouse_click'), ('2026-10-18', 'mouse_move'),
+    }
+    assert all(file_format == 'parquet' for _, file_format, _, _ in partitions)
+    assert json.loads((archive / '_archive_state.json').read_text()) == {'position': len(EVENTS) + 1}
+
+
+def test_batch_heatmap_reads_the_archive(archive):
+    engine = BatchEngine(archive, workers=1)
+
+    clicks = engine.heatmap('localhost', 'click', DAY, DAY + timedelta(days=1))
+    moves = engine.heatmap('', 'move', DAY, DAY + timedelta(days=1))
+
+    assert clicks['grid'][2][1] == 2 and clicks['total_events'] == 2
+    assert moves['grid'][2][1] == 3 and moves['total_events'] == 3
+    assert engine.heatmap('', 'click', DAY + timedelta(days=2), DAY + timedelta(days=3))['total_events'] == 0
+
+
+def test_batch_path_analysis_reads_the_archive(archive):
+    data = BatchEngine(archive, workers=1).path_analysis(DAY, DAY + timedelta(hours=12))
+
+    assert data['total_sessions'] == 2
+    assert data['paths'] == [{'path': ['http://localhost:3000/', 'http://localhost:3000/pricing'], 'count': 2}]
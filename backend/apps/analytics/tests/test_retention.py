@@ -0,0 +1,23 @@
+from datetime import date, datetime
+
+import pytest
+
+from apps.analytics.retention import STATE_ID, pending_days, run_retention
+
+
+@pytest.fixture
+def rolled_up(mongo):
+    mongo['rollups'].docs.append({'_id': STATE_ID, 'through': datetime(2026, 10, 16)})
+    return mongo['rollups']
+
+
+def test_days_are_rolled_up_only_after_the_delay(rolled_up):
+    assert pending_days(datetime(2026, 10, 18, 0, 30), delay_seconds=3600) == []
+    assert pending_days(datetime(2026, 10, 18, 1, 30), delay_seconds=3600) == [date(2026, 10, 17)]
+
+
+def test_run_retention_leaves_the_last_day_open_for_late_inserts(rolled_up, settings):
+    settings.TRACKING_RETENTION = {**settings.TRACKING_RETENTION, 'ROLLUP_DELAY_SECONDS': 3600}
+    report = run_retention(now=datetime(2026, 10, 18, 0, 5), rollup_only=True)
+
+    assert report['rolled_up'] == {} and report['rolled_up_through'] == '2026-10-16'
@@ -0,0 +1,34 @@
+import pytest
+from django.urls import resolve, reverse
+
+from apps.analytics import views
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+
+
+@pytest.mark.parametrize('path, view', [
+    ('/api/analytics/live/heatmap/', views.live_heatmap),
+    ('/api/analytics/live/sessions/', views.live_sessions),
+    (f'/api/analytics/live/sessions/{SESSION}/', views.live_sessions),
+    ('/api/analytics/live/transitions/', views.live_transitions),
+    (f'/api/analytics/sessions/{SESSION}/mouse-analytics/', views.session_mouse_analytics),
+])
+def test_analytics_routes_resolve(path, view):
+    assert resolve(path).func is view
+
+
+def test_viewset_routes_resolve():
+    assert reverse('live-heatmap') == '/api/analytics/live/heatmap/'
+    assert resolve('/api/analytics/heatmaps/1/generate/').url_name == 'heatmap-generate'
+    assert resolve('/api/analytics/mouse-positions/').url_name == 'mouse-positions'
+
+
+def test_live_heatmap_reads_aggregates(client, mongo):
+    mongo['aggregates'].docs.append({'_id': 'heatmap:click:/a', 'kind': 'heatmap', 'heatmap_type': 'click',
+                                     'url': '/a', 'cells': {'0_1': 3}})
+
+    response = client.get('/api/analytics/live/heatmap/', {'type': 'click'})
+
+    assert response.status_code == 200
+    assert response.json()['total_events'] == 3
+    assert client.get('/api/analytics/live/heatmap/', {'type': 'scroll'}).status_code == 400
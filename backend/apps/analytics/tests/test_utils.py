@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import numpy as np
+
+from apps.analytics.utils import MOUSE_COLUMNS, chunk_frame, process_mouse_positions
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+TARGET = {'tagName': 'BUTTON', 'id': 'buy', 'className': 'btn', 'rect': {'top': 1, 'left': 2, 'width': 3, 'height': 4}}
+
+
+def test_process_mouse_positions_matches_chunk_frame():
+    events = [
+        {'session_id': SESSION, 'event_type': 'mouse_click', 'timestamp': datetime(2026, 10, 18, 12, 0, 2),
+         'url': '/a', 'data': {'x': 5, 'y': 6, 'button': 0, 'target': TARGET}},
+        {'session_id': SESSION, 'event_type': 'mouse_move', 'timestamp': datetime(2026, 10, 18, 12, 0, 1),
+         'url': '/a', 'data': '{"x": 1, "y": 2}', 'weight': 3},
+        {'session_id': SESSION, 'event_type': 'mouse_move', 'timestamp': datetime(2026, 10, 18, 12, 0, 3),
+         'url': '/a', 'data': {'x': 'left', 'y': 2}},
+        {'session_id': SESSION, 'event_type': 'page_view', 'timestamp': datetime(2026, 10, 18, 12), 'data': {}},
+    ]
+    df = process_mouse_positions(events)
+
+    assert list(df['event_type']) == ['mouse_move', 'mouse_click']
+    assert list(df['weight']) == [3.0, 1.0]
+    click = df.iloc[1]
+    assert click['button'] == 0 and click['target_id'] == 'buy' and click['target_height'] == 4
+    assert df['target_tag'].isna().iloc[0]
+
+
+def test_chunk_frame_without_data_column():
+    chunk = {
+        'timestamp': np.array(['2026-10-18T12:00:01', '2026-10-18T12:00:00'], dtype='datetime64[ms]'),
+        'session_id': np.array([SESSION, SESSION], dtype=object),
+        'event_type': np.array(['mouse_move', 'page_view'], dtype=object),
+        'x': np.array([1.0, np.nan]),
+        'y': np.array([2.0, np.nan]),
+        'url': np.array(['/a', '/a'], dtype=object),
+        'weight': np.array([1, 1], dtype=np.int32),
+    }
+    df = chunk_frame(chunk)
+
+    assert len(df) == 1 and 'button' not in df.columns
+    page_views = {**chunk, 'event_type': np.array(['page_view'] * 2, dtype=object)}
+    assert chunk_frame(page_views).columns.tolist() == MOUSE_COLUMNS
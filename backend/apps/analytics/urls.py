@@ -13,9 +13,14 @@ router.register(r'funnel-analysis', views.FunnelAnalysisViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('generate-heatmap/', views.generate_heatmap, name='generate-heatmap'),
     
     # Thêm URLs cho phân tích chuột
     path('mouse-positions/', views.MousePositionAnalyticsView.as_view(), name='mouse-positions'),
     path('sessions/<uuid:session_id>/mouse-analytics/', views.session_mouse_analytics, name='session-mouse-analytics'),
+    
+    # Aggregate tức thời từ change stream (manage.py aggregate_events)
+    path('live/heatmap/', views.live_heatmap, name='live-heatmap'),
+    path('live/sessions/', views.live_sessions, name='live-sessions'),
+    path('live/sessions/<uuid:session_id>/', views.live_sessions, name='live-session'),
+    path('live/transitions/', views.live_transitions, name='live-transitions'),
 ] 
\ No newline at end of file
@@ -8,6 +8,12 @@ import pandas as pd
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Tuple
 
+MOUSE_COLUMNS = [
+    'timestamp', 'session_id', 'event_type', 'x', 'y', 
+    'button', 'url', 'target_tag', 'target_id', 'target_class',
+    'target_top', 'target_left', 'target_width', 'target_height', 'weight'
+]
+
 def process_mouse_positions(events: List[Dict]) -> pd.DataFrame:
     """
     Process mouse position events and convert to a DataFrame
@@ -19,8 +25,8 @@ def process_mouse_positions(events: List[Dict]) -> pd.DataFrame:
     Returns:
         DataFrame with processed mouse position data
     """
-    mouse_events = []
-    
+    rows = []
+    datas = []
     for event in events:
         # Chỉ xử lý các sự kiện liên quan đến chuột
         if event['event_type'] not in ('mouse_move', 'mouse_click'):
@@ -39,62 +45,76 @@ def process_mouse_positions(events: List[Dict]) -> pd.DataFrame:
         # Chỉ xử lý nếu có tọa độ x, y
         if 'x' not in data or 'y' not in data:
             continue
-            
-        # Tạo entry mới
-        entry = {
-            'timestamp': event.get('timestamp'),
-            'session_id': event.get('session_id'),
-            'event_type': event.get('event_type'),
-            'x': data.get('x'),
-            'y': data.get('y'),
-            'url': event.get('url', ''),
-        }
-        
-        # Thêm button cho mouse_click
-        if event['event_type'] == 'mouse_click':
-            entry['button'] = data.get('button')
-            
-        # Thêm thông tin target nếu có
-        target = data.get('target', {})
-        if target:
-            entry['target_tag'] = target.get('tagName')
-            entry['target_id'] = target.get('id')
-            entry['target_class'] = target.get('className')
-            
-            # Lấy thông tin rectangle nếu có
-            rect = target.get('rect', {})
-            if rect:
-                entry['target_top'] = rect.get('top')
-                entry['target_left'] = rect.get('left')
-                entry['target_width'] = rect.get('width')
-                entry['target_height'] = rect.get('height')
-        
-        mouse_events.append(entry)
+        rows.append(event)
+        datas.append(data)
     
-    # Tạo DataFrame từ dữ liệu đã xử lý
-    if not mouse_events:
+    if not rows:
         # Trả về DataFrame rỗng với các cột cần thiết
-        return pd.DataFrame(columns=[
-            'timestamp', 'session_id', 'event_type', 'x', 'y', 
-            'button', 'url', 'target_tag', 'target_id', 'target_class',
-            'target_top', 'target_left', 'target_width', 'target_height'
-        ])
-    
-    df = pd.DataFrame(mouse_events)
-    
-    # Chuyển đổi timestamp thành datetime
-    if 'timestamp' in df.columns:
-        if df['timestamp'].dtype == object:
-            # Nếu timestamp là string
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        elif pd.api.types.is_numeric_dtype(df['timestamp']):
-            # Nếu timestamp là milliseconds
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return pd.DataFrame(columns=MOUSE_COLUMNS)
     
+    # Đưa về dạng cột như một chunk của event store, rồi dùng chung chunk_frame
+    data_column = np.empty(len(datas), dtype=object)
+    data_column[:] = datas
+    return chunk_frame({
+        'timestamp': _parse_timestamps([event.get('timestamp') for event in rows]),
+        'session_id': np.array([event.get('session_id') for event in rows], dtype=object),
+        'event_type': np.array([event['event_type'] for event in rows], dtype=object),
+        'x': pd.to_numeric(pd.Series([data['x'] for data in datas]), errors='coerce').to_numpy(np.float64),
+        'y': pd.to_numeric(pd.Series([data['y'] for data in datas]), errors='coerce').to_numpy(np.float64),
+        'url': np.array([event.get('url', '') for event in rows], dtype=object),
+        'weight': np.array([event.get('weight') or 1 for event in rows], dtype=np.float64),
+        'data': data_column,
+    })
+
+def _parse_timestamps(values: List[Any]) -> np.ndarray:
+    """Timestamps as ``datetime64``, whether stored as datetimes, strings or epoch milliseconds."""
+    timestamps = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(timestamps):
+        # Nếu timestamp là milliseconds
+        return pd.to_datetime(timestamps, unit='ms').to_numpy()
+    # Nếu timestamp là string hoặc datetime
+    return pd.to_datetime(timestamps).to_numpy()
+
+def chunk_frame(chunk: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    Build a ``process_mouse_positions``-style DataFrame from a columnar
+    event-store chunk (apps.tracking.store); ``button``/``target_*`` come
+    from the ``data`` column when the chunk has one.
+    """
+    keep = np.isin(chunk['event_type'], ['mouse_move', 'mouse_click']) \
+        & ~np.isnan(chunk['x']) & ~np.isnan(chunk['y'])
+    if not keep.any():
+        return pd.DataFrame(columns=MOUSE_COLUMNS)
+    df = pd.DataFrame({
+        'timestamp': chunk['timestamp'][keep],
+        'session_id': chunk['session_id'][keep],
+        'event_type': chunk['event_type'][keep],
+        'x': chunk['x'][keep],
+        'y': chunk['y'][keep],
+        'url': chunk['url'][keep],
+        'weight': chunk['weight'][keep].astype(np.float64),
+    })
+    if 'data' in chunk:
+        datas = [d if isinstance(d, dict) else {} for d in chunk['data'][keep]]
+        # Thêm button cho mouse_click
+        if 'mouse_click' in df['event_type'].values:
+            df['button'] = [
+                d.get('button') if t == 'mouse_click' else None for d, t in zip(datas, df['event_type'])
+            ]
+        # Thêm thông tin target (và rectangle) nếu có
+        targets = [d.get('target') or {} for d in datas]
+        if any(targets):
+            df['target_tag'] = [t.get('tagName') for t in targets]
+            df['target_id'] = [t.get('id') for t in targets]
+            df['target_class'] = [t.get('className') for t in targets]
+            rects = [t.get('rect') or {} for t in targets]
+            if any(rects):
+                df['target_top'] = [r.get('top') for r in rects]
+                df['target_left'] = [r.get('left') for r in rects]
+                df['target_width'] = [r.get('width') for r in rects]
+                df['target_height'] = [r.get('height') for r in rects]
     # Sắp xếp theo timestamp
-    df = df.sort_values('timestamp')
-    
-    return df
+    return df.sort_values('timestamp', kind='stable')
 
 def calculate_mouse_metrics(df: pd.DataFrame) -> Dict[str, Any]:
     """
@@ -142,7 +162,8 @@ def calculate_mouse_metrics(df: pd.DataFrame) -> Dict[str, Any]:
                     df['x'], df['y'], 
                     bins=[x_bins, y_bins],
                     range=[[metrics['min_x'], metrics['max_x']], 
-                           [metrics['min_y'], metrics['max_y']]]
+                           [metrics['min_y'], metrics['max_y']]],
+                    weights=df['weight'].fillna(1) if 'weight' in df.columns else None
                 )
                 
                 # Chuyển đổi thành danh sách để serialize
@@ -313,9 +334,10 @@ def generate_cursor_heatmap(df: pd.DataFrame, width: int = 1000, height: int = 8
         # Tạo heatmap
         heatmap_data = np.zeros((height, width))
         
-        # Đếm số lần xuất hiện của mỗi tọa độ
-        for x, y in zip(x_normalized, y_normalized):
-            heatmap_data[y, x] += 1
+        # Đếm số lần xuất hiện của mỗi tọa độ; điểm mouse_move đã được
+        # giản lược khi ingest mang ``weight`` = số điểm gốc mà nó đại diện
+        weights = df['weight'].fillna(1).to_numpy() if 'weight' in df.columns else 1
+        np.add.at(heatmap_data, (y_normalized.to_numpy(), x_normalized.to_numpy()), weights)
         
         # Làm mịn heatmap bằng Gaussian blur
         from scipy.ndimage import gaussian_filter
@@ -2,22 +2,24 @@
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, renderer_classes
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.utils import timezone
 from django.db.models import Count
 from rest_framework.views import APIView
 
+from . import aggregator
 from .models import Heatmap, PathAnalysis, Funnel, FunnelStep, FunnelAnalysis
 from .serializers import (
     HeatmapSerializer, PathAnalysisSerializer, FunnelSerializer, 
     FunnelStepSerializer, FunnelAnalysisSerializer, FunnelWithStepsSerializer
 )
-from apps.tracking.models import Event, Session
-from utils.mongo_client import get_collection
+from apps.tracking.models import Session
+from apps.tracking.store import POSITIONAL_EVENT_TYPES, concat_chunks, get_event_store
+from utils import fastjson
 from .utils import (
-    process_mouse_positions, 
+    chunk_frame,
     calculate_mouse_metrics, 
     analyze_cursor_path,
     generate_cursor_heatmap
@@ -94,63 +96,32 @@ class FunnelAnalysisViewSet(viewsets.ModelViewSet):
         return Response({'status': 'processing started'})
 
 @api_view(['GET'])
+@renderer_classes(fastjson.RENDERER_CLASSES)
 def session_mouse_analytics(request, session_id):
     """
     Endpoint để phân tích dữ liệu vị trí chuột cho một session cụ thể
     """
     try:
         # Kiểm tra session tồn tại
-        try:
-            session = Session.objects.get(session_id=session_id)
-        except Session.DoesNotExist:
+        if not Session.objects.filter(session_id=session_id).exists():
             return Response(
                 {"error": f"Session with ID {session_id} not found"}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Lấy dữ liệu từ SQLite
-        events = Event.objects.filter(
-            session=session, 
-            event_type__in=['mouse_move', 'mouse_click']
-        ).values('id', 'event_type', 'timestamp', 'url', 'data')
-        
-        # Chuyển đổi queryset thành list để xử lý
-        events_list = list(events)
-        
-        # Bổ sung dữ liệu từ MongoDB nếu có
-        try:
-            mongo_events_collection = get_collection('events')
-            if mongo_events_collection is not None:
-                mongo_events = list(mongo_events_collection.find(
-                    {'session_id': str(session_id), 'event_type': {'$in': ['mouse_move', 'mouse_click']}}
-                ))
-                
-                # Thêm vào events_list, tránh trùng lặp dựa trên ID
-                sqlite_ids = set(e['id'] for e in events_list)
-                for mongo_event in mongo_events:
-                    event_id = mongo_event.get('event_id')
-                    if event_id and int(event_id) not in sqlite_ids:
-                        events_list.append({
-                            'id': event_id,
-                            'event_type': mongo_event.get('event_type'),
-                            'timestamp': mongo_event.get('timestamp'),
-                            'url': mongo_event.get('url'),
-                            'data': mongo_event.get('data'),
-                            'source': 'mongodb'
-                        })
-        except Exception as e:
-            # Log lỗi nhưng vẫn tiếp tục với dữ liệu từ SQLite
-            print(f"Error fetching MongoDB data: {str(e)}")
+        # Lấy dữ liệu chuột của session từ event store (một store, một index)
+        chunk = get_event_store().read_session(session_id, event_types=POSITIONAL_EVENT_TYPES)
+        events_count = len(chunk['timestamp'])
         
         # Không có dữ liệu
-        if not events_list:
+        if not events_count:
             return Response(
                 {"message": "No mouse events found for this session"},
                 status=status.HTTP_200_OK
             )
         
         # Xử lý dữ liệu vị trí chuột
-        df = process_mouse_positions(events_list)
+        df = chunk_frame(chunk)
         
         # Tính toán các chỉ số phân tích
         metrics = calculate_mouse_metrics(df)
@@ -162,7 +133,7 @@ def session_mouse_analytics(request, session_id):
         # Trả về kết quả
         result = {
             'session_id': str(session_id),
-            'events_count': len(events_list),
+            'events_count': events_count,
             'metrics': metrics,
             'patterns': patterns,
             'heatmap': heatmap
@@ -180,6 +151,7 @@ class MousePositionAnalyticsView(APIView):
     """
     API view for mouse position analytics
     """
+    renderer_classes = fastjson.RENDERER_CLASSES
     
     def get(self, request, format=None):
         """
@@ -201,21 +173,13 @@ class MousePositionAnalyticsView(APIView):
             else:
                 time_filter = None
             
-            # Query events
-            events_query = Event.objects.filter(
-                event_type__in=['mouse_move', 'mouse_click']
-            )
-            
-            if time_filter:
-                events_query = events_query.filter(timestamp__gte=time_filter)
-            
-            events_query = events_query.order_by('-timestamp')[:limit]
-            
-            # Chuyển đổi queryset thành list
-            events_list = list(events_query.values('id', 'event_type', 'timestamp', 'url', 'session_id', 'data'))
+            # Các event mới nhất, đọc dạng cột từ event store
+            chunk = concat_chunks(get_event_store().scan(
+                start=time_filter, event_types=POSITIONAL_EVENT_TYPES, descending=True, limit=limit
+            ))
             
             # Xử lý dữ liệu
-            df = process_mouse_positions(events_list)
+            df = chunk_frame(chunk)
             
             # Tính toán số liệu
             metrics = calculate_mouse_metrics(df)
@@ -237,4 +201,67 @@ class MousePositionAnalyticsView(APIView):
             return Response(
                 {"error": f"Error analyzing mouse data: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            ) 
\ No newline at end of file
+            ) 
+
+def _limit(request, default=50, maximum=1000):
+    try:
+        return max(1, min(int(request.query_params.get('limit', default)), maximum))
+    except ValueError:
+        return default
+
+@api_view(['GET'])
+@renderer_classes(fastjson.RENDERER_CLASSES)
+def live_heatmap(request):
+    """
+    Heatmap tức thời từ các aggregate do `aggregate_events` cập nhật
+    (không quét lại event thô). Query: url (chuỗi con), type = click | move
+    """
+    heatmap_type = request.query_params.get('type', 'click')
+    if heatmap_type not in ('click', 'move'):
+        return Response({"error": "type must be 'click' or 'move'"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        data = aggregator.live_heatmap(request.query_params.get('url', ''), heatmap_type)
+        return Response(data, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": f"Error reading aggregates: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['GET'])
+@renderer_classes(fastjson.RENDERER_CLASSES)
+def live_sessions(request, session_id=None):
+    """
+    Tóm tắt session từ aggregate: một session theo ID, hoặc các session
+    hoạt động gần nhất (query: limit)
+    """
+    try:
+        if session_id is None:
+            return Response(aggregator.recent_sessions(_limit(request)), status=status.HTTP_200_OK)
+        summary = aggregator.session_summary(session_id)
+        if summary is None:
+            return Response(
+                {"error": f"No aggregates for session {session_id}"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(summary, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": f"Error reading aggregates: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['GET'])
+@renderer_classes(fastjson.RENDERER_CLASSES)
+def live_transitions(request):
+    """
+    Các chuyển trang phổ biến nhất (query: source = URL nguồn, limit)
+    """
+    try:
+        transitions = aggregator.top_transitions(request.query_params.get('source'), _limit(request))
+        return Response(transitions, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {"error": f"Error reading aggregates: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
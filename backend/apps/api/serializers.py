@@ -2,12 +2,31 @@
 
 from rest_framework import serializers
 from apps.tracking.models import Session, Event
+from apps.tracking.schemas import SchemaError, clean_data
 
 class EventSerializer(serializers.ModelSerializer):
     """Serializer for Event model."""
     class Meta:
         model = Event
         fields = ['id', 'session', 'event_type', 'timestamp', 'url', 'data']
+    
+    def validate(self, attrs):
+        """Check ``data`` against the event type's schema and coerce coordinates."""
+        event_type = attrs.get('event_type', getattr(self.instance, 'event_type', None))
+        if 'data' in attrs or self.instance is None:
+            try:
+                attrs['data'] = clean_data(event_type, attrs.get('data'))
+            except SchemaError as e:
+                raise serializers.ValidationError({'data': str(e)})
+        return attrs
+
+class EventBatchSerializer(EventSerializer):
+    """``EventSerializer`` for list payloads.
+
+    ``session`` is only parsed here; the batch writer checks all sessions
+    of the batch with one query instead of one lookup per row.
+    """
+    session = serializers.UUIDField()
 
 class SessionSerializer(serializers.ModelSerializer):
     """Serializer for Session model."""
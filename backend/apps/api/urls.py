@@ -15,4 +15,6 @@ urlpatterns = [
     path('auth/', include('rest_framework.urls')),
     # Add tracking URLs
     path('tracking/', include('apps.tracking.urls')),
+    # Add analytics URLs
+    path('analytics/', include('apps.analytics.urls')),
 ] 
\ No newline at end of file
@@ -3,12 +3,14 @@
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 
+from apps.tracking.bulk import UnknownSessions, bulk_create_events
 from apps.tracking.models import Session, Event
-from .serializers import SessionSerializer, EventSerializer, SessionDetailSerializer
+from .serializers import SessionSerializer, EventSerializer, EventBatchSerializer, SessionDetailSerializer
 
 class EventViewSet(viewsets.ModelViewSet):
     """ViewSet for Event model."""
@@ -24,10 +26,16 @@ class EventViewSet(viewsets.ModelViewSet):
         """Handle single and batch event creation."""
         # Batch insert to optimize performance
         if isinstance(request.data, list):
-            serializer = self.get_serializer(data=request.data, many=True)
+            serializer = EventBatchSerializer(data=request.data, many=True)
             serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-            return Response(serializer.data, status=201)
+            try:
+                events = bulk_create_events([
+                    {**attrs, 'session_id': attrs['session']} for attrs in serializer.validated_data
+                ])
+            except UnknownSessions as e:
+                raise ValidationError({'session': [f"Invalid pk \"{session_id}\" - object does not exist."
+                                                   for session_id in e.session_ids]})
+            return Response(EventSerializer(events, many=True).data, status=201)
         return super().create(request, *args, **kwargs)
 
 class SessionViewSet(viewsets.ModelViewSet):
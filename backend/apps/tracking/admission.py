@@ -0,0 +1,238 @@
+"""Token-bucket admission control with priority-aware load shedding.
+
+Every valid event offered to :func:`.ingestion.ingest_events` draws a token from
+the bucket of its session (``SESSION_RATE`` events/s, up to
+``SESSION_BURST``) and from the bucket of the client IP (``IP_RATE`` /
+``IP_BURST``). Within a request, events are admitted by priority: the
+protected types (``page_view``, ``mouse_click``, ``form_input`` and their
+aliases) are always kept, ``mouse_move`` is admitted last, so when a bucket
+runs dry the cursor stream is what gets dropped.
+
+Independently of the buckets, the controller looks at system pressure (the
+highest fill ratio reported by the sources registered with
+:func:`register_pressure_source`, e.g. the write-behind buffer or the Kafka
+producer queue): at
+``SHED_MOVES_AT`` every ``mouse_move`` is shed, at ``SHED_OTHERS_AT``
+everything but the protected types is.
+
+Buckets live in this process only (limits apply per worker) and are kept in
+an LRU bounded by ``MAX_BUCKETS``.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .broker import get_broker_settings, get_broker_stats
+from .buffer import get_buffer_stats
+from .schemas import EVENT_TYPE_ALIASES
+
+ADMISSION_DEFAULTS = {
+    'ENABLED': True,
+    'SESSION_RATE': 50,
+    'SESSION_BURST': 500,
+    'IP_RATE': 200,
+    'IP_BURST': 2000,
+    'MAX_BUCKETS': 100000,
+    'PROTECTED_EVENT_TYPES': ['page_view', 'mouse_click', 'form_input'],
+    'SHED_FIRST_EVENT_TYPES': ['mouse_move'],
+    'SHED_MOVES_AT': 0.75,
+    'SHED_OTHERS_AT': 0.95,
+    'STATUS': 429,
+    'RETRY_AFTER': 1,
+}
+
+# Admission order within a request; higher values are shed first.
+PROTECTED, NORMAL, SHED_FIRST = 0, 1, 2
+
+SHED_SESSION_RATE = 'session_rate'
+SHED_IP_RATE = 'ip_rate'
+SHED_PRESSURE = 'pressure'
+
+
+def get_admission_settings():
+    return {**ADMISSION_DEFAULTS, **getattr(settings, 'TRACKING_ADMISSION', {})}
+
+
+class AdmissionStats:
+    """Counters for admitted and shed events (per reason and per event type)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.shed_by_reason = {}
+        self.shed_by_event_type = {}
+        self.pressure = 0.0
+
+    def record(self, admitted, shed, pressure):
+        """``shed`` is a list of ``(event_type, reason)`` pairs."""
+        with self._lock:
+            self.admitted += admitted
+            self.pressure = pressure
+            for event_type, reason in shed:
+                self.shed_by_reason[reason] = self.shed_by_reason.get(reason, 0) + 1
+                self.shed_by_event_type[event_type] = self.shed_by_event_type.get(event_type, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'admitted': self.admitted,
+                'shed': sum(self.shed_by_reason.values()),
+                'shed_by_reason': dict(self.shed_by_reason),
+                'shed_by_event_type': dict(self.shed_by_event_type),
+                'pressure': round(self.pressure, 3),
+            }
+
+
+_pressure_sources = {}
+
+
+def register_pressure_source(name, source):
+    """Register ``source() -> float`` (0 idle, 1 saturated) as a pressure signal."""
+    _pressure_sources[name] = source
+
+
+def write_behind_pressure():
+    stats = get_buffer_stats()
+    if not stats or not stats['max_pending']:
+        return 0.0
+    return stats['queue_depth'] / stats['max_pending']
+
+
+def broker_pressure():
+    stats = get_broker_stats()
+    if not stats:
+        return 0.0
+    return stats['queued'] / get_broker_settings()['QUEUE_MAX_MESSAGES']
+
+
+register_pressure_source('write_behind', write_behind_pressure)
+register_pressure_source('broker', broker_pressure)
+
+
+def system_pressure():
+    """Highest fill ratio reported by the registered pressure sources."""
+    pressure = 0.0
+    for source in list(_pressure_sources.values()):
+        try:
+            pressure = max(pressure, float(source()))
+        except Exception:
+            continue
+    return pressure
+
+
+class AdmissionController:
+    """Per-session and per-IP token buckets plus the shedding policy."""
+
+    def __init__(self, config):
+        self.config = config
+        self.protected = set(config['PROTECTED_EVENT_TYPES'])
+        self.shed_first = set(config['SHED_FIRST_EVENT_TYPES'])
+        self.stats = AdmissionStats()
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def priority(self, event_type):
+        event_type = EVENT_TYPE_ALIASES.get(event_type, event_type)
+        if event_type in self.protected:
+            return PROTECTED
+        if event_type in self.shed_first:
+            return SHED_FIRST
+        return NORMAL
+
+    def _bucket(self, key, rate, burst, now):
+        """Return the refilled ``[tokens, updated_at]`` bucket for ``key`` (lock held)."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            if len(self._buckets) > self.config['MAX_BUCKETS']:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+
+    def admit(self, items, ip_address, now=None):
+        """Decide which items to keep.
+
+        ``items`` are validated events. Returns one entry per item: ``None``
+        when admitted, otherwise the shed reason.
+        """
+        config = self.config
+        now = time.monotonic() if now is None else now
+        pressure = system_pressure()
+        decisions = [None] * len(items)
+        typed = []
+        for position, item in enumerate(items):
+            if isinstance(item, dict):
+                event_type = item.get('event_type')
+                typed.append((self.priority(event_type), position, event_type, item.get('session_id')))
+        typed.sort(key=lambda entry: entry[0])
+
+        shed = []
+        with self._lock:
+            ip_bucket = self._bucket(('ip', ip_address), config['IP_RATE'], config['IP_BURST'], now)
+            for priority, position, event_type, session_id in typed:
+                if priority == SHED_FIRST and pressure >= config['SHED_MOVES_AT']:
+                    reason = SHED_PRESSURE
+                elif priority == NORMAL and pressure >= config['SHED_OTHERS_AT']:
+                    reason = SHED_PRESSURE
+                else:
+                    session_bucket = self._bucket(
+                        ('session', str(session_id)), config['SESSION_RATE'], config['SESSION_BURST'], now
+                    )
+                    if priority == PROTECTED:
+                        # Always admitted; still drains the buckets it belongs to.
+                        session_bucket[0] = max(session_bucket[0] - 1, 0.0)
+                        ip_bucket[0] = max(ip_bucket[0] - 1, 0.0)
+                        continue
+                    if session_bucket[0] < 1:
+                        reason = SHED_SESSION_RATE
+                    elif ip_bucket[0] < 1:
+                        reason = SHED_IP_RATE
+                    else:
+                        session_bucket[0] -= 1
+                        ip_bucket[0] -= 1
+                        continue
+                decisions[position] = reason
+                shed.append((str(event_type), reason))
+
+        self.stats.record(len(items) - len(shed), shed, pressure)
+        return decisions
+
+    def stats_snapshot(self):
+        stats = self.stats.snapshot()
+        with self._lock:
+            stats['buckets'] = len(self._buckets)
+        stats['pressure_now'] = round(system_pressure(), 3)
+        return stats
+
+
+_controller = None
+_controller_pid = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Return this process's admission controller, or ``None`` when disabled."""
+    global _controller, _controller_pid
+    config = get_admission_settings()
+    if not config['ENABLED']:
+        return None
+    pid = os.getpid()
+    if _controller is None or _controller_pid != pid:
+        with _controller_lock:
+            if _controller is None or _controller_pid != pid:
+                _controller = AdmissionController(config)
+                _controller_pid = pid
+    return _controller
+
+
+def get_admission_stats():
+    """Return admission metrics, or ``None`` if admission control is disabled."""
+    controller = get_admission_controller()
+    return controller.stats_snapshot() if controller is not None else None
@@ -1,4 +1,7 @@
 from django.apps import AppConfig
+from django.conf import settings
+from utils.async_logging import install_queue_logging
+from utils.sqlite_tuning import install_sqlite_pragmas
 from .utils.mongo_client import ensure_collections
 
 class TrackingConfig(AppConfig):
@@ -6,5 +9,8 @@ class TrackingConfig(AppConfig):
     name = 'apps.tracking'
 
     def ready(self):
-        """Ensure MongoDB collections exist when app starts."""
-        ensure_collections() 
\ No newline at end of file
+        """Switch to queued logging, tune SQLite and, if enabled, bootstrap the MongoDB schema when app starts."""
+        install_queue_logging()
+        install_sqlite_pragmas()
+        if getattr(settings, 'MONGODB_BOOTSTRAP_ON_STARTUP', False):
+            ensure_collections() 
\ No newline at end of file
@@ -0,0 +1,301 @@
+"""Columnar archive of tracking events (Parquet, partitioned by day and type).
+
+The HDFS sink connector (curl/hdfs.json) writes every event as its own JSON
+file, which is the worst layout for batch scans. ``manage.py archive_events``
+instead drains events from the ``events`` change stream or the broker topic
+and appends them to a Parquet dataset::
+
+    <PATH>/date=2026-10-18/event_type=mouse_move/part-<time>-<id>.parquet
+
+Rows are buffered per partition and written every ``FLUSH_ROWS`` events or
+``FLUSH_SECONDS``, so files hold many row groups' worth of events instead of
+one. Columns are typed for size: ``session_id`` and ``url`` are
+dictionary-encoded, coordinates are int16 and scroll offsets float32; the
+remaining ``data`` fields are kept as a JSON string. Files are zstd
+compressed.
+
+``PATH`` is a local directory or any URI pyarrow understands (e.g.
+``hdfs://namenode:9000/archive``). The resume point (change stream resume
+token, or committed Kafka offsets) only advances after a flush, so a crash
+replays at most one flush worth of events.
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+
+from .store import naive_utc
+
+try:
+    import pyarrow as pa
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pafs = pq = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DEFAULTS = {
+    'PATH': 'archive',
+    'SOURCE': 'change_stream',      # 'change_stream' or 'broker'
+    'FLUSH_ROWS': 100000,
+    'FLUSH_SECONDS': 60,
+    'COMPRESSION': 'zstd',
+    'CONSUMER_GROUP': 'mouse-tracker-archiver',
+}
+
+STATE_FILE = '_archive_state.json'
+INT16_MAX = 32767
+
+# Fields stored in columns of their own; everything else stays in ``data``
+COLUMN_FIELDS = {'x', 'y', 'scroll_x', 'scroll_y', 'scrollX', 'scrollY'}
+
+
+def get_archive_settings():
+    return {**ARCHIVE_DEFAULTS, **getattr(settings, 'TRACKING_ARCHIVE', {})}
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError('pyarrow is required for the event archive (pip install pyarrow)')
+
+
+def archive_schema():
+    require_pyarrow()
+    return pa.schema([
+        ('timestamp', pa.timestamp('ms')),
+        ('session_id', pa.dictionary(pa.int32(), pa.string())),
+        ('url', pa.dictionary(pa.int32(), pa.string())),
+        ('x', pa.int16()),
+        ('y', pa.int16()),
+        ('scroll_x', pa.float32()),
+        ('scroll_y', pa.float32()),
+        ('weight', pa.int16()),
+        ('data', pa.string()),
+    ])
+
+
+def open_filesystem(path):
+    """``(filesystem, root)`` for a local directory or a pyarrow URI."""
+    require_pyarrow()
+    if '://' in str(path):
+        return pafs.FileSystem.from_uri(str(path))
+    return pafs.LocalFileSystem(), os.path.abspath(str(path))
+
+
+def _coordinate(value):
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value != value:
+        return None
+    return max(-INT16_MAX, min(INT16_MAX, int(round(value))))
+
+
+def _float(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _first(data, *names):
+    for name in names:
+        if data.get(name) is not None:
+            return data[name]
+    return None
+
+
+class PartitionBuffer:
+    """Column lists of the rows of one ``(date, event_type)`` partition."""
+
+    __slots__ = ('timestamp', 'session_id', 'url', 'x', 'y', 'scroll_x', 'scroll_y', 'weight', 'data')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, [])
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def append(self, doc, timestamp):
+        data = doc.get('data') or {}
+        if not isinstance(data, dict):
+            data = {}
+        self.timestamp.append(timestamp)
+        self.session_id.append(str(doc.get('session_id', '')))
+        self.url.append(doc.get('url') or '')
+        self.x.append(_coordinate(data.get('x')))
+        self.y.append(_coordinate(data.get('y')))
+        self.scroll_x.append(_float(_first(data, 'scroll_x', 'scrollX')))
+        self.scroll_y.append(_float(_first(data, 'scroll_y', 'scrollY')))
+        self.weight.append(min(doc.get('weight') or 1, INT16_MAX))
+        rest = {key: value for key, value in data.items() if key not in COLUMN_FIELDS}
+        self.data.append(json.dumps(rest, default=str, separators=(',', ':')) if rest else None)
+
+    def table(self, schema):
+        columns = {name: getattr(self, name) for name in self.__slots__}
+        # dictionary_encode keeps each distinct session/url once per row group
+        arrays = [
+            pa.array(columns[field.name], type=field.type.value_type).dictionary_encode()
+            if pa.types.is_dictionary(field.type) else pa.array(columns[field.name], type=field.type)
+            for field in schema
+        ]
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class ArchiveWriter:
+    """Buffers events per partition and writes them as Parquet files."""
+
+    def __init__(self, path=None, compression=None):
+        config = get_archive_settings()
+        self.filesystem, self.root = open_filesystem(path or config['PATH'])
+        self.compression = compression or config['COMPRESSION']
+        self.schema = archive_schema()
+        self.partitions = {}
+        self.rows = 0
+        self.skipped = 0
+
+    def add(self, doc):
+        timestamp = doc.get('timestamp')
+        if not isinstance(timestamp, datetime):
+            self.skipped += 1
+            return
+        timestamp = naive_utc(timestamp)
+        key = (timestamp.strftime('%Y-%m-%d'), doc.get('event_type') or 'unknown')
+        self.partitions.setdefault(key, PartitionBuffer()).append(doc, timestamp)
+        self.rows += 1
+
+    def flush(self):
+        """Write every buffered partition; returns the list of files written."""
+        written = []
+        for (date, event_type), buffer in self.partitions.items():
+            directory = f"{self.root}/date={date}/event_type={event_type}"
+            self.filesystem.create_dir(directory, recursive=True)
+            name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+            # Write under a hidden name and rename, so readers never see partial files
+            temporary = f"{directory}/.{name}"
+            pq.write_table(
+                buffer.table(self.schema), temporary, filesystem=self.filesystem,
+                compression=self.compression, use_dictionary=['session_id', 'url'],
+            )
+            self.filesystem.move(temporary, f"{directory}/{name}")
+            written.append(f"{directory}/{name}")
+        if written:
+            logger.info(f"Archived {self.rows} event(s) into {len(written)} file(s)")
+        self.partitions = {}
+        self.rows = 0
+        return written
+
+    def load_state(self):
+        try:
+            with self.filesystem.open_input_stream(f"{self.root}/{STATE_FILE}") as stream:
+                return json.loads(stream.read().decode('utf-8'))
+        except (FileNotFoundError, OSError):
+            return {}
+
+    def save_state(self, state):
+        self.filesystem.create_dir(self.root, recursive=True)
+        temporary = f"{self.root}/.{STATE_FILE}"
+        with self.filesystem.open_output_stream(temporary) as stream:
+            stream.write(json.dumps(state).encode('utf-8'))
+        self.filesystem.move(temporary, f"{self.root}/{STATE_FILE}")
+
+
+class ChangeStreamSource:
+    """Inserted documents of the ``events`` change stream, resumable by token."""
+
+    name = 'change_stream'
+
+    def __init__(self, collection, resume_token=None, batch_size=1000):
+        self.stream = collection.watch(
+            [{'$match': {'operationType': 'insert'}}],
+            resume_after=resume_token, batch_size=batch_size, max_await_time_ms=500,
+        )
+        self.resume_token = resume_token
+
+    def poll(self, max_documents):
+        documents = []
+        while len(documents) < max_documents:
+            change = self.stream.try_next()
+            if change is None:
+                break
+            self.resume_token = change['_id']
+            documents.append(change['fullDocument'])
+        return documents
+
+    def checkpoint(self, state):
+        state['resume_token'] = self.resume_token
+
+    def close(self):
+        self.stream.close()
+
+
+class BrokerSource:
+    """Documents of the ingestion broker topic, read with the archiver's own consumer group."""
+
+    name = 'broker'
+
+    def __init__(self, consumer, timeout):
+        self.consumer = consumer
+        self.timeout = timeout
+        self.skipped = 0
+
+    @classmethod
+    def from_settings(cls, group):
+        from .broker import BrokerStats, KafkaConsumer, get_broker, get_broker_settings
+
+        config = get_broker_settings()
+        timeout = config['CONSUMER_TIMEOUT_MS'] / 1000.0
+        if config['BACKEND'] == 'kafka':
+            # A group of its own, so archiving does not steal messages from the Mongo loader
+            return cls(KafkaConsumer({**config, 'CONSUMER_GROUP': group}, BrokerStats()), timeout)
+        return cls(get_broker().consumer(), timeout)
+
+    def poll(self, max_documents):
+        from .ingestion import decode_messages
+
+        # Undecodable messages are skipped (and counted) so they never block the offsets
+        values = [value for _, value in self.consumer.poll_batch(max_documents, self.timeout)]
+        messages, skipped = decode_messages(values)
+        self.skipped += skipped
+        return [doc for message in messages for doc in message['documents']]
+
+    def checkpoint(self, state):
+        self.consumer.commit()
+
+    def close(self):
+        self.consumer.close()
+
+
+def run_archiver(writer, source, flush_rows, flush_seconds, idle_exit=False, should_run=lambda: True):
+    """Drain ``source`` into ``writer`` until stopped (or idle, with ``idle_exit``).
+
+    Returns the number of archived events.
+    """
+    state = writer.load_state()
+    archived = 0
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal archived, last_flush
+        rows = writer.rows
+        writer.flush()
+        source.checkpoint(state)
+        writer.save_state(state)
+        archived += rows
+        last_flush = time.monotonic()
+
+    try:
+        while should_run():
+            documents = source.poll(min(flush_rows, 10000))
+            for doc in documents:
+                writer.add(doc)
+            if writer.rows >= flush_rows or (writer.rows and time.monotonic() - last_flush >= flush_seconds):
+                flush()
+            if not documents and idle_exit:
+                break
+        if writer.rows:
+            flush()
+    finally:
+        source.close()
+    return archived
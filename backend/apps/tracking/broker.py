@@ -0,0 +1,284 @@
+"""Message broker between HTTP acceptance and Mongo writes.
+
+With ``TRACKING_BROKER['BACKEND']`` set to ``kafka`` the ingestion views only
+validate events and publish them, one message per session and request keyed
+by ``session_id`` (so a session's events stay ordered within a partition).
+Publishing is asynchronous: the producer lingers ``LINGER_MS`` to batch
+messages and delivery reports are collected in the background. The
+``consume_tracking_events`` command bulk-loads the topic into Mongo.
+
+``memory`` selects :class:`InMemoryBroker`, a single-process stand-in with
+the same publish/consume interface for tests and local development.
+"""
+
+import os
+import time
+import zlib
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BROKER_DEFAULTS = {
+    'BACKEND': 'mongo',             # 'mongo' (write inline), 'kafka' or 'memory'
+    'TOPIC': 'mouse-tracking-batches',
+    'BOOTSTRAP_SERVERS': 'kafka:9092',
+    'LINGER_MS': 20,
+    'BATCH_MESSAGES': 10000,
+    'ACKS': '1',
+    'COMPRESSION': 'lz4',
+    'QUEUE_MAX_MESSAGES': 100000,
+    'CONSUMER_GROUP': 'mouse-tracker-mongo-loader',
+    'CONSUMER_BATCH_SIZE': 1000,
+    'CONSUMER_TIMEOUT_MS': 500,
+    'MEMORY_PARTITIONS': 4,
+    'FULL_STATUS': 503,
+    'RETRY_AFTER': 1,
+    'DRAIN_TIMEOUT': 10,
+}
+
+
+def get_broker_settings():
+    """Return the broker settings merged with defaults."""
+    return {**BROKER_DEFAULTS, **getattr(settings, 'TRACKING_BROKER', {})}
+
+
+def broker_enabled():
+    return get_broker_settings()['BACKEND'] in ('kafka', 'memory')
+
+
+class BrokerFull(Exception):
+    """Raised when the producer's local queue cannot take more messages."""
+
+
+class BrokerStats:
+    """Producer counters shared by both broker implementations."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            'published': 0,
+            'delivered': 0,
+            'delivery_failed': 0,
+            'rejected': 0,
+            'consumed': 0,
+            'committed': 0,
+        }
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+class InMemoryBroker:
+    """Partitioned in-process log with one consumer group.
+
+    Messages are routed by key like Kafka's default partitioner, consumers
+    see them in partition order and uncommitted messages are redelivered
+    after :meth:`InMemoryConsumer.close`, so loader code behaves as it would
+    against a real topic.
+    """
+
+    backend = 'memory'
+
+    def __init__(self, partitions=4, max_messages=100000):
+        self.partitions = [[] for _ in range(partitions)]
+        self.committed = [0] * partitions
+        self.max_messages = max_messages
+        self.stats = BrokerStats()
+        self._cond = threading.Condition()
+
+    def partition_for(self, key):
+        return zlib.crc32(key) % len(self.partitions)
+
+    def publish(self, key, value):
+        with self._cond:
+            backlog = sum(len(p) - c for p, c in zip(self.partitions, self.committed))
+            if backlog >= self.max_messages:
+                self.stats.incr('rejected')
+                raise BrokerFull('In-memory broker is full')
+            self.partitions[self.partition_for(key)].append((key, value))
+            self.stats.incr('published')
+            self.stats.incr('delivered')
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        return 0
+
+    def pending(self):
+        return 0
+
+    def consumer(self):
+        return InMemoryConsumer(self)
+
+
+class InMemoryConsumer:
+    def __init__(self, broker):
+        self.broker = broker
+        self.positions = list(broker.committed)
+
+    def poll_batch(self, max_messages, timeout):
+        """Return up to ``max_messages`` ``(key, value)`` pairs, waiting up to ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        with self.broker._cond:
+            while True:
+                batch = []
+                for index, partition in enumerate(self.broker.partitions):
+                    take = partition[self.positions[index]:self.positions[index] + max_messages - len(batch)]
+                    self.positions[index] += len(take)
+                    batch.extend(take)
+                    if len(batch) >= max_messages:
+                        break
+                remaining = deadline - time.monotonic()
+                if batch or remaining <= 0:
+                    self.broker.stats.incr('consumed', len(batch))
+                    return batch
+                self.broker._cond.wait(remaining)
+
+    def commit(self):
+        with self.broker._cond:
+            committed = sum(p - c for p, c in zip(self.positions, self.broker.committed))
+            self.broker.committed = list(self.positions)
+        self.broker.stats.incr('committed', committed)
+
+    def close(self):
+        # Like a consumer leaving the group: uncommitted messages are redelivered
+        self.positions = list(self.broker.committed)
+
+
+class KafkaBroker:
+    """``confluent_kafka`` producer with linger batching and async delivery reports."""
+
+    backend = 'kafka'
+
+    def __init__(self, config):
+        from confluent_kafka import Producer
+
+        self.config = config
+        self.topic = config['TOPIC']
+        self.stats = BrokerStats()
+        self._producer = Producer({
+            'bootstrap.servers': config['BOOTSTRAP_SERVERS'],
+            'linger.ms': config['LINGER_MS'],
+            'batch.num.messages': config['BATCH_MESSAGES'],
+            'acks': config['ACKS'],
+            'compression.type': config['COMPRESSION'],
+            'queue.buffering.max.messages': config['QUEUE_MAX_MESSAGES'],
+        })
+
+    def _on_delivery(self, error, message):
+        if error is not None:
+            self.stats.incr('delivery_failed')
+            logger.error(f"Kafka delivery to {message.topic()} failed: {error}")
+        else:
+            self.stats.incr('delivered')
+
+    def publish(self, key, value):
+        try:
+            self._producer.produce(self.topic, key=key, value=value, on_delivery=self._on_delivery)
+        except BufferError:
+            self.stats.incr('rejected')
+            raise BrokerFull('Kafka producer queue is full')
+        self.stats.incr('published')
+        # Serve delivery callbacks of earlier messages without blocking
+        self._producer.poll(0)
+
+    def flush(self, timeout=None):
+        """Wait for outstanding deliveries; returns the number still queued."""
+        return self._producer.flush(timeout) if timeout is not None else self._producer.flush()
+
+    def pending(self):
+        return len(self._producer)
+
+    def consumer(self):
+        return KafkaConsumer(self.config, self.stats)
+
+
+class KafkaConsumer:
+    def __init__(self, config, stats):
+        from confluent_kafka import Consumer
+
+        self.stats = stats
+        self._uncommitted = 0
+        self._consumer = Consumer({
+            'bootstrap.servers': config['BOOTSTRAP_SERVERS'],
+            'group.id': config['CONSUMER_GROUP'],
+            'enable.auto.commit': False,
+            'auto.offset.reset': 'earliest',
+        })
+        self._consumer.subscribe([config['TOPIC']])
+
+    def poll_batch(self, max_messages, timeout):
+        batch = []
+        for message in self._consumer.consume(num_messages=max_messages, timeout=timeout):
+            if message.error():
+                logger.error(f"Kafka consumer error: {message.error()}")
+                continue
+            batch.append((message.key(), message.value()))
+        self._uncommitted += len(batch)
+        self.stats.incr('consumed', len(batch))
+        return batch
+
+    def commit(self):
+        if not self._uncommitted:
+            return
+        self._consumer.commit(asynchronous=False)
+        self.stats.incr('committed', self._uncommitted)
+        self._uncommitted = 0
+
+    def close(self):
+        self._consumer.close()
+
+
+_broker = None
+_broker_pid = None
+_broker_lock = threading.Lock()
+
+
+def create_broker(config=None):
+    config = config or get_broker_settings()
+    if config['BACKEND'] == 'kafka':
+        return KafkaBroker(config)
+    if config['BACKEND'] == 'memory':
+        return InMemoryBroker(config['MEMORY_PARTITIONS'], config['QUEUE_MAX_MESSAGES'])
+    raise ValueError(f"Unknown broker backend: {config['BACKEND']}")
+
+
+def get_broker():
+    """Return this process's broker, creating it on first use."""
+    global _broker, _broker_pid
+    pid = os.getpid()
+    if _broker is not None and _broker_pid == pid:
+        return _broker
+
+    with _broker_lock:
+        if _broker is None or _broker_pid != pid:
+            _broker = create_broker()
+            _broker_pid = pid
+        return _broker
+
+
+def get_broker_stats():
+    """Return producer metrics, or ``None`` if no broker was created in this process."""
+    if _broker is None or _broker_pid != os.getpid():
+        return None
+    stats = _broker.stats.snapshot()
+    stats['backend'] = _broker.backend
+    stats['queued'] = _broker.pending()
+    return stats
+
+
+@atexit.register
+def flush_broker():
+    """Deliver queued messages when the worker process exits."""
+    if _broker is not None and _broker_pid == os.getpid():
+        remaining = _broker.flush(get_broker_settings()['DRAIN_TIMEOUT'])
+        if remaining:
+            logger.error(f"{remaining} tracking message(s) were not delivered before exit")
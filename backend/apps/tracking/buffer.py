@@ -0,0 +1,237 @@
+"""In-process write-behind buffer for tracking events.
+
+Ingestion code pushes ready-to-insert ``events`` documents with
+:meth:`EventBuffer.offer` and returns immediately. A background thread
+writes them with ``insert_many`` whenever ``FLUSH_SIZE`` documents are
+pending or the oldest one has waited ``FLUSH_INTERVAL_MS``. Memory is
+bounded by ``MAX_PENDING``; once full, :class:`BufferFull` is raised so the
+caller can answer 503/429 instead of queueing without limit.
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'FLUSH_SIZE': 500,
+    'FLUSH_INTERVAL_MS': 200,
+    'MAX_PENDING': 50000,
+    'FULL_STATUS': 503,
+    'RETRY_AFTER': 1,
+    'DRAIN_TIMEOUT': 10,
+}
+
+
+def get_buffer_settings():
+    """Return the write-behind settings merged with defaults."""
+    return {**DEFAULTS, **getattr(settings, 'TRACKING_WRITE_BEHIND', {})}
+
+
+def write_behind_enabled():
+    return bool(get_buffer_settings()['ENABLED'])
+
+
+class BufferFull(Exception):
+    """Raised when the buffer cannot accept more documents."""
+
+
+class EventBuffer:
+    """Bounded queue of documents flushed by a background writer thread."""
+
+    def __init__(self, writer, flush_size=500, flush_interval_ms=200, max_pending=50000):
+        self._writer = writer
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_pending = max_pending
+
+        self._pending = deque()
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self._metrics = {
+            'accepted': 0,
+            'rejected': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'write_errors': 0,
+            'dropped': 0,
+            'max_queue_depth': 0,
+            'flush_latency_ms_last': 0.0,
+            'flush_latency_ms_max': 0.0,
+            'flush_latency_ms_total': 0.0,
+        }
+
+    def offer(self, documents):
+        """Queue documents for writing; raise :class:`BufferFull` if there is no room."""
+        with self._cond:
+            if self._closed:
+                raise BufferFull('Event buffer is shutting down')
+            if len(self._pending) + len(documents) > self.max_pending:
+                self._metrics['rejected'] += len(documents)
+                raise BufferFull('Event buffer is full')
+
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.extend(documents)
+            self._metrics['accepted'] += len(documents)
+            depth = len(self._pending)
+            if depth > self._metrics['max_queue_depth']:
+                self._metrics['max_queue_depth'] = depth
+            if depth >= self.flush_size:
+                self._cond.notify()
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='tracking-write-behind', daemon=True
+            )
+            self._thread.start()
+
+    def _take_batch(self):
+        batch = []
+        while self._pending and len(batch) < self.flush_size:
+            batch.append(self._pending.popleft())
+        self._oldest = time.monotonic() if self._pending else None
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._pending) >= self.flush_size:
+                        break
+                    if self._oldest is not None:
+                        remaining = self._oldest + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                batch = self._take_batch()
+            if batch and not self._write(batch) and not self._closed:
+                # Back off before retrying so a down database is not hammered.
+                time.sleep(self.flush_interval)
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            failures = self._writer(batch)
+        except Exception as e:
+            logger.error(f"Write-behind flush of {len(batch)} events failed: {str(e)}")
+            self._requeue(batch)
+            return False
+
+        latency = (time.perf_counter() - started) * 1000
+        with self._cond:
+            self._metrics['flushes'] += 1
+            self._metrics['flushed'] += len(batch) - len(failures or {})
+            self._metrics['write_errors'] += len(failures or {})
+            self._metrics['flush_latency_ms_last'] = round(latency, 3)
+            self._metrics['flush_latency_ms_total'] += latency
+            if latency > self._metrics['flush_latency_ms_max']:
+                self._metrics['flush_latency_ms_max'] = round(latency, 3)
+        if failures:
+            logger.error(f"Write-behind flush rejected {len(failures)} of {len(batch)} events")
+        return True
+
+    def _requeue(self, batch):
+        """Put a failed batch back at the head of the queue if there is room."""
+        with self._cond:
+            self._metrics['write_errors'] += len(batch)
+            room = self.max_pending - len(self._pending)
+            if self._closed or room <= 0:
+                self._metrics['dropped'] += len(batch)
+                return
+            keep = batch[:room]
+            self._metrics['dropped'] += len(batch) - len(keep)
+            self._pending.extendleft(reversed(keep))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def flush(self):
+        """Synchronously write everything that is currently queued."""
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            if not self._write(batch):
+                return
+
+    def close(self, timeout=10):
+        """Stop accepting documents and drain the queue."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        # Anything left (thread dead or timed out) is written inline.
+        self.flush()
+        logger.info(f"Write-behind buffer drained ({self._metrics['flushed']} events flushed)")
+
+    def stats(self):
+        """Return queue depth and flush metrics."""
+        with self._cond:
+            stats = dict(self._metrics)
+            stats['queue_depth'] = len(self._pending)
+        flushes = stats['flushes']
+        stats['flush_latency_ms_avg'] = (
+            round(stats.pop('flush_latency_ms_total') / flushes, 3) if flushes else 0.0
+        )
+        stats['max_pending'] = self.max_pending
+        return stats
+
+
+_buffer = None
+_buffer_pid = None
+_buffer_lock = threading.Lock()
+
+
+def get_event_buffer():
+    """Return this process's event buffer, creating it on first use."""
+    global _buffer, _buffer_pid
+    pid = os.getpid()
+    if _buffer is not None and _buffer_pid == pid:
+        return _buffer
+
+    with _buffer_lock:
+        if _buffer is None or _buffer_pid != pid:
+            from .store import get_event_store
+
+            config = get_buffer_settings()
+            _buffer = EventBuffer(
+                get_event_store().append_batch,
+                flush_size=config['FLUSH_SIZE'],
+                flush_interval_ms=config['FLUSH_INTERVAL_MS'],
+                max_pending=config['MAX_PENDING'],
+            )
+            _buffer_pid = pid
+        return _buffer
+
+
+def get_buffer_stats():
+    """Return buffer metrics, or ``None`` if no buffer was created in this process."""
+    if _buffer is None or _buffer_pid != os.getpid():
+        return None
+    return _buffer.stats()
+
+
+@atexit.register
+def drain_event_buffer():
+    """Flush pending events when the worker process exits."""
+    if _buffer is not None and _buffer_pid == os.getpid():
+        _buffer.close(get_buffer_settings()['DRAIN_TIMEOUT'])
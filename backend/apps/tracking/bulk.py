@@ -0,0 +1,112 @@
+"""Batched writes of ``Event`` rows through the ORM.
+
+A batch is written in a single transaction: the session foreign keys of
+the whole batch are resolved with one ``IN`` query, missing sessions are
+created (or reported) and the events are inserted with ``bulk_create``.
+With SQLite that is one fsync per batch instead of one per row. Session
+ids are checked to be UUIDs before the transaction, since one malformed id
+would otherwise fail the ``IN`` query of the whole batch.
+"""
+
+import logging
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Event, Session
+from .schemas import parse_session_id
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 1000
+
+
+class UnknownSessions(ValueError):
+    """Events reference sessions that do not exist (and may not be created)."""
+
+    def __init__(self, session_ids):
+        self.session_ids = sorted(session_ids)
+        super().__init__(f"Unknown session(s): {', '.join(self.session_ids)}")
+
+
+class InvalidSessions(ValueError):
+    """Events carry session ids that are not UUIDs."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"Invalid session_id in {len(errors)} event(s)")
+
+
+def invalid_session_ids(events):
+    """``{index: error}`` for the events whose ``session_id`` is not a UUID."""
+    return {
+        index: f"Invalid session_id: {event.get('session_id')!r}"
+        for index, event in enumerate(events)
+        if parse_session_id(event.get('session_id')) is None
+    }
+
+
+def _aware(value):
+    if settings.USE_TZ and value is not None and timezone.is_naive(value):
+        return timezone.make_aware(value, dt_timezone.utc)
+    return value
+
+
+def resolve_sessions(session_ids, create_from=None):
+    """Return the subset of ``session_ids`` (strings) missing from ``Session``.
+
+    With ``create_from`` (``{session_id: document}``) the missing sessions
+    are created from the ``user_agent``/``ip_address`` of their document and
+    an empty set is returned.
+    """
+    existing = {
+        str(session_id) for session_id in
+        Session.objects.filter(session_id__in=session_ids).values_list('session_id', flat=True)
+    }
+    missing = set(session_ids) - existing
+    if missing and create_from is not None:
+        Session.objects.bulk_create([
+            Session(
+                session_id=session_id,
+                user_agent=create_from[session_id].get('user_agent', ''),
+                ip_address=create_from[session_id].get('ip_address') or '0.0.0.0',
+            )
+            for session_id in missing
+        ], ignore_conflicts=True)
+        return set()
+    return missing
+
+
+def bulk_create_events(events, create_sessions=False, batch_size=BULK_BATCH_SIZE):
+    """Insert ``events`` (dicts with ``session_id``, ``event_type``, ``timestamp``,
+    ``url``, ``data``) in one transaction and return the created ``Event`` rows.
+
+    Raises :class:`InvalidSessions` if a ``session_id`` is not a UUID and
+    :class:`UnknownSessions` if an event refers to a missing session and
+    ``create_sessions`` is off; nothing is written in either case.
+    """
+    if not events:
+        return []
+    errors = invalid_session_ids(events)
+    if errors:
+        raise InvalidSessions(errors)
+    first = {}
+    for event in events:
+        first.setdefault(parse_session_id(event['session_id']), event)
+
+    with transaction.atomic():
+        missing = resolve_sessions(set(first), first if create_sessions else None)
+        if missing:
+            raise UnknownSessions(missing)
+        return Event.objects.bulk_create([
+            Event(
+                session_id=event['session_id'],
+                event_type=event['event_type'],
+                timestamp=_aware(event['timestamp']),
+                url=event.get('url', ''),
+                data=event.get('data') or {},
+            )
+            for event in events
+        ], batch_size=batch_size)
@@ -0,0 +1,158 @@
+"""Compact binary wire format for ``mouse_move`` batches.
+
+Content type ``application/x-mouse-moves``. All fields are little-endian::
+
+    magic       2s   b'MM'
+    version     B    1
+    flags       B    reserved, 0
+    base_ts     d    client timestamp of the first point (epoch milliseconds)
+    x0, y0      i i  absolute position of the first point
+    count       I    number of points
+    sid_len     H    length of the UTF-8 session id
+    url_len     H    length of the UTF-8 page URL
+    session_id  sid_len bytes
+    url         url_len bytes
+    points      count x (dt, dx, dy) int16 triples
+
+Each triple is the delta from the previous point (the first one from
+``base_ts``/``x0``/``y0``), so a batch costs 6 bytes per point instead of a
+~150 byte JSON object. Decoding is a single ``numpy.frombuffer`` plus a
+cumulative sum, straight into columnar arrays, which stay columnar through
+admission, simplification and (bucket-only) trajectory writes.
+"""
+
+import struct
+from datetime import datetime
+
+import numpy as np
+
+MOUSE_MOVES_CONTENT_TYPE = 'application/x-mouse-moves'
+
+MAGIC = b'MM'
+VERSION = 1
+HEADER = struct.Struct('<2sBBdiiIHH')
+TRIPLE_DTYPE = np.dtype('<i2')
+MAX_POINTS = 65536
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+# Point times must convert to a datetime: epoch up to the end of year 9999
+MAX_TIMESTAMP_MS = (datetime(9999, 12, 31) - datetime(1970, 1, 1)).total_seconds() * 1000
+
+
+class CodecError(ValueError):
+    """Raised for malformed binary payloads."""
+
+
+class MouseMoveBatch:
+    """Decoded batch: one session/url header plus columnar point arrays."""
+
+    __slots__ = ('session_id', 'url', 't', 'x', 'y')
+
+    def __init__(self, session_id, url, t, x, y):
+        self.session_id = session_id
+        self.url = url
+        self.t = t      # float64 epoch milliseconds
+        self.x = x      # int32
+        self.y = y      # int32
+
+    def __len__(self):
+        return len(self.t)
+
+    def take(self, indexes):
+        """The batch restricted to the points at ``indexes``."""
+        return MouseMoveBatch(self.session_id, self.url, self.t[indexes], self.x[indexes], self.y[indexes])
+
+
+def encode_mouse_moves(session_id, url, t, x, y):
+    """Encode absolute points (ms timestamps, pixel coordinates) into the wire format.
+
+    Raises :class:`CodecError` if a delta does not fit in int16; callers
+    should split the batch at such gaps.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    if not (len(t) == len(x) == len(y)) or len(t) == 0:
+        raise CodecError('t, x and y must be non-empty and of equal length')
+    if len(t) > MAX_POINTS:
+        raise CodecError(f'At most {MAX_POINTS} points per batch')
+
+    t_ms = np.rint(t - t[0]).astype(np.int64)
+    deltas = np.empty((len(t), 3), dtype=np.int64)
+    deltas[:, 0] = np.diff(t_ms, prepend=0)
+    deltas[:, 1] = np.diff(x, prepend=x[0])
+    deltas[:, 2] = np.diff(y, prepend=y[0])
+    if deltas.min() < -32768 or deltas.max() > 32767:
+        raise CodecError('Delta does not fit in int16')
+
+    sid = str(session_id).encode('utf-8')
+    url_bytes = str(url).encode('utf-8')
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, float(t[0]), int(x[0]), int(y[0]),
+        len(t), len(sid), len(url_bytes)
+    )
+    return header + sid + url_bytes + deltas.astype(TRIPLE_DTYPE).tobytes()
+
+
+def decode_mouse_moves(body):
+    """Decode a binary payload into a :class:`MouseMoveBatch`."""
+    if len(body) < HEADER.size:
+        raise CodecError('Payload shorter than header')
+    magic, version, _flags, base_ts, x0, y0, count, sid_len, url_len = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise CodecError('Bad magic')
+    if version != VERSION:
+        raise CodecError(f'Unsupported version {version}')
+    if count == 0 or count > MAX_POINTS:
+        raise CodecError(f'Point count must be between 1 and {MAX_POINTS}')
+
+    offset = HEADER.size
+    points_offset = offset + sid_len + url_len
+    if len(body) != points_offset + count * 3 * TRIPLE_DTYPE.itemsize:
+        raise CodecError('Payload length does not match header')
+    try:
+        session_id = bytes(body[offset:offset + sid_len]).decode('utf-8')
+        url = bytes(body[offset + sid_len:points_offset]).decode('utf-8')
+    except UnicodeDecodeError:
+        raise CodecError('Header strings are not valid UTF-8')
+    if not session_id:
+        raise CodecError('session_id is required')
+
+    triples = np.frombuffer(body, dtype=TRIPLE_DTYPE, count=count * 3, offset=points_offset)
+    # Sums of up to MAX_POINTS int16 deltas overflow int32: add up in int64, check, then narrow
+    totals = np.cumsum(triples.reshape(count, 3), axis=0, dtype=np.int64)
+    t = base_ts + totals[:, 0].astype(np.float64)
+    if not np.isfinite(base_ts) or t.min() < 0 or t.max() > MAX_TIMESTAMP_MS:
+        raise CodecError('base_ts is not a valid epoch timestamp in milliseconds')
+    x = x0 + totals[:, 1]
+    y = y0 + totals[:, 2]
+    if min(x.min(), y.min()) < INT32_MIN or max(x.max(), y.max()) > INT32_MAX:
+        raise CodecError('Coordinates do not fit in int32')
+    return MouseMoveBatch(session_id, url, t, x.astype(np.int32), y.astype(np.int32))
+
+
+def mouse_move_documents(batch, context, now, weights=None):
+    """Expand a decoded batch into ``events`` documents.
+
+    ``weights`` (one per point, see :mod:`.simplify`) is stored on the
+    points that stand for more than themselves.
+    """
+    client_times = batch.t.astype('datetime64[ms]').tolist()
+    weights = weights.tolist() if weights is not None else [1] * len(batch)
+    documents = []
+    for x, y, client_time, weight in zip(batch.x.tolist(), batch.y.tolist(), client_times, weights):
+        doc = {
+            'session_id': batch.session_id,
+            'event_type': 'mouse_move',
+            'data': {'x': x, 'y': y},
+            'timestamp': now,
+            'client_timestamp': client_time,
+            'url': batch.url,
+            'path': context.get('path', ''),
+            'method': context.get('method', ''),
+            'user_agent': context.get('user_agent', ''),
+        }
+        if weight > 1:
+            doc['weight'] = weight
+        documents.append(doc)
+    return documents
@@ -1,72 +1,336 @@
 """WebSocket consumers for the tracking app."""
 
+import re
 import json
+import math
+import random
+import asyncio
+import hashlib
+import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.utils import timezone
 
+from .ingestion import IngestionError, client_ip, extract_events, ingest_events
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_DEFAULTS = {
+    'FLUSH_SIZE': 200,
+    'FLUSH_INTERVAL_MS': 250,
+    'MAX_FRAME_EVENTS': 1000,
+}
+
+LIVE_DEFAULTS = {
+    'DEFAULT_RATE_HZ': 10,
+    'MAX_RATE_HZ': 30,
+    'MAX_SUBSCRIPTIONS': 50,
+    'MAX_EVENTS_PER_TICK': 100,
+}
+
+# Event types that are coalesced to the latest position per session, and
+# the ones that may be sampled away; everything else is always delivered.
+COALESCED_EVENT_TYPES = {'mouse_move'}
+SAMPLED_EVENT_TYPES = {'scroll'}
+
+_GROUP_NAME_RE = re.compile(r'^[a-zA-Z0-9_.-]{1,64}$')
+
+def session_group(session_id):
+    """Channel-layer group carrying live events of one session."""
+    session_id = str(session_id)
+    if not _GROUP_NAME_RE.match(session_id):
+        session_id = hashlib.sha1(session_id.encode('utf-8')).hexdigest()
+    return f"tracking.session.{session_id}"
+
+def url_group(url):
+    """Channel-layer group carrying live events of one page URL."""
+    return f"tracking.url.{hashlib.sha1(str(url).encode('utf-8')).hexdigest()}"
+
+async def publish_live_events(channel_layer, items):
+    """Send a frame's events to the session and URL topics they belong to.
+
+    One ``group_send`` per topic per frame; nothing is sent to topics
+    without subscribers beyond the channel layer's own no-op.
+    """
+    topics = {}
+    for item in items:
+        if not isinstance(item, dict) or not item.get('session_id'):
+            continue
+        topics.setdefault(session_group(item['session_id']), []).append(item)
+        if item.get('url'):
+            topics.setdefault(url_group(item['url']), []).append(item)
+
+    timestamp = timezone.now().isoformat()
+    for group, events in topics.items():
+        await channel_layer.group_send(group, {
+            "type": "tracking_batch",
+            "events": events,
+            "timestamp": timestamp
+        })
+
+def accepted_items(items, summary):
+    """The items ``ingest_events`` stored (not rejected, shed, failed or duplicate)."""
+    return [
+        items[result['index']] for result in summary['results']
+        if result['status'] == 'success' and not result.get('duplicate')
+    ]
+
+def bounded_float(value, low, high):
+    """``value`` as a float clamped to ``[low, high]``; raises ``ValueError`` if not a finite number."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{value!r} is not a number")
+    if not math.isfinite(value):
+        raise ValueError(f"{value!r} is not a finite number")
+    return min(max(value, low), high)
+
 class TrackingConsumer(AsyncWebsocketConsumer):
-    """Consumer for real-time tracking data."""
-    
+    """Consumer for real-time tracking data.
+
+    This is the producer side used by trackers; it never receives other
+    visitors' events. Frames carry a single event, a list of events or
+    ``{"seq": n, "events": [...]}``. Events are buffered per connection and
+    persisted with one bulk write every ``FLUSH_SIZE`` events or
+    ``FLUSH_INTERVAL_MS``; once written, the server replies
+    ``{"type": "ack", "seqs": [...]}`` so the tracker can drop those frames.
+    Only the events that were stored (valid, admitted and written) are
+    forwarded to live viewers, after the flush.
+    """
+
     async def connect(self):
         """Handle WebSocket connection."""
-        # Join tracking group
-        await self.channel_layer.group_add(
-            "tracking",
-            self.channel_name
-        )
+        self.config = {**WEBSOCKET_DEFAULTS, **getattr(settings, 'TRACKING_WEBSOCKET', {})}
+        self.pending = []
+        self.pending_seqs = []
+        self.flush_lock = asyncio.Lock()
+        self.flush_timer = None
         await self.accept()
-    
+
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
-        # Leave tracking group
-        await self.channel_layer.group_discard(
-            "tracking",
-            self.channel_name
-        )
-    
-    async def receive(self, text_data):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+        # Persist whatever is still buffered; acks can no longer be delivered.
+        await self.flush(send_ack=False)
+
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle received data from WebSocket."""
-        data = json.loads(text_data)
-        event_type = data.get('event_type')
-        
-        # Forward the event to the tracking group
-        await self.channel_layer.group_send(
-            "tracking",
-            {
-                "type": "tracking_event",
-                "event_type": event_type,
-                "data": data,
-                "timestamp": timezone.now().isoformat()
-            }
-        )
-        
-        # Save to database asynchronously
-        if 'session_id' in data:
-            await self.save_event(data)
-    
-    async def tracking_event(self, event):
-        """Send tracking event to WebSocket."""
-        # Send message to WebSocket
+        try:
+            frame = json.loads(text_data)
+        except (TypeError, json.JSONDecodeError):
+            await self.send_json_message({"type": "error", "error": "Invalid JSON data"})
+            return
+
+        seq = frame.get('seq') if isinstance(frame, dict) else None
+        items, is_batch = extract_events(frame)
+        if len(items) > self.config['MAX_FRAME_EVENTS']:
+            await self.send_json_message({
+                "type": "nack",
+                "seqs": [seq] if seq is not None else [],
+                "error": f"Frame exceeds {self.config['MAX_FRAME_EVENTS']} events"
+            })
+            return
+
+        self.pending.extend(items)
+        if seq is not None:
+            self.pending_seqs.append(seq)
+
+        if len(self.pending) >= self.config['FLUSH_SIZE']:
+            await self.flush()
+        elif self.flush_timer is None or self.flush_timer.done():
+            self.flush_timer = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.config['FLUSH_INTERVAL_MS'] / 1000.0)
+        await self.flush()
+
+    async def flush(self, send_ack=True):
+        """Persist buffered events with one bulk write and acknowledge their frames."""
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            items, seqs = self.pending, self.pending_seqs
+            self.pending, self.pending_seqs = [], []
+
+            try:
+                summary = await sync_to_async(ingest_events, thread_sensitive=False)(
+                    items, self.ingestion_context()
+                )
+            except Exception as e:
+                # The items are no longer buffered: the tracker must resend the frames
+                error = e if isinstance(e, IngestionError) else IngestionError('Failed to store events', status=503)
+                if error is not e:
+                    logger.exception(f"Failed to ingest {len(items)} WebSocket event(s)")
+                if send_ack:
+                    await self.send_json_message({
+                        "type": "nack",
+                        "seqs": seqs,
+                        "error": str(error),
+                        "status": error.status,
+                        "retry_after": error.headers.get('Retry-After')
+                    })
+                else:
+                    logger.warning(f"Dropped {len(items)} event(s) of a closed WebSocket: {str(error)}")
+                return
+
+            # Forward the stored events to live viewers subscribed to their session/URL
+            await publish_live_events(self.channel_layer, accepted_items(items, summary))
+
+            if send_ack:
+                await self.send_json_message({
+                    "type": "ack",
+                    "seq": seqs[-1] if seqs else None,
+                    "seqs": seqs,
+                    "inserted": summary['inserted'],
+                    "failed": summary['failed'],
+                    "shed": summary['shed'],
+                    "errors": [r for r in summary['results'] if r['status'] == 'error']
+                })
+
+    async def send_json_message(self, message):
+        await self.send(text_data=json.dumps(message))
+
+    def ingestion_context(self):
+        """Build the ingestion request context from the WebSocket scope."""
+        headers = dict(self.scope.get('headers', []))
+        peer = self.scope.get('client') or (None, None)
+        return {
+            'user_agent': headers.get(b'user-agent', b'').decode('latin-1'),
+            'referer': headers.get(b'referer', b'').decode('latin-1'),
+            'path': self.scope.get('path', ''),
+            'method': 'WEBSOCKET',
+            'ip_address': client_ip(headers.get(b'x-forwarded-for', b'').decode('latin-1'), peer[0]),
+        }
+
+
+class LiveTrackingConsumer(AsyncWebsocketConsumer):
+    """Viewer side: live events for subscribed sessions or URLs.
+
+    Viewers send ``{"action": "subscribe", "session_ids": [...], "urls": [...],
+    "rate_hz": 10, "sample": 1.0}`` (or ``"unsubscribe"``). Incoming events
+    are throttled to ``rate_hz`` messages per second: ``mouse_move`` is
+    coalesced to the latest cursor position per session, ``scroll`` is
+    sampled and other events are delivered in order up to
+    ``MAX_EVENTS_PER_TICK`` per message.
+    """
+
+    async def connect(self):
+        """Handle WebSocket connection."""
+        self.config = {**LIVE_DEFAULTS, **getattr(settings, 'TRACKING_LIVE', {})}
+        self.groups_joined = set()
+        self.cursors = {}
+        self.outbox = []
+        self.dropped = 0
+        self.sample = 1.0
+        self.interval = 1.0 / self.config['DEFAULT_RATE_HZ']
+        self.sender = None
+        await self.accept()
+
+        query = parse_qs(self.scope.get('query_string', b'').decode('latin-1'))
+        if query.get('session_id') or query.get('url'):
+            await self.subscribe(query.get('session_id', []), query.get('url', []))
+
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection."""
+        if self.sender is not None:
+            self.sender.cancel()
+        for group in self.groups_joined:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.groups_joined.clear()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """Handle subscription management messages."""
+        try:
+            message = json.loads(text_data)
+        except (TypeError, json.JSONDecodeError):
+            await self.send(text_data=json.dumps({"type": "error", "error": "Invalid JSON data"}))
+            return
+        if not isinstance(message, dict):
+            await self.send(text_data=json.dumps({"type": "error", "error": "Expected JSON object"}))
+            return
+
+        session_ids = message.get('session_ids') or []
+        urls = message.get('urls') or []
+        action = message.get('action')
+        if action == 'subscribe':
+            try:
+                rate = bounded_float(message['rate_hz'], 0.1, self.config['MAX_RATE_HZ']) \
+                    if 'rate_hz' in message else None
+                sample = bounded_float(message['sample'], 0.0, 1.0) if 'sample' in message else None
+            except ValueError as e:
+                await self.send(text_data=json.dumps({"type": "error", "error": f"Invalid rate_hz/sample: {e}"}))
+                return
+            if rate is not None:
+                self.interval = 1.0 / rate
+            if sample is not None:
+                self.sample = sample
+            await self.subscribe(session_ids, urls)
+        elif action == 'unsubscribe':
+            await self.unsubscribe(session_ids, urls)
+        else:
+            await self.send(text_data=json.dumps({"type": "error", "error": f"Unknown action: {action}"}))
+
+    async def subscribe(self, session_ids, urls):
+        groups = [session_group(s) for s in session_ids] + [url_group(u) for u in urls]
+        for group in groups:
+            if group in self.groups_joined:
+                continue
+            if len(self.groups_joined) >= self.config['MAX_SUBSCRIPTIONS']:
+                await self.send(text_data=json.dumps({
+                    "type": "error",
+                    "error": f"At most {self.config['MAX_SUBSCRIPTIONS']} subscriptions per connection"
+                }))
+                break
+            await self.channel_layer.group_add(group, self.channel_name)
+            self.groups_joined.add(group)
+        if self.sender is None or self.sender.done():
+            self.sender = asyncio.create_task(self.send_loop())
         await self.send(text_data=json.dumps({
-            "event_type": event["event_type"],
-            "data": event["data"],
-            "timestamp": event["timestamp"]
+            "type": "subscribed",
+            "subscriptions": len(self.groups_joined),
+            "rate_hz": round(1.0 / self.interval, 3),
+            "sample": self.sample
         }))
-    
-    @database_sync_to_async
-    def save_event(self, data):
-        """Save event to database."""
-        from .models import Session, Event
-        
-        try:
-            session = Session.objects.get(session_id=data['session_id'])
-            Event.objects.create(
-                session=session,
-                event_type=data['event_type'],
-                timestamp=timezone.now(),
-                url=data.get('url', ''),
-                data=data
-            )
-        except Session.DoesNotExist:
-            pass  # Handle non-existent session 
\ No newline at end of file
+
+    async def unsubscribe(self, session_ids, urls):
+        groups = [session_group(s) for s in session_ids] + [url_group(u) for u in urls]
+        for group in groups:
+            if group in self.groups_joined:
+                await self.channel_layer.group_discard(group, self.channel_name)
+                self.groups_joined.discard(group)
+        await self.send(text_data=json.dumps({
+            "type": "unsubscribed",
+            "subscriptions": len(self.groups_joined)
+        }))
+
+    async def tracking_batch(self, message):
+        """Queue events published by producers; nothing is sent from here."""
+        for event in message["events"]:
+            event_type = event.get('event_type')
+            if event_type in COALESCED_EVENT_TYPES:
+                self.cursors[event.get('session_id')] = event
+            elif event_type in SAMPLED_EVENT_TYPES and random.random() >= self.sample:
+                continue
+            elif len(self.outbox) < self.config['MAX_EVENTS_PER_TICK']:
+                self.outbox.append(event)
+            else:
+                self.dropped += 1
+
+    async def send_loop(self):
+        """Deliver coalesced cursors and queued events at the subscribed rate."""
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.cursors and not self.outbox:
+                continue
+            cursors, events, dropped = list(self.cursors.values()), self.outbox, self.dropped
+            self.cursors, self.outbox, self.dropped = {}, [], 0
+            await self.send(text_data=json.dumps({
+                "type": "events",
+                "cursors": cursors,
+                "events": events,
+                "dropped": dropped,
+                "timestamp": timezone.now().isoformat()
+            }))
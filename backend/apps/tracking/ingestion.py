@@ -0,0 +1,540 @@
+"""Batch ingestion pipeline shared by the tracking endpoints.
+
+A tracker payload (single event, list of events or ``{"events": [...]}``)
+is validated as a whole against the per-event-type schemas in
+:mod:`.schemas`, sessions are resolved once per distinct
+``session_id`` and all valid events are written with a single unordered
+``insert_many`` (or handed to the write-behind buffer when
+``TRACKING_WRITE_BEHIND['ENABLED']`` is set, or published to the broker
+when ``TRACKING_BROKER['BACKEND']`` is ``kafka``). Every item gets its own
+result so the caller can report partial failures. Events carrying a client
+``seq`` are deduplicated on ``(session_id, seq)`` within a time window, so
+tracker retries are idempotent. Batches first pass admission control
+(:mod:`.admission`): events over their session or IP rate, or shed under
+load, are reported with status ``shed``. ``mouse_move`` runs are simplified
+(:mod:`.simplify`) right before they are persisted.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import json_util
+from bson.errors import BSONError
+from bson.json_util import JSONOptions
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .broker import BrokerFull, broker_enabled, get_broker, get_broker_settings
+from .codec import MAX_TIMESTAMP_MS, mouse_move_documents
+from .schemas import validate_batch
+from .admission import get_admission_controller, get_admission_settings
+from .simplify import simplify_mouse_moves, simplify_points
+from .store import get_event_store
+from .buffer import BufferFull, get_event_buffer, get_buffer_settings, write_behind_enabled
+from .utils.mongo_client import get_collection
+from .utils.dedup import event_key, get_dedup_window
+from .utils.session_cache import get_session_cache
+from .utils.trajectory_store import append_mouse_moves, append_trajectories, get_trajectory_settings, naive_utc
+from .utils.timeseries import add_meta, timeseries_enabled
+from .utils.expiry import stamp_expiry, ttl_enabled
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class IngestionError(Exception):
+    """Raised when a batch cannot be written at all."""
+
+    def __init__(self, message, status=500, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def extract_events(data):
+    """Normalise a payload into ``(items, is_batch)``."""
+    if isinstance(data, dict) and isinstance(data.get('events'), list):
+        return data['events'], True
+    if isinstance(data, list):
+        return data, True
+    return [data], False
+
+
+def client_ip(forwarded_for, remote_addr):
+    """Client address: first ``X-Forwarded-For`` hop, else the peer address."""
+    if forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return remote_addr or '0.0.0.0'
+
+
+def get_client_ip(request):
+    """Get client IP address from request."""
+    return client_ip(request.META.get('HTTP_X_FORWARDED_FOR'), request.META.get('REMOTE_ADDR'))
+
+
+def request_context(request):
+    """Collect the request metadata stored alongside every event."""
+    return {
+        'user_agent': request.headers.get('User-Agent', ''),
+        'referer': request.headers.get('Referer', ''),
+        'path': request.path,
+        'method': request.method,
+        'ip_address': get_client_ip(request),
+    }
+
+
+def admit_events(items, context):
+    """Run admission control over a batch.
+
+    Returns the per-item shed reasons (``None`` = admitted), or ``None`` when
+    admission control is disabled. Raises :class:`IngestionError` (429 with
+    ``Retry-After``) when every item of a non-empty batch is shed.
+    """
+    controller = get_admission_controller()
+    if controller is None or not items:
+        return None
+    decisions = controller.admit(items, context.get('ip_address', ''))
+    if all(decisions):
+        config = get_admission_settings()
+        raise IngestionError(
+            'Too many tracking events', status=config['STATUS'],
+            headers={'Retry-After': str(config['RETRY_AFTER'])}
+        )
+    return decisions
+
+
+def parse_client_timestamp(value):
+    """The tracker's ``timestamp`` (epoch ms or ISO 8601) as a naive UTC datetime, or ``None``."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if not 0 <= value <= MAX_TIMESTAMP_MS:
+            return None
+        return EPOCH + timedelta(milliseconds=value)
+    if isinstance(value, str):
+        try:
+            # fromisoformat only accepts a 'Z' suffix from Python 3.11
+            return naive_utc(datetime.fromisoformat(value.replace('Z', '+00:00')))
+        except ValueError:
+            return None
+    return None
+
+
+def build_event_document(item, context, now, default_event_type=None):
+    """Build the Mongo ``events`` document for an item cleaned by :func:`.schemas.validate_batch`."""
+    document = {
+        'session_id': item['session_id'],
+        'event_type': item.get('event_type') or default_event_type,
+        'data': item.get('data', {}),
+        'timestamp': now,
+        'url': item.get('url', ''),
+        'path': context.get('path', ''),
+        'method': context.get('method', ''),
+        'user_agent': context.get('user_agent', ''),
+    }
+    if item.get('seq') is not None:
+        document['seq'] = item['seq']
+    client_time = parse_client_timestamp(item.get('timestamp'))
+    if client_time is not None:
+        document['client_timestamp'] = client_time
+    return document
+
+
+def session_upsert(session_id, context, now):
+    """Single-round-trip upsert creating the session or bumping its activity."""
+    return UpdateOne(
+        {'session_id': session_id},
+        {
+            '$setOnInsert': {
+                'session_id': session_id,
+                'created_at': now,
+                'user_agent': context.get('user_agent', ''),
+                'referer': context.get('referer', ''),
+            },
+            '$max': {'last_activity': now},
+        },
+        upsert=True
+    )
+
+
+def ensure_sessions(session_ids, context, now):
+    """Create missing sessions and bump ``last_activity`` for known ones.
+
+    Sessions written within ``TRACKING_SESSION_CACHE['TOUCH_INTERVAL']`` are
+    skipped; the rest are upserted with one ``bulk_write``.
+    """
+    ensure_session_contexts({session_id: (context, now) for session_id in session_ids})
+
+
+def ensure_session_contexts(sessions):
+    """Like :func:`ensure_sessions` with a ``(context, now)`` pair per session id."""
+    cache = get_session_cache()
+    due = [session_id for session_id in sessions if cache.should_touch(session_id)]
+    if not due:
+        return
+
+    sessions_collection = get_collection('sessions')
+    if sessions_collection is None:
+        cache.forget(due)
+        raise IngestionError('Failed to connect to MongoDB')
+
+    try:
+        sessions_collection.bulk_write(
+            [session_upsert(session_id, *sessions[session_id]) for session_id in due],
+            ordered=False
+        )
+    except BulkWriteError as e:
+        # Concurrent upserts of a new session may race on the unique index;
+        # forget the failed ones so the next event retries them.
+        failed = [due[error['index']] for error in e.details.get('writeErrors', [])]
+        cache.forget(failed)
+        logger.warning(f"Failed to upsert {len(failed)} session(s)")
+    except Exception:
+        cache.forget(due)
+        raise
+
+
+def write_events(documents):
+    """Insert documents with one unordered ``insert_many``.
+
+    Returns a dict mapping the index of each failed document to its error.
+    With ``TRACKING_TRAJECTORIES['ENABLED']`` positional events are also
+    appended to their trajectory buckets (see :mod:`.utils.trajectory_store`).
+    """
+    failures = {}
+    positions = range(len(documents))
+    config = get_trajectory_settings()
+    if config['ENABLED']:
+        try:
+            bucket_failures = append_trajectories(documents, config)
+        except Exception as e:
+            if not config['KEEP_EVENTS']:
+                raise IngestionError(f'Failed to append trajectories: {e}')
+            logger.warning(f"Failed to append trajectories: {e}")
+            bucket_failures = {}
+        if not config['KEEP_EVENTS']:
+            # mouse_move lives in the buckets only; bucket errors are event errors
+            failures.update({
+                index: error for index, error in bucket_failures.items()
+                if documents[index]['event_type'] == 'mouse_move'
+            })
+            positions = [i for i, doc in enumerate(documents) if doc['event_type'] != 'mouse_move']
+            documents = [documents[i] for i in positions]
+        elif bucket_failures:
+            logger.warning(f"Failed to append {len(bucket_failures)} point(s) to trajectories")
+        if not documents:
+            return failures
+
+    events_collection = get_collection('events')
+    if events_collection is None:
+        raise IngestionError('Failed to connect to MongoDB')
+
+    if timeseries_enabled():
+        add_meta(documents)
+    if ttl_enabled():
+        stamp_expiry(documents)
+    try:
+        events_collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        failures.update({
+            positions[error['index']]: error.get('errmsg', 'Failed to save event')
+            for error in e.details.get('writeErrors', [])
+        })
+    return failures
+
+
+def enqueue_events(documents):
+    """Hand documents to the write-behind buffer instead of writing them inline."""
+    try:
+        get_event_buffer().offer(documents)
+    except BufferFull as e:
+        config = get_buffer_settings()
+        raise IngestionError(
+            str(e), status=config['FULL_STATUS'],
+            headers={'Retry-After': str(config['RETRY_AFTER'])}
+        )
+    return {}
+
+
+def encode_message(documents, context, now):
+    """Serialise one session's documents (and session context) as a broker message."""
+    return json_util.dumps({
+        'context': {'user_agent': context.get('user_agent', ''), 'referer': context.get('referer', '')},
+        'received_at': now,
+        'documents': documents,
+    }).encode('utf-8')
+
+
+# Datetimes come back naive UTC, like documents written inline and read from Mongo
+MESSAGE_JSON_OPTIONS = JSONOptions(tz_aware=False)
+
+
+def decode_message(value):
+    return json_util.loads(value, json_options=MESSAGE_JSON_OPTIONS)
+
+
+def decode_messages(values):
+    """Decode broker messages, skipping (and logging) the ones that are not event batches.
+
+    A message that cannot be decoded would fail again on every redelivery,
+    so it must not block the offsets behind it. Returns ``(messages, skipped)``.
+    """
+    messages = []
+    skipped = 0
+    for value in values:
+        try:
+            message = decode_message(value)
+            documents = message['documents']
+            if not isinstance(message.get('context'), dict) or not isinstance(message.get('received_at'), datetime):
+                raise ValueError('missing context or received_at')
+            if not isinstance(documents, list) or \
+                    not all(isinstance(doc, dict) and doc.get('session_id') for doc in documents):
+                raise ValueError('documents must be a list of events with a session_id')
+        except (BSONError, ValueError, KeyError, TypeError) as e:
+            skipped += 1
+            logger.error(f"Skipping undecodable broker message ({len(value)} bytes): {str(e)}")
+            continue
+        messages.append(message)
+    return messages, skipped
+
+
+def publish_documents(documents, context, now):
+    """Publish documents to the broker, one message per session.
+
+    Nothing touches Mongo here; sessions are upserted by the loader. Returns
+    failures for documents whose message did not fit in the producer queue,
+    and raises :class:`IngestionError` if none of them did.
+    """
+    by_session = {}
+    for index, doc in enumerate(documents):
+        by_session.setdefault(doc['session_id'], []).append(index)
+
+    broker = get_broker()
+    failures = {}
+    for session_id, indexes in by_session.items():
+        try:
+            broker.publish(
+                str(session_id).encode('utf-8'),
+                encode_message([documents[i] for i in indexes], context, now)
+            )
+        except BrokerFull as e:
+            failures.update({i: str(e) for i in indexes})
+
+    if failures and len(failures) == len(documents):
+        config = get_broker_settings()
+        raise IngestionError(
+            'Ingestion queue is full', status=config['FULL_STATUS'],
+            headers={'Retry-After': str(config['RETRY_AFTER'])}
+        )
+    return failures
+
+
+def load_messages(values):
+    """Bulk-load consumed broker messages into the event store (used by the loader worker).
+
+    Sessions are upserted once per batch with the context of their first
+    message and all documents are written with one ``append_batch``.
+    Undecodable messages are skipped. Returns the failures of
+    ``append_batch``; connection errors propagate so the caller can retry
+    without committing offsets.
+    """
+    sessions = {}
+    documents = []
+    messages, _ = decode_messages(values)
+    for message in messages:
+        for doc in message['documents']:
+            sessions.setdefault(doc['session_id'], (message['context'], message['received_at']))
+        documents.extend(message['documents'])
+
+    if not documents:
+        return {}
+    store = get_event_store()
+    if store.name == 'mongo':
+        ensure_session_contexts(sessions)
+    return store.append_batch(documents)
+
+
+def persist_documents(documents, context, now):
+    """Upsert the sessions referenced by ``documents`` and write the documents.
+
+    Returns the failures of the event store's ``append_batch`` (empty when
+    buffered); with a broker backend the documents are only published.
+    """
+    if broker_enabled():
+        return publish_documents(documents, context, now)
+    store = get_event_store()
+    if store.name == 'mongo':
+        # The SQLite store creates missing sessions itself
+        ensure_sessions({doc['session_id'] for doc in documents}, context, now)
+    if write_behind_enabled():
+        return enqueue_events(documents)
+    return store.append_batch(documents)
+
+
+def persist_mouse_moves(batch, weights, context, now):
+    """Write the points of a binary batch; returns failures indexed by point.
+
+    In bucket-only trajectory mode with inline Mongo writes the columns go
+    straight to the trajectory buckets; otherwise they become documents.
+    """
+    config = get_trajectory_settings()
+    if config['ENABLED'] and not config['KEEP_EVENTS'] and not broker_enabled() \
+            and not write_behind_enabled() and get_event_store().name == 'mongo':
+        ensure_sessions({batch.session_id}, context, now)
+        try:
+            return append_mouse_moves(batch.session_id, batch.url, batch.t, batch.x, batch.y, weights, config)
+        except Exception as e:
+            raise IngestionError(f'Failed to append trajectories: {e}')
+    return persist_documents(mouse_move_documents(batch, context, now, weights), context, now)
+
+
+def ingest_mouse_moves(batch, context):
+    """Persist a decoded binary ``mouse_move`` batch (see :mod:`.codec`)."""
+    now = datetime.utcnow()
+    received = len(batch)
+    shed = 0
+    decisions = admit_events(
+        [{'session_id': batch.session_id, 'event_type': 'mouse_move'}] * received, context
+    )
+    if decisions is not None:
+        admitted = sum(1 for decision in decisions if decision is None)
+        shed = received - admitted
+        if shed:
+            # Thin the trajectory evenly instead of cutting off its tail
+            batch = batch.take(np.unique(np.linspace(0, received - 1, admitted).round().astype(np.int64)))
+    points = len(batch)
+    kept, weights = simplify_points(batch.x, batch.y, batch.t)
+    stored = batch.take(kept)
+    failures = persist_mouse_moves(stored, weights, context, now)
+    # Every point counts as failed when the stored point standing for it failed
+    failed = int(sum(weights[index] for index in failures)) if failures else 0
+    logger.debug(
+        f"Ingested {points - failed}/{received} binary mouse_move point(s) "
+        f"as {len(stored)} document(s)"
+    )
+    return {
+        'inserted': points - failed,
+        'failed': failed,
+        'shed': shed,
+        'simplified': points - len(stored),
+    }
+
+
+def claim_event_keys(items):
+    """Claim the ``(session_id, seq)`` keys of validated items in the dedup window.
+
+    Returns ``(duplicates, keys)``: the positions (within ``items``) of
+    events already seen, and the claimed key per position (``None`` for
+    items without ``seq``) so failed writes can be released.
+    """
+    window = get_dedup_window()
+    keyed = [
+        (position, event_key(item['session_id'], item['seq']))
+        for position, item in enumerate(items) if item.get('seq') is not None
+    ]
+    keys = [None] * len(items)
+    if window is None or not keyed:
+        return set(), keys
+
+    duplicates = set()
+    for (position, key), is_new in zip(keyed, window.claim([key for _, key in keyed])):
+        if is_new:
+            keys[position] = key
+        else:
+            duplicates.add(position)
+    return duplicates, keys
+
+
+def release_event_keys(keys):
+    keys = [key for key in keys if key is not None]
+    window = get_dedup_window()
+    if keys and window is not None:
+        window.release(keys)
+
+
+def ingest_events(items, context, default_event_type=None):
+    """Validate and persist a batch of event items.
+
+    Returns ``{'inserted': n, 'failed': n, 'duplicates': n, 'results': [...]}``
+    where every result carries the index of the item it refers to. Events
+    already ingested (same ``session_id`` and ``seq``) are reported as
+    ``success`` with ``"duplicate": true`` and are not written again.
+    """
+    now = datetime.utcnow()
+    results = [None] * len(items)
+    validated = []
+    for index, (item, error) in enumerate(validate_batch(items, default_event_type)):
+        if error:
+            results[index] = {'index': index, 'status': 'error', 'error': error}
+        else:
+            validated.append((index, item))
+
+    # Only valid events draw admission tokens
+    decisions = admit_events([
+        {'session_id': item['session_id'], 'event_type': item.get('event_type') or default_event_type}
+        for _, item in validated
+    ], context) or [None] * len(validated)
+    valid = []
+    valid_positions = []
+    for (index, item), decision in zip(validated, decisions):
+        if decision:
+            results[index] = {'index': index, 'status': 'shed', 'reason': decision}
+            continue
+        valid.append(item)
+        valid_positions.append(index)
+
+    duplicates, keys = claim_event_keys(valid)
+    documents = []
+    positions = []
+    claimed = []
+    for position, item in enumerate(valid):
+        index = valid_positions[position]
+        if position in duplicates:
+            results[index] = {'index': index, 'status': 'success', 'duplicate': True}
+            continue
+        documents.append(build_event_document(item, context, now, default_event_type))
+        positions.append(index)
+        claimed.append(keys[position])
+
+    stored, owners = simplify_mouse_moves(documents)
+    if stored:
+        try:
+            failures = persist_documents(stored, context, now)
+        except Exception:
+            release_event_keys(claimed)
+            raise
+        # A failed document takes the points it was simplified from with it
+        release_event_keys([claimed[doc_index] for doc_index, owner in enumerate(owners) if owner in failures])
+        for doc_index, index in enumerate(positions):
+            owner = owners[doc_index]
+            if owner in failures:
+                results[index] = {'index': index, 'status': 'error', 'error': failures[owner]}
+            else:
+                results[index] = {'index': index, 'status': 'success'}
+
+    succeeded = sum(1 for result in results if result['status'] == 'success')
+    shed = sum(1 for decision in decisions if decision)
+    logger.debug(
+        f"Ingested {succeeded - len(duplicates)}/{len(items)} event(s), "
+        f"{len(duplicates)} duplicate(s), {shed} shed"
+    )
+    return {
+        'inserted': succeeded - len(duplicates),
+        'failed': len(items) - succeeded - shed,
+        'duplicates': len(duplicates),
+        'shed': shed,
+        'simplified': len(documents) - len(stored),
+        'rejected': len(items) - len(validated),
+        'results': results,
+    }
+
+
+def batch_status(summary):
+    """Return ``(status_label, http_status)`` for a batch summary."""
+    if summary['failed'] == 0:
+        return 'success', 200
+    if summary['inserted'] > 0 or summary.get('duplicates'):
+        return 'partial', 200
+    if summary['rejected'] + summary.get('shed', 0) == len(summary['results']):
+        return 'error', 400
+    return 'error', 500
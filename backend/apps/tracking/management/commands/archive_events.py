@@ -0,0 +1,67 @@
+"""Archive tracking events as partitioned Parquet files."""
+
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tracking.archive import (
+    ArchiveWriter, BrokerSource, ChangeStreamSource, get_archive_settings, run_archiver,
+)
+from apps.tracking.broker import broker_enabled
+from apps.tracking.utils.mongo_client import get_collection
+
+
+class Command(BaseCommand):
+    help = "Drain the events change stream (or broker topic) into a date/event_type partitioned Parquet archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', choices=['change_stream', 'broker'], default=None,
+            help="Where to read events from (default: TRACKING_ARCHIVE['SOURCE'])."
+        )
+        parser.add_argument(
+            '--path', default=None,
+            help="Archive root, local path or URI (default: TRACKING_ARCHIVE['PATH'])."
+        )
+        parser.add_argument('--flush-rows', type=int, default=None, help='Events buffered before writing files.')
+        parser.add_argument('--flush-seconds', type=float, default=None, help='Maximum seconds between flushes.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the source has no more events instead of running until interrupted.'
+        )
+
+    def handle(self, *args, **options):
+        config = get_archive_settings()
+        try:
+            writer = ArchiveWriter(path=options['path'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        source_name = options['source'] or config['SOURCE']
+        if source_name == 'broker':
+            if not broker_enabled():
+                raise CommandError("TRACKING_BROKER['BACKEND'] is not 'kafka' or 'memory'")
+            source = BrokerSource.from_settings(config['CONSUMER_GROUP'])
+        else:
+            state = writer.load_state()
+            source = ChangeStreamSource(get_collection('events'), resume_token=state.get('resume_token'))
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        archived = run_archiver(
+            writer, source,
+            flush_rows=options['flush_rows'] or config['FLUSH_ROWS'],
+            flush_seconds=options['flush_seconds'] or config['FLUSH_SECONDS'],
+            idle_exit=options['once'],
+            should_run=lambda: self.running,
+        )
+        if writer.skipped:
+            self.stderr.write(f"{writer.skipped} event(s) without a timestamp skipped")
+        if getattr(source, 'skipped', 0):
+            self.stderr.write(f"{source.skipped} undecodable broker message(s) skipped")
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} event(s) to {writer.root}"))
+
+    def stop(self, signum, frame):
+        self.running = False
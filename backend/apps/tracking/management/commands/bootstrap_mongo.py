@@ -0,0 +1,49 @@
+"""Create MongoDB collections and indexes and record the schema version."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tracking.utils.mongo_schema import (
+    SCHEMA_VERSION, bootstrap_schema, check_query_plans, get_schema_version
+)
+from apps.tracking.utils.mongo_client import get_mongo_db
+
+
+class Command(BaseCommand):
+    help = "Bootstrap the MongoDB schema (collections, indexes) and verify analytics query plans."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Re-apply collections and indexes even if the schema version is current.'
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Explain the analytics queries and fail if any of them does not use an index.'
+        )
+
+    def handle(self, *args, **options):
+        db = get_mongo_db()
+        if db is None:
+            raise CommandError('MongoDB is not available')
+
+        if bootstrap_schema(db, force=options['force']):
+            self.stdout.write(self.style.SUCCESS(f"Schema bootstrapped to version {SCHEMA_VERSION}"))
+        else:
+            self.stdout.write(f"Schema already at version {get_schema_version(db)}")
+
+        if not options['check']:
+            return
+
+        unindexed = []
+        for entry in check_query_plans(db):
+            line = f"{entry['name']}: {' -> '.join(entry['stages'])}"
+            if entry['indexes']:
+                line += f" [{', '.join(entry['indexes'])}]"
+            if entry['uses_index']:
+                self.stdout.write(self.style.SUCCESS(f"OK   {line}"))
+            else:
+                unindexed.append(entry['name'])
+                self.stdout.write(self.style.ERROR(f"SCAN {line}"))
+
+        if unindexed:
+            raise CommandError(f"Queries not using an index: {', '.join(unindexed)}")
@@ -0,0 +1,97 @@
+"""Bulk-load tracking events from the broker topic into MongoDB."""
+
+import time
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from pymongo.errors import PyMongoError
+
+from apps.tracking.broker import broker_enabled, get_broker, get_broker_settings
+from apps.tracking.ingestion import IngestionError, load_messages
+
+# Errors of an unavailable store; anything else would fail again on every retry
+RETRY_ERRORS = (PyMongoError, IngestionError, DatabaseError)
+
+
+class Command(BaseCommand):
+    help = "Consume the tracking events topic and bulk-write the events to MongoDB."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Maximum messages per Mongo bulk write (default: CONSUMER_BATCH_SIZE).'
+        )
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help='Stop after this many non-empty batches (default: run until interrupted).'
+        )
+
+    def handle(self, *args, **options):
+        if not broker_enabled():
+            raise CommandError("TRACKING_BROKER['BACKEND'] is not 'kafka' or 'memory'")
+
+        config = get_broker_settings()
+        batch_size = options['batch_size'] or config['CONSUMER_BATCH_SIZE']
+        timeout = config['CONSUMER_TIMEOUT_MS'] / 1000.0
+        consumer = get_broker().consumer()
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        batches = messages = 0
+        try:
+            while self.running:
+                values = [value for _, value in consumer.poll_batch(batch_size, timeout)]
+                if not values:
+                    continue
+                failures = self.load(values)
+                # Offsets are committed only once the batch is in Mongo
+                consumer.commit()
+                batches += 1
+                messages += len(values)
+                if failures:
+                    self.stderr.write(f"{len(failures)} event(s) rejected by MongoDB")
+                if options['max_batches'] and batches >= options['max_batches']:
+                    break
+        finally:
+            consumer.close()
+        self.stdout.write(self.style.SUCCESS(f"Loaded {messages} message(s) in {batches} batch(es)"))
+
+    def load(self, values):
+        """Write a batch; returns the failures of the rejected events.
+
+        Connection and timeout errors are retried with backoff until the
+        store accepts the batch. A batch failing otherwise is loaded message
+        by message, and a message that still fails is skipped, so one poison
+        message never blocks the offsets behind it.
+        """
+        try:
+            return self.load_retrying(values)
+        except RETRY_ERRORS:
+            raise
+        except Exception as e:
+            if len(values) == 1:
+                self.stderr.write(f"Skipping a message that cannot be loaded: {e}")
+                return {}
+            self.stderr.write(f"Bulk load of {len(values)} message(s) failed: {e}; loading them one by one")
+        failures = {}
+        for position, value in enumerate(values):
+            failures.update({(position, index): error for index, error in self.load([value]).items()})
+        return failures
+
+    def load_retrying(self, values):
+        delay = 0.5
+        while True:
+            try:
+                return load_messages(values)
+            except RETRY_ERRORS as e:
+                if not self.running:
+                    raise
+                self.stderr.write(f"Bulk load of {len(values)} message(s) failed: {e}; retrying in {delay}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -0,0 +1,154 @@
+"""Copy the plain ``events`` collection into a time-series collection.
+
+MongoDB cannot rename a time-series collection, so the copy is created
+under its final name (``<events>_ts`` by default) and the cutover switches
+``MONGODB_COLLECTIONS['events']`` (env ``MONGODB_EVENTS_COLLECTION``) to it:
+
+1. run the command while the API keeps writing; it can be interrupted and
+   rerun, and every run catches up with the events written since;
+2. pause event writes (API, ``consume_tracking_events``), then run it with
+   ``--verify``: it copies the last events and compares the counts;
+3. set ``MONGODB_EVENTS_COLLECTION`` to the target and resume writes. The
+   plain collection is left as it was and can be dropped once checked.
+
+Resuming restarts ``OVERLAP_SECONDS`` before the last copied ``_id``:
+ObjectIds are generated by the writers and may reach the server out of
+order. Events already in the target are skipped, since time-series
+collections do not enforce a unique ``_id``.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import BulkWriteError
+
+from apps.tracking.utils.mongo_client import get_mongo_db
+from apps.tracking.utils.mongo_schema import INDEXES
+from apps.tracking.utils.timeseries import (
+    add_meta, create_timeseries_collection, get_timeseries_settings, is_timeseries
+)
+
+PROGRESS_ID = 'events_timeseries_migration'
+OVERLAP_SECONDS = 300
+
+
+def resume_query(last_id, overlap_seconds=OVERLAP_SECONDS):
+    """Source query for the events that may not have been copied after ``last_id``."""
+    if last_id is None:
+        return {}
+    if isinstance(last_id, ObjectId):
+        start = ObjectId.from_datetime(last_id.generation_time - timedelta(seconds=overlap_seconds))
+        return {'_id': {'$gte': start}}
+    return {'_id': {'$gte': last_id}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy events into a time-series collection (timeField timestamp, metaField "
+        "session_id/event_type, zstd) in bulk; --verify checks it before the cutover."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', default=None,
+                            help='Name of the time-series collection (default: <events>_ts).')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Documents per insert_many.')
+        parser.add_argument('--overlap-seconds', type=int, default=OVERLAP_SECONDS,
+                            help='How far before the last copied _id a resumed copy restarts.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore recorded progress and copy from the beginning.')
+        parser.add_argument('--verify', action='store_true',
+                            help='With event writes paused: copy the last events and compare counts.')
+
+    def handle(self, *args, **options):
+        db = get_mongo_db()
+        if db is None:
+            raise CommandError('MongoDB is not available')
+
+        events_name = settings.MONGODB_COLLECTIONS.get('events', 'events')
+        target_name = options['target'] or f"{events_name}_ts"
+        if is_timeseries(db, events_name):
+            self.stdout.write(f"{events_name} is already a time-series collection")
+            return
+
+        if target_name not in db.list_collection_names():
+            config = {**get_timeseries_settings(), 'ENABLED': True}
+            create_timeseries_collection(db, target_name, config)
+            db[target_name].create_indexes(INDEXES['events'])
+            self.stdout.write(f"Created time-series collection {target_name}")
+        elif not is_timeseries(db, target_name):
+            raise CommandError(f"{target_name} exists and is not a time-series collection")
+
+        progress = db[settings.MONGODB_COLLECTIONS.get('schema_versions', 'schema_versions')]
+        if options['restart']:
+            progress.delete_one({'_id': PROGRESS_ID})
+        state = progress.find_one({'_id': PROGRESS_ID}) or {}
+
+        copied = self.copy(db[events_name], db[target_name], progress, state.get('last_id'),
+                           options['batch_size'], options['overlap_seconds'])
+        self.stdout.write(self.style.SUCCESS(f"Copied {copied} event(s) into {target_name}"))
+
+        if options['verify']:
+            self.verify(db[events_name], db[target_name], progress)
+
+    def copy(self, source, target, progress, last_id, batch_size, overlap_seconds=OVERLAP_SECONDS):
+        # After an interruption, a --restart or in the overlap, part of it was copied already
+        resuming = last_id is not None or target.find_one({}, {'_id': 1}) is not None
+        cursor = source.find(resume_query(last_id, overlap_seconds), sort=[('_id', 1)], batch_size=batch_size)
+        copied = 0
+        started = time.monotonic()
+        batch = []
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                copied += self.flush(target, progress, batch, resuming)
+                batch = []
+                rate = copied / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f"  {copied} copied ({rate:.0f} docs/s)")
+        if batch:
+            copied += self.flush(target, progress, batch, resuming)
+        return copied
+
+    def flush(self, target, progress, batch, resuming=False):
+        last_id = batch[-1]['_id']
+        if resuming:
+            ids = [doc['_id'] for doc in batch]
+            existing = {doc['_id'] for doc in target.find({'_id': {'$in': ids}}, {'_id': 1})}
+            batch = [doc for doc in batch if doc['_id'] not in existing]
+        # Events without a timestamp cannot go into a time-series collection
+        documents = add_meta([doc for doc in batch if isinstance(doc.get('timestamp'), datetime)])
+        skipped = len(batch) - len(documents)
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"  skipped {skipped} event(s) without a timestamp"))
+        failed = 0
+        if documents:
+            try:
+                target.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                failed = len(e.details.get('writeErrors', []))
+                self.stdout.write(self.style.WARNING(f"  {failed} event(s) failed to copy"))
+        progress.update_one(
+            {'_id': PROGRESS_ID},
+            {'$set': {'last_id': last_id, 'updated_at': datetime.utcnow()}},
+            upsert=True
+        )
+        return len(documents) - failed
+
+    def verify(self, source, target, progress):
+        """Compare the copyable source events with the target; raise on a mismatch."""
+        expected = source.count_documents({'timestamp': {'$type': 'date'}})
+        actual = target.count_documents({})
+        skipped = source.count_documents({}) - expected
+        if actual != expected:
+            raise CommandError(
+                f"{target.name} holds {actual} event(s), {source.name} {expected} with a timestamp; "
+                f"check that event writes are paused and run --verify again"
+            )
+        progress.delete_one({'_id': PROGRESS_ID})
+        self.stdout.write(self.style.SUCCESS(
+            f"Verified {actual} event(s) ({skipped} without a timestamp not copied). "
+            f"Set MONGODB_EVENTS_COLLECTION={target.name}, then resume event writes."
+        ))
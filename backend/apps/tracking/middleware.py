@@ -0,0 +1,229 @@
+"""Transparent ``Content-Encoding`` decoding for tracking request bodies.
+
+Trackers may send ``gzip``, ``deflate`` or ``br`` compressed bodies to any
+endpoint under ``/api/tracking/``; the body is inflated here, before DRF or
+the plain Django views read it, so the views only ever see raw JSON (or the
+binary mouse_move format). Inflation stops at ``MAX_DECOMPRESSED_BYTES`` so a
+small zip bomb cannot exhaust memory.
+"""
+
+import io
+import time
+import zlib
+import logging
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+try:
+    import brotli
+except ImportError:  # br bodies are answered with 415
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DECOMPRESSION_DEFAULTS = {
+    'PATH_PREFIX': '/api/tracking/',
+    'MAX_DECOMPRESSED_BYTES': 10 * 1024 * 1024,
+}
+
+
+class DecompressionError(ValueError):
+    """Raised when a request body cannot be decoded; carries the HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def get_decompression_settings():
+    return {**DECOMPRESSION_DEFAULTS, **getattr(settings, 'TRACKING_DECOMPRESSION', {})}
+
+
+class DecompressionStats:
+    """Per-encoding counters: wire bytes, inflated bytes and CPU time spent."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, encoding, compressed, decompressed=0, cpu=0.0, error=None):
+        with self._lock:
+            counters = self._counters.setdefault(encoding, {
+                'requests': 0,
+                'compressed_bytes': 0,
+                'decompressed_bytes': 0,
+                'cpu_seconds': 0.0,
+                'errors': 0,
+                'too_large': 0,
+            })
+            counters['requests'] += 1
+            counters['cpu_seconds'] += cpu
+            if error == 'too_large':
+                counters['too_large'] += 1
+            elif error:
+                counters['errors'] += 1
+            else:
+                # Only decoded bodies count towards the bandwidth figures
+                counters['compressed_bytes'] += compressed
+                counters['decompressed_bytes'] += decompressed
+
+    def stats(self):
+        with self._lock:
+            snapshot = {encoding: dict(c) for encoding, c in self._counters.items()}
+        for counters in snapshot.values():
+            saved = counters['decompressed_bytes'] - counters['compressed_bytes']
+            counters['bytes_saved'] = max(saved, 0)
+            counters['ratio'] = (
+                round(counters['decompressed_bytes'] / counters['compressed_bytes'], 2)
+                if counters['compressed_bytes'] else None
+            )
+            counters['cpu_seconds'] = round(counters['cpu_seconds'], 6)
+        return snapshot
+
+
+decompression_stats = DecompressionStats()
+
+
+def _inflate_zlib(body, wbits, limit):
+    decompressor = zlib.decompressobj(wbits)
+    try:
+        data = decompressor.decompress(body, limit + 1)
+    except zlib.error as e:
+        raise DecompressionError(f'Invalid compressed body: {e}')
+    if len(data) > limit or decompressor.unconsumed_tail:
+        raise DecompressionError('Decompressed body too large', status=413)
+    if not decompressor.eof:
+        raise DecompressionError('Truncated compressed body')
+    return data, decompressor.unused_data
+
+
+def _inflate_gzip(body, limit):
+    # Streaming clients may send several gzip members back to back
+    members = []
+    while True:
+        data, body = _inflate_zlib(body, 16 + zlib.MAX_WBITS, limit)
+        members.append(data)
+        limit -= len(data)
+        if not body.strip(b'\0'):
+            return b''.join(members)
+
+
+def _inflate_single(body, wbits, limit):
+    data, trailing = _inflate_zlib(body, wbits, limit)
+    if trailing:
+        raise DecompressionError('Trailing data after the compressed body')
+    return data
+
+
+def _inflate_deflate(body, limit):
+    # "deflate" is zlib-wrapped per RFC 9110, but some clients send raw deflate
+    try:
+        return _inflate_single(body, zlib.MAX_WBITS, limit)
+    except DecompressionError as e:
+        if e.status != 400:
+            raise
+        return _inflate_single(body, -zlib.MAX_WBITS, limit)
+
+
+def _inflate_brotli(body, limit):
+    if brotli is None:
+        raise DecompressionError('br encoding is not supported (brotli not installed)', status=415)
+    decompressor = brotli.Decompressor()
+    try:
+        data = decompressor.process(body, output_buffer_limit=limit + 1)
+    except TypeError:
+        # brotli < 1.2 cannot bound its output; check the size afterwards
+        try:
+            data = decompressor.process(body)
+        except brotli.error as e:
+            raise DecompressionError(f'Invalid compressed body: {e}')
+    except brotli.error as e:
+        raise DecompressionError(f'Invalid compressed body: {e}')
+    if len(data) > limit:
+        raise DecompressionError('Decompressed body too large', status=413)
+    if not decompressor.is_finished():
+        raise DecompressionError('Truncated compressed body')
+    return data
+
+
+DECODERS = {
+    'gzip': _inflate_gzip,
+    'x-gzip': _inflate_gzip,
+    'deflate': _inflate_deflate,
+    'br': _inflate_brotli,
+}
+
+
+def decompress_body(body, encoding, limit):
+    """Inflate ``body`` according to a single ``Content-Encoding`` token."""
+    decoder = DECODERS.get(encoding)
+    if decoder is None:
+        raise DecompressionError(f'Unsupported Content-Encoding: {encoding}', status=415)
+    return decoder(body, limit)
+
+
+class DecompressRequestMiddleware:
+    """Inflate compressed request bodies on the tracking endpoints.
+
+    Works for both WSGI and ASGI; inflation is bounded CPU work on an
+    already-buffered body, so it runs inline in either mode.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_decompression_settings()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.process_request(request)
+        return response or self.get_response(request)
+
+    async def __acall__(self, request):
+        response = self.process_request(request)
+        return response or await self.get_response(request)
+
+    def process_request(self, request):
+        if not request.path.startswith(self.config['PATH_PREFIX']):
+            return None
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if not encoding:
+            return None
+
+        body = request.body
+        if encoding == 'identity':
+            decompression_stats.record('identity', len(body), len(body))
+            return None
+
+        started = time.thread_time()
+        try:
+            data = decompress_body(body, encoding, self.config['MAX_DECOMPRESSED_BYTES'])
+        except DecompressionError as e:
+            decompression_stats.record(
+                encoding if encoding in DECODERS else 'unsupported', len(body),
+                cpu=time.thread_time() - started,
+                error='too_large' if e.status == 413 else 'invalid'
+            )
+            logger.warning(f"Rejected {encoding} body on {request.path}: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=e.status)
+        decompression_stats.record(encoding, len(body), len(data), time.thread_time() - started)
+
+        # Replace the body so request.body, request.read() and DRF parsers
+        # all see the inflated payload.
+        request._body = data
+        request._stream = io.BytesIO(data)
+        request.META['CONTENT_LENGTH'] = str(len(data))
+        del request.META['HTTP_CONTENT_ENCODING']
+        return None
+
+
+def get_decompression_stats():
+    return decompression_stats.stats()
@@ -5,5 +5,6 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
-    re_path(r'ws/tracking/$', consumers.TrackingConsumer.as_asgi()),
+    re_path(r'ws/tracking/live/?$', consumers.LiveTrackingConsumer.as_asgi()),
+    re_path(r'ws/tracking/?$', consumers.TrackingConsumer.as_asgi()),
 ] 
\ No newline at end of file
@@ -0,0 +1,273 @@
+"""Declarative ``data`` schemas per event type, compiled into batch validators.
+
+Each entry of :data:`EVENT_SCHEMAS` maps a field of ``event['data']`` to its
+type (``number``, ``int``, ``str``, ``bool`` or ``object``) and whether it is
+required. Schemas are compiled once into closures that check and coerce a
+``data`` dict in a single pass: numeric strings such as ``"120"`` become
+numbers at the edge, so downstream analytics can trust ``x``/``y`` without
+re-checking every row. Fields not declared in a schema are kept as sent.
+
+Event types emitted by the trackers that have no schema of their own are
+mapped through :data:`EVENT_TYPE_ALIASES` (``custom_*`` uses ``custom``);
+anything else falls back to the permissive ``custom`` schema unless
+``TRACKING_SCHEMA['STRICT_EVENT_TYPES']`` is set. Resolved validators are
+cached until that setting changes. Every event must carry a UUID string
+``session_id``.
+"""
+
+import math
+import uuid
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+SCHEMA_DEFAULTS = {
+    'STRICT_EVENT_TYPES': False,
+}
+
+REQUIRED = True
+
+EVENT_SCHEMAS = {
+    'mouse_move': {
+        'x': ('number', REQUIRED),
+        'y': ('number', REQUIRED),
+        'window_width': 'number',
+        'window_height': 'number',
+        'screenX': 'number',
+        'screenY': 'number',
+        'target': 'object',
+    },
+    'mouse_click': {
+        'x': ('number', REQUIRED),
+        'y': ('number', REQUIRED),
+        'button': 'int',
+        'element_tag': 'str',
+        'element_id': 'str',
+        'window_width': 'number',
+        'window_height': 'number',
+        'target': 'object',
+    },
+    'scroll': {
+        'scroll_x': 'number',
+        'scroll_y': 'number',
+        'document_height': 'number',
+        'viewport_height': 'number',
+        'scrollX': 'number',
+        'scrollY': 'number',
+        'scrollHeight': 'number',
+        'scrollWidth': 'number',
+        'viewportHeight': 'number',
+        'viewportWidth': 'number',
+    },
+    'form_input': {
+        'element_tag': 'str',
+        'element_id': 'str',
+        'element_name': 'str',
+        'input_type': 'str',
+        'has_value': 'bool',
+        'field': 'object',
+        'fieldType': 'str',
+        'formId': 'str',
+    },
+    'page_view': {
+        'title': 'str',
+        'path': 'str',
+    },
+    'custom': {},
+}
+
+EVENT_TYPE_ALIASES = {
+    'form_change': 'form_input',
+    'page_unload': 'page_view',
+    'page_focus': 'custom',
+    'form_submit': 'custom',
+    'visibility_change': 'custom',
+}
+
+
+class SchemaError(ValueError):
+    """Raised when an event does not match its schema."""
+
+
+def _number(value):
+    if isinstance(value, bool):
+        raise SchemaError('expected a number')
+    if isinstance(value, (int, float)):
+        number = value
+    elif isinstance(value, str):
+        try:
+            number = float(value) if any(c in value for c in '.eE') else int(value)
+        except ValueError:
+            raise SchemaError('expected a number')
+    else:
+        raise SchemaError('expected a number')
+    if isinstance(number, float) and not math.isfinite(number):
+        raise SchemaError('expected a finite number')
+    return number
+
+
+def _int(value):
+    number = _number(value)
+    if isinstance(number, float):
+        if not number.is_integer():
+            raise SchemaError('expected an integer')
+        number = int(number)
+    return number
+
+
+def _str(value):
+    if not isinstance(value, str):
+        raise SchemaError('expected a string')
+    return value
+
+
+def _bool(value):
+    if not isinstance(value, bool):
+        raise SchemaError('expected a boolean')
+    return value
+
+
+def _object(value):
+    if not isinstance(value, dict):
+        raise SchemaError('expected an object')
+    return value
+
+
+FIELD_TYPES = {
+    'number': _number,
+    'int': _int,
+    'str': _str,
+    'bool': _bool,
+    'object': _object,
+}
+
+
+def compile_schema(schema):
+    """Compile a declarative schema into ``validator(data) -> data``.
+
+    The validator returns a shallow copy of ``data`` with declared fields
+    coerced, or raises :class:`SchemaError`. ``None`` is accepted for
+    optional fields (trackers send ``null`` for missing element ids).
+    """
+    fields = []
+    for name, spec in schema.items():
+        type_name, required = spec if isinstance(spec, tuple) else (spec, False)
+        fields.append((name, FIELD_TYPES[type_name], required))
+    fields = tuple(fields)
+    required_names = tuple(name for name, _, required in fields if required)
+
+    def validate(data):
+        if not isinstance(data, dict):
+            raise SchemaError('data must be an object')
+        for name in required_names:
+            if data.get(name) is None:
+                raise SchemaError(f'data.{name} is required')
+        cleaned = dict(data)
+        for name, coerce, _ in fields:
+            value = data.get(name)
+            if value is None:
+                continue
+            try:
+                cleaned[name] = coerce(value)
+            except SchemaError as e:
+                raise SchemaError(f'data.{name}: {e}')
+        return cleaned
+
+    return validate
+
+
+VALIDATORS = {event_type: compile_schema(schema) for event_type, schema in EVENT_SCHEMAS.items()}
+
+_validator_cache = {}
+_validator_cache_lock = threading.Lock()
+
+
+@receiver(setting_changed)
+def _clear_validator_cache(setting, **kwargs):
+    # Resolved validators depend on STRICT_EVENT_TYPES
+    if setting == 'TRACKING_SCHEMA':
+        with _validator_cache_lock:
+            _validator_cache.clear()
+
+
+def get_schema_settings():
+    return {**SCHEMA_DEFAULTS, **getattr(settings, 'TRACKING_SCHEMA', {})}
+
+
+def get_validator(event_type):
+    """Return the compiled validator for ``event_type`` (``None`` if unknown in strict mode)."""
+    try:
+        return _validator_cache[event_type]
+    except KeyError:
+        pass
+
+    schema_name = EVENT_TYPE_ALIASES.get(event_type, event_type)
+    if schema_name not in VALIDATORS and str(event_type).startswith('custom_'):
+        schema_name = 'custom'
+    validator = VALIDATORS.get(schema_name)
+    if validator is None and not get_schema_settings()['STRICT_EVENT_TYPES']:
+        validator = VALIDATORS['custom']
+
+    with _validator_cache_lock:
+        if len(_validator_cache) < 1024:
+            _validator_cache[event_type] = validator
+    return validator
+
+
+def clean_data(event_type, data):
+    """Validate and coerce one event's ``data``; raises :class:`SchemaError`."""
+    validator = get_validator(event_type)
+    if validator is None:
+        raise SchemaError(f'Unknown event_type: {event_type}')
+    return validator({} if data is None else data)
+
+
+def parse_session_id(value):
+    """``value`` as a canonical UUID string, or ``None`` if it is not a UUID."""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    try:
+        return str(uuid.UUID(str(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_batch(items, default_event_type=None):
+    """Check a whole batch in one pass.
+
+    Returns a list with, for every item, either ``(cleaned_item, None)`` or
+    ``(None, error_message)``. Cleaned items carry the resolved
+    ``event_type`` and coerced ``data``.
+    """
+    results = []
+    append = results.append
+    for item in items:
+        if not isinstance(item, dict):
+            append((None, 'Invalid data format. Expected JSON object'))
+            continue
+        session_id = item.get('session_id')
+        if not session_id:
+            append((None, 'session_id is required'))
+            continue
+        if not isinstance(session_id, str) or parse_session_id(session_id) is None:
+            append((None, 'session_id must be a UUID string'))
+            continue
+        event_type = item.get('event_type') or default_event_type
+        if not event_type:
+            append((None, 'event_type is required'))
+            continue
+        if not isinstance(event_type, str):
+            append((None, 'event_type must be a string'))
+            continue
+        try:
+            data = clean_data(event_type, item.get('data'))
+        except SchemaError as e:
+            append((None, f'{event_type}: {e}'))
+            continue
+        cleaned = dict(item)
+        cleaned['event_type'] = event_type
+        cleaned['data'] = data
+        append((cleaned, None))
+    return results
@@ -0,0 +1,171 @@
+"""Server-side simplification of ``mouse_move`` trajectories.
+
+Before a batch is persisted, each session's consecutive ``mouse_move``
+documents are reduced to the points that carry the shape of the path:
+
+* ``rdp`` (default): Ramer–Douglas–Peucker, dropping points closer than
+  ``TOLERANCE_PX`` to the simplified polyline;
+* ``threshold``: keep a point once the cursor moved ``MIN_DISTANCE_PX`` from
+  the last kept one, or ``MAX_INTERVAL_MS`` passed (when the documents carry
+  a ``client_timestamp``: binary batches, and JSON events sent with the
+  tracker's ``timestamp``; otherwise the method is distance-only).
+
+Any other event of the session (clicks, scrolls, ...) ends the current run,
+and the first and last points of every run are always kept, so the cursor
+position around a click is never lost. Each kept point stores in ``weight``
+the number of original points it stands for (itself plus the dropped points
+that followed it), so heatmaps can reweight; ``1 / weight`` is the local
+kept-point ratio. Points without ``weight`` were stored as-is.
+"""
+
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+
+from .utils.trajectory_store import naive_utc
+
+EPOCH = datetime(1970, 1, 1)
+
+SIMPLIFY_DEFAULTS = {
+    'ENABLED': True,
+    'METHOD': 'rdp',            # 'rdp' or 'threshold'
+    'TOLERANCE_PX': 3.0,        # rdp: max distance of a dropped point to the path
+    'MIN_DISTANCE_PX': 10.0,    # threshold: distance from the last kept point
+    'MAX_INTERVAL_MS': 1000,    # threshold: time since the last kept point
+    'MIN_POINTS': 3,            # shorter runs are stored as-is
+}
+
+
+def get_simplify_settings():
+    return {**SIMPLIFY_DEFAULTS, **getattr(settings, 'TRACKING_SIMPLIFY', {})}
+
+
+def rdp_mask(points, tolerance):
+    """Boolean mask of the points kept by Ramer–Douglas–Peucker (iterative)."""
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        inner = points[start + 1:end]
+        dx, dy = b - a
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            distances = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        else:
+            distances = np.abs(dx * (inner[:, 1] - a[1]) - dy * (inner[:, 0] - a[0])) / norm
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def threshold_mask(points, times_ms, min_distance, max_interval_ms):
+    """Boolean mask keeping a point after ``min_distance`` px or ``max_interval_ms``."""
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    last = 0
+    for i in range(1, n - 1):
+        moved = np.hypot(*(points[i] - points[last])) >= min_distance
+        waited = times_ms is not None and times_ms[i] - times_ms[last] >= max_interval_ms
+        if moved or waited:
+            keep[i] = True
+            last = i
+    return keep
+
+
+def _client_times_ms(documents):
+    times = [doc.get('client_timestamp') for doc in documents]
+    if any(t is None for t in times):
+        return None
+    return np.array([(naive_utc(t) - EPOCH).total_seconds() * 1000.0 for t in times])
+
+
+def _runs(documents):
+    """Yield index lists of consecutive ``mouse_move`` documents per session."""
+    current = {}
+    for index, doc in enumerate(documents):
+        session_id = doc['session_id']
+        if doc['event_type'] == 'mouse_move':
+            current.setdefault(session_id, []).append(index)
+        elif session_id in current:
+            yield current.pop(session_id)
+    yield from current.values()
+
+
+def simplify_points(x, y, times_ms=None, config=None):
+    """Simplify one run of points given as columns.
+
+    Returns ``(kept, weights)``: the indexes of the kept points and, for
+    each, the number of original points it stands for.
+    """
+    config = config or get_simplify_settings()
+    n = len(x)
+    if not config['ENABLED'] or n < config['MIN_POINTS']:
+        return np.arange(n), np.ones(n, dtype=np.int64)
+    points = np.column_stack((x, y)).astype(np.float64)
+    if config['METHOD'] == 'threshold':
+        keep = threshold_mask(points, times_ms, config['MIN_DISTANCE_PX'], config['MAX_INTERVAL_MS'])
+    else:
+        keep = rdp_mask(points, config['TOLERANCE_PX'])
+    kept = np.flatnonzero(keep)
+    return kept, np.diff(np.append(kept, n))
+
+
+def simplify_mouse_moves(documents, config=None):
+    """Simplify the ``mouse_move`` runs of a batch of ``events`` documents.
+
+    Returns ``(stored, owners)``: the documents to persist, in their
+    original order, and for every input document the index in ``stored`` of
+    the document that represents it.
+    """
+    config = config or get_simplify_settings()
+    owners = list(range(len(documents)))
+    if not config['ENABLED']:
+        return documents, owners
+
+    dropped = np.zeros(len(documents), dtype=bool)
+    weights = {}
+    for run in _runs(documents):
+        if len(run) < config['MIN_POINTS']:
+            continue
+        run_docs = [documents[i] for i in run]
+        kept_at, counts = simplify_points(
+            [doc['data']['x'] for doc in run_docs], [doc['data']['y'] for doc in run_docs],
+            _client_times_ms(run_docs), config
+        )
+        if len(kept_at) == len(run):
+            continue
+
+        for position, count in zip(kept_at.tolist(), counts.tolist()):
+            if count > 1:
+                weights[run[position]] = count
+        keep = np.zeros(len(run), dtype=bool)
+        keep[kept_at] = True
+        for position in np.flatnonzero(~keep).tolist():
+            dropped[run[position]] = True
+            # Dropped points are represented by the kept point before them
+            owners[run[position]] = run[kept_at[np.searchsorted(kept_at, position) - 1]]
+
+    if not dropped.any():
+        return documents, owners
+
+    stored = []
+    stored_index = {}
+    for index, doc in enumerate(documents):
+        if dropped[index]:
+            continue
+        if index in weights:
+            doc = {**doc, 'weight': weights[index]}
+        stored_index[index] = len(stored)
+        stored.append(doc)
+    return stored, [stored_index[owner] for owner in owners]
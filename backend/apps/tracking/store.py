@@ -0,0 +1,395 @@
+"""Single interface over the tracking event stores.
+
+Events used to be written to Mongo by ingestion, dual-written to SQLite by
+some endpoints and read back from either (or both, merged in Python). All
+writes and reads now go through one :class:`EventStore`, selected by
+``TRACKING_EVENT_STORE['BACKEND']``:
+
+* ``mongo``: the ``events`` collection (plus trajectory buckets, see
+  :mod:`.utils.trajectory_store`), written by :func:`.ingestion.write_events`;
+* ``sqlite``: the Django ``Event`` model.
+
+Every query hits exactly one store and one of its indexes. Scans return
+columnar chunks: dicts of equally long NumPy arrays keyed by column name
+(see ``COLUMNS``), with ``timestamp`` as naive UTC ``datetime64[ms]`` and
+``x``/``y`` as float64 (``nan`` when the event has no coordinates).
+"""
+
+import logging
+import os
+import re
+import threading
+from datetime import timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .bulk import bulk_create_events, invalid_session_ids
+from .models import Event, Session
+from .utils.mongo_client import get_collection
+from .utils.trajectory_store import EVENT_TYPE_CODES, get_trajectory_settings, naive_utc, read_session_trajectory
+
+logger = logging.getLogger(__name__)
+
+STORE_DEFAULTS = {
+    'BACKEND': 'mongo',          # 'mongo' or 'sqlite'
+    'CHUNK_SIZE': 10000,
+}
+
+COLUMNS = ('session_id', 'event_type', 'timestamp', 'url', 'x', 'y', 'weight', 'data')
+DEFAULT_COLUMNS = ('session_id', 'event_type', 'timestamp', 'url', 'x', 'y', 'weight')
+POSITIONAL_EVENT_TYPES = ('mouse_move', 'mouse_click')
+
+_DTYPES = {
+    'session_id': object,
+    'event_type': object,
+    'timestamp': 'datetime64[ms]',
+    'url': object,
+    'x': np.float64,
+    'y': np.float64,
+    'weight': np.int32,
+    'data': object,
+}
+
+
+def get_store_settings():
+    return {**STORE_DEFAULTS, **getattr(settings, 'TRACKING_EVENT_STORE', {})}
+
+
+def empty_chunk(columns=DEFAULT_COLUMNS):
+    return {name: np.empty(0, dtype=_DTYPES[name]) for name in columns}
+
+
+def concat_chunks(chunks, columns=DEFAULT_COLUMNS):
+    """Concatenate chunks column by column (an empty chunk if there are none)."""
+    chunks = list(chunks)
+    if not chunks:
+        return empty_chunk(columns)
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+def _chunk(rows, columns):
+    """Build a columnar chunk from ``rows`` (dicts with the ``COLUMNS`` keys)."""
+    chunk = {}
+    for name in columns:
+        if name in ('x', 'y'):
+            chunk[name] = np.fromiter((_number(row.get(name)) for row in rows), dtype=np.float64, count=len(rows))
+        elif name == 'weight':
+            chunk[name] = np.fromiter((row.get('weight') or 1 for row in rows), dtype=np.int32, count=len(rows))
+        elif name == 'timestamp':
+            chunk[name] = np.array([naive_utc(row['timestamp']) for row in rows], dtype='datetime64[ms]')
+        else:
+            values = np.empty(len(rows), dtype=object)
+            values[:] = [row.get(name) for row in rows]
+            chunk[name] = values
+    return chunk
+
+
+def _sort_chunk(chunk):
+    order = np.argsort(chunk['timestamp'], kind='stable')
+    return {name: values[order] for name, values in chunk.items()}
+
+
+class EventStore:
+    """Append and read tracking events.
+
+    ``start``/``end`` bound timestamps as ``[start, end)``; aware datetimes
+    are converted to UTC and naive ones are taken as UTC.
+    """
+
+    name = None
+
+    def __init__(self, chunk_size=10000):
+        self.chunk_size = chunk_size
+
+    def append_batch(self, documents):
+        """Write ingestion documents; returns ``{index: error}`` for failed ones."""
+        raise NotImplementedError
+
+    def scan(self, start=None, end=None, event_types=None, url_contains=None, session_id=None,
+             columns=DEFAULT_COLUMNS, descending=False, limit=None):
+        """Yield columnar chunks of matching events, each in timestamp order."""
+        raise NotImplementedError
+
+    def read_session(self, session_id, event_types=None, columns=COLUMNS):
+        """All events of a session as one columnar chunk, ordered by time."""
+        return _sort_chunk(concat_chunks(
+            self.scan(session_id=session_id, event_types=event_types, columns=columns), columns
+        ))
+
+    def count_session(self, session_id):
+        """Number of stored events of a session."""
+        raise NotImplementedError
+
+    def session_ids(self, start=None, end=None):
+        """Ids (strings) of the sessions started in ``[start, end)``."""
+        raise NotImplementedError
+
+
+class MongoEventStore(EventStore):
+    """``events`` collection, plus trajectory buckets for bucket-only ``mouse_move``."""
+
+    name = 'mongo'
+
+    def append_batch(self, documents):
+        from .ingestion import write_events
+        return write_events(documents)
+
+    def _collection(self, key='events'):
+        collection = get_collection(key)
+        if collection is None:
+            raise RuntimeError(f'MongoDB {key} collection is not available')
+        return collection
+
+    def scan(self, start=None, end=None, event_types=None, url_contains=None, session_id=None,
+             columns=DEFAULT_COLUMNS, descending=False, limit=None):
+        query = {}
+        if start is not None or end is not None:
+            query['timestamp'] = {}
+            if start is not None:
+                query['timestamp']['$gte'] = naive_utc(start)
+            if end is not None:
+                query['timestamp']['$lt'] = naive_utc(end)
+        if event_types is not None:
+            query['event_type'] = {'$in': list(event_types)}
+        if url_contains:
+            query['url'] = {'$regex': re.escape(url_contains)}
+        if session_id is not None:
+            query['session_id'] = str(session_id)
+
+        projection = {'_id': 0}
+        for name in columns:
+            if name in ('x', 'y'):
+                projection[f'data.{name}'] = 1
+            else:
+                projection[name] = 1
+        if 'data' in columns:
+            projection = {key: value for key, value in projection.items() if not key.startswith('data.')}
+
+        cursor = self._collection().find(query, projection, batch_size=self.chunk_size)
+        cursor = cursor.sort('timestamp', -1 if descending else 1)
+        if limit:
+            cursor = cursor.limit(limit)
+
+        rows = []
+        for doc in cursor:
+            data = doc.get('data') or {}
+            doc['x'], doc['y'] = data.get('x'), data.get('y')
+            rows.append(doc)
+            if len(rows) >= self.chunk_size:
+                yield _chunk(rows, columns)
+                rows = []
+        if rows:
+            yield _chunk(rows, columns)
+
+        if not limit and self._moves_in_buckets(event_types):
+            yield from self._scan_buckets(start, end, url_contains, session_id, columns)
+
+    def _moves_in_buckets(self, event_types):
+        config = get_trajectory_settings()
+        return (config['ENABLED'] and not config['KEEP_EVENTS']
+                and (event_types is None or 'mouse_move' in event_types))
+
+    def _scan_buckets(self, start, end, url_contains, session_id, columns):
+        """``mouse_move`` points stored only in trajectory buckets, one chunk per batch of buckets."""
+        config = get_trajectory_settings()
+        query = {}
+        if start is not None or end is not None:
+            query['bucket_start'] = {}
+            if start is not None:
+                query['bucket_start']['$gte'] = naive_utc(start) - timedelta(seconds=config['WINDOW_SECONDS'])
+            if end is not None:
+                query['bucket_start']['$lt'] = naive_utc(end)
+        if url_contains:
+            query['url'] = {'$regex': re.escape(url_contains)}
+        if session_id is not None:
+            query['session_id'] = str(session_id)
+
+        start_ms = np.datetime64(naive_utc(start), 'ms') if start is not None else None
+        end_ms = np.datetime64(naive_utc(end), 'ms') if end is not None else None
+        move = EVENT_TYPE_CODES['mouse_move']
+        parts = []
+        points = 0
+        for bucket in self._collection('trajectories').find(query, batch_size=100):
+            e = np.asarray(bucket['e'], dtype=np.int8)
+            t = np.datetime64(bucket['bucket_start'], 'ms') + np.asarray(bucket['t'], dtype='timedelta64[ms]')
+            keep = e == move
+            if start_ms is not None:
+                keep &= t >= start_ms
+            if end_ms is not None:
+                keep &= t < end_ms
+            count = int(keep.sum())
+            if not count:
+                continue
+            weights = np.asarray(bucket.get('w') or [1] * len(e), dtype=np.int32)
+            part = {
+                'session_id': np.full(count, bucket['session_id'], dtype=object),
+                'event_type': np.full(count, 'mouse_move', dtype=object),
+                'timestamp': t[keep],
+                'url': np.full(count, bucket.get('url', ''), dtype=object),
+                'x': np.asarray(bucket['x'], dtype=np.float64)[keep],
+                'y': np.asarray(bucket['y'], dtype=np.float64)[keep],
+                'weight': weights[keep],
+            }
+            if 'data' in columns:
+                part['data'] = np.empty(count, dtype=object)
+                part['data'][:] = [{'x': x, 'y': y} for x, y in zip(part['x'].tolist(), part['y'].tolist())]
+            parts.append({name: part[name] for name in columns})
+            points += count
+            if points >= self.chunk_size:
+                yield _sort_chunk(concat_chunks(parts, columns))
+                parts, points = [], 0
+        if parts:
+            yield _sort_chunk(concat_chunks(parts, columns))
+
+    def read_session(self, session_id, event_types=None, columns=COLUMNS):
+        config = get_trajectory_settings()
+        if config['ENABLED'] and event_types is not None and set(event_types) <= set(POSITIONAL_EVENT_TYPES):
+            # Vài bucket cho cả session thay vì từng event
+            return self._trajectory_chunk(read_session_trajectory(session_id), event_types, columns)
+        return super().read_session(session_id, event_types, columns)
+
+    def _trajectory_chunk(self, trajectory, event_types, columns):
+        names = trajectory.event_type_names()
+        keep = np.isin(names, list(event_types))
+        count = int(keep.sum())
+        chunk = {
+            'session_id': np.full(count, trajectory.session_id, dtype=object),
+            'event_type': names[keep].astype(object),
+            'timestamp': trajectory.t[keep].astype('datetime64[ms]'),
+            'url': trajectory.url[keep],
+            'x': trajectory.x[keep],
+            'y': trajectory.y[keep],
+            'weight': trajectory.weight[keep],
+        }
+        if 'data' in columns:
+            chunk['data'] = np.empty(count, dtype=object)
+            chunk['data'][:] = [{'x': x, 'y': y} for x, y in zip(chunk['x'].tolist(), chunk['y'].tolist())]
+        return {name: chunk[name] for name in columns}
+
+    def count_session(self, session_id):
+        return self._collection().count_documents({'session_id': str(session_id)})
+
+    def session_ids(self, start=None, end=None):
+        time_range = {}
+        if start is not None:
+            time_range['$gte'] = naive_utc(start)
+        if end is not None:
+            time_range['$lt'] = naive_utc(end)
+        # Ingestion records created_at, SessionView records start_time
+        query = {'$or': [{'created_at': time_range}, {'start_time': time_range}]} if time_range else {}
+        return {str(session_id) for session_id in self._collection('sessions').distinct('session_id', query)}
+
+
+class SQLiteEventStore(EventStore):
+    """Django ``Event`` model (SQLite by default)."""
+
+    name = 'sqlite'
+
+    def append_batch(self, documents):
+        # Malformed session ids fail their own event, not the batch
+        failures = invalid_session_ids(documents)
+        bulk_create_events([
+            {**doc, 'data': self._event_data(doc)}
+            for index, doc in enumerate(documents) if index not in failures
+        ], create_sessions=True, batch_size=self.chunk_size)
+        return failures
+
+    @staticmethod
+    def _event_data(doc):
+        # The weight of simplified mouse_move points has no column of its own
+        data = doc.get('data') or {}
+        if doc.get('weight'):
+            data = {**data, 'weight': doc['weight']}
+        return data
+
+    @staticmethod
+    def _orm_datetime(value):
+        if value is None:
+            return None
+        if settings.USE_TZ and timezone.is_naive(value):
+            return timezone.make_aware(value, dt_timezone.utc)
+        return value
+
+    def _queryset(self, start=None, end=None, event_types=None, url_contains=None, session_id=None):
+        queryset = Event.objects.all()
+        if start is not None:
+            queryset = queryset.filter(timestamp__gte=self._orm_datetime(start))
+        if end is not None:
+            queryset = queryset.filter(timestamp__lt=self._orm_datetime(end))
+        if event_types is not None:
+            queryset = queryset.filter(event_type__in=list(event_types))
+        if url_contains:
+            queryset = queryset.filter(url__contains=url_contains)
+        if session_id is not None:
+            queryset = queryset.filter(session_id=session_id)
+        return queryset
+
+    def scan(self, start=None, end=None, event_types=None, url_contains=None, session_id=None,
+             columns=DEFAULT_COLUMNS, descending=False, limit=None):
+        queryset = self._queryset(start, end, event_types, url_contains, session_id)
+        queryset = queryset.order_by('-timestamp' if descending else 'timestamp')
+        if limit:
+            queryset = queryset[:limit]
+
+        # x/y/weight are read as JSON key transforms instead of the whole data blob
+        fields = {'x': 'data__x', 'y': 'data__y', 'weight': 'data__weight'}
+        names = list(columns)
+        lookups = [fields.get(name, name) for name in names]
+
+        rows = []
+        for values in queryset.values_list(*lookups).iterator(chunk_size=self.chunk_size):
+            row = dict(zip(names, values))
+            if 'session_id' in row:
+                row['session_id'] = str(row['session_id'])
+            rows.append(row)
+            if len(rows) >= self.chunk_size:
+                yield _chunk(rows, columns)
+                rows = []
+        if rows:
+            yield _chunk(rows, columns)
+
+    def count_session(self, session_id):
+        return Event.objects.filter(session_id=session_id).count()
+
+    def session_ids(self, start=None, end=None):
+        queryset = Session.objects.all()
+        if start is not None:
+            queryset = queryset.filter(start_time__gte=self._orm_datetime(start))
+        if end is not None:
+            queryset = queryset.filter(start_time__lt=self._orm_datetime(end))
+        return {str(session_id) for session_id in queryset.values_list('session_id', flat=True)}
+
+
+BACKENDS = {
+    'mongo': MongoEventStore,
+    'sqlite': SQLiteEventStore,
+}
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_event_store():
+    """Return this process's configured event store."""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store is not None and _store_pid == pid:
+        return _store
+
+    with _store_lock:
+        if _store is None or _store_pid != pid:
+            config = get_store_settings()
+            try:
+                backend = BACKENDS[config['BACKEND']]
+            except KeyError:
+                raise ValueError(f"Unknown TRACKING_EVENT_STORE backend: {config['BACKEND']}")
+            _store = backend(chunk_size=config['CHUNK_SIZE'])
+            _store_pid = pid
+        return _store
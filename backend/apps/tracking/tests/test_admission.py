@@ -0,0 +1,80 @@
+import pytest
+
+from apps.tracking import admission
+from apps.tracking.admission import (
+    ADMISSION_DEFAULTS, SHED_IP_RATE, SHED_PRESSURE, SHED_SESSION_RATE, AdmissionController,
+)
+from apps.tracking.broker import get_broker
+from apps.tracking.ingestion import IngestionError, ingest_events
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+OTHER = '0d7e1f3a-9c5b-4e2d-8a1f-6b3c2d1e0f9a'
+
+
+def item(event_type='mouse_move', session_id=SESSION):
+    return {'session_id': session_id, 'event_type': event_type}
+
+
+def controller(**overrides):
+    return AdmissionController({**ADMISSION_DEFAULTS, **overrides})
+
+
+@pytest.fixture
+def no_pressure(monkeypatch):
+    monkeypatch.setattr(admission, '_pressure_sources', {})
+
+
+def test_session_bucket_sheds_moves_before_protected_events(no_pressure):
+    gate = controller(SESSION_RATE=1, SESSION_BURST=2)
+    decisions = gate.admit([item(), item(), item(), item('page_view'), item('mouse_click')], '1.2.3.4', now=0)
+
+    # Protected events are admitted first and drain the bucket the moves needed
+    assert decisions == [SHED_SESSION_RATE] * 3 + [None, None]
+
+
+def test_buckets_refill_at_their_rate(no_pressure):
+    gate = controller(SESSION_RATE=10, SESSION_BURST=1)
+    assert gate.admit([item(), item()], '1.2.3.4', now=0) == [None, SHED_SESSION_RATE]
+    assert gate.admit([item()], '1.2.3.4', now=0.05) == [SHED_SESSION_RATE]
+    assert gate.admit([item()], '1.2.3.4', now=0.1) == [None]
+
+
+def test_ip_bucket_is_shared_by_sessions(no_pressure):
+    gate = controller(IP_RATE=1, IP_BURST=2)
+    decisions = gate.admit([item(), item(session_id=OTHER), item(session_id=OTHER)], '1.2.3.4', now=0)
+
+    assert decisions == [None, None, SHED_IP_RATE]
+    assert gate.admit([item()], '5.6.7.8', now=0) == [None]
+
+
+def test_pressure_sheds_by_priority(monkeypatch):
+    monkeypatch.setattr(admission, '_pressure_sources', {'test': lambda: 0.8})
+    gate = controller()
+    assert gate.admit([item(), item('scroll'), item('page_view')], '1.2.3.4', now=0) == [SHED_PRESSURE, None, None]
+
+    monkeypatch.setattr(admission, '_pressure_sources', {'test': lambda: 0.97})
+    assert gate.admit([item('scroll'), item('mouse_click')], '1.2.3.4', now=0) == [SHED_PRESSURE, None]
+
+
+def test_broker_queue_is_a_pressure_source(settings, monkeypatch):
+    settings.TRACKING_BROKER = {**settings.TRACKING_BROKER, 'BACKEND': 'memory', 'QUEUE_MAX_MESSAGES': 100}
+    assert admission.broker_pressure() == 0.0
+    broker = get_broker()
+    monkeypatch.setattr(broker, 'pending', lambda: 80)
+
+    assert admission.broker_pressure() == 0.8
+    assert admission.system_pressure() == 0.8
+
+
+def test_invalid_items_do_not_use_tokens(mongo, settings, no_pressure):
+    settings.TRACKING_ADMISSION = {**settings.TRACKING_ADMISSION, 'ENABLED': True,
+                                   'SESSION_RATE': 0.001, 'SESSION_BURST': 1}
+    move = {**item(), 'data': {'x': 1, 'y': 2}}
+    summary = ingest_events([{**item(), 'data': {'x': 'a', 'y': 2}}, move], {'ip_address': '1.2.3.4'})
+
+    assert [result['status'] for result in summary['results']] == ['error', 'success']
+    assert summary['rejected'] == 1 and summary['shed'] == 0
+
+    with pytest.raises(IngestionError) as excinfo:
+        ingest_events([move], {'ip_address': '1.2.3.4'})
+    assert excinfo.value.status == 429
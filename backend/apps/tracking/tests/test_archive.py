@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from apps.tracking.archive import ArchiveWriter, BrokerSource, run_archiver  # noqa: E402
+from apps.tracking.broker import get_broker  # noqa: E402
+from apps.tracking.ingestion import encode_message  # noqa: E402
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+
+
+def test_broker_source_skips_undecodable_messages(tmp_path, settings):
+    settings.TRACKING_BROKER = {**settings.TRACKING_BROKER, 'BACKEND': 'memory'}
+    broker = get_broker()
+    now = datetime(2026, 10, 18, 12)
+    valid = encode_message([{'session_id': SESSION, 'event_type': 'page_view', 'timestamp': now}], {}, now)
+    for value in [b'{"documents": ', valid, b'{"context": {}}']:
+        broker.publish(SESSION.encode(), value)
+
+    source = BrokerSource(broker.consumer(), timeout=0.05)
+    archived = run_archiver(ArchiveWriter(tmp_path), source, flush_rows=100, flush_seconds=60, idle_exit=True)
+
+    assert archived == 1 and source.skipped == 2
+    # The offsets moved past the bad messages
+    assert broker.consumer().poll_batch(10, 0.05) == []
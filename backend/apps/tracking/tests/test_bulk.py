@@ -0,0 +1,40 @@
+from datetime import datetime
+
+import pytest
+
+from apps.tracking.bulk import InvalidSessions, UnknownSessions, bulk_create_events
+from apps.tracking.models import Event, Session
+from apps.tracking.store import SQLiteEventStore
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+
+pytestmark = pytest.mark.django_db
+
+
+def event(session_id=SESSION, event_type='mouse_click'):
+    return {'session_id': session_id, 'event_type': event_type, 'timestamp': datetime(2026, 10, 18, 12),
+            'url': '/a', 'data': {'x': 1, 'y': 2}, 'user_agent': 'pytest', 'ip_address': '127.0.0.1'}
+
+
+def test_bulk_create_events_rejects_malformed_session_ids():
+    with pytest.raises(InvalidSessions) as excinfo:
+        bulk_create_events([event(), event('not-a-uuid')], create_sessions=True)
+
+    assert list(excinfo.value.errors) == [1]
+    assert not Event.objects.exists() and not Session.objects.exists()
+
+
+def test_bulk_create_events_reports_unknown_sessions():
+    with pytest.raises(UnknownSessions) as excinfo:
+        bulk_create_events([event()])
+
+    assert excinfo.value.session_ids == [SESSION]
+    assert not Event.objects.exists()
+
+
+def test_sqlite_store_fails_malformed_session_ids_per_item():
+    failures = SQLiteEventStore().append_batch([event(), event('not-a-uuid'), event(SESSION.upper())])
+
+    assert list(failures) == [1]
+    assert Event.objects.count() == 2
+    assert list(Session.objects.values_list('user_agent', flat=True)) == ['pytest']
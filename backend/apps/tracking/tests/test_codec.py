@@ -0,0 +1,104 @@
+import struct
+
+import numpy as np
+import pytest
+
+from apps.tracking.codec import (
+    HEADER, MOUSE_MOVES_CONTENT_TYPE, CodecError, decode_mouse_moves, encode_mouse_moves,
+)
+from apps.tracking.ingestion import ingest_mouse_moves
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+BASE_TS = 1792324800000.0   # 2026-10-18T12:00:00Z
+CONTEXT = {'user_agent': 'pytest', 'path': '/api/tracking/events/', 'method': 'POST', 'ip_address': '127.0.0.1'}
+
+
+def payload(count=5, base_ts=BASE_TS):
+    t = base_ts + np.arange(count) * 16.0
+    return encode_mouse_moves(SESSION, '/a', t, np.arange(count) * 3, np.arange(count) * 2)
+
+
+def with_base_ts(body, base_ts):
+    fields = list(HEADER.unpack_from(body))
+    fields[3] = base_ts
+    return HEADER.pack(*fields) + body[HEADER.size:]
+
+
+def test_round_trip():
+    batch = decode_mouse_moves(payload())
+
+    assert batch.session_id == SESSION and batch.url == '/a'
+    assert batch.t.tolist() == (BASE_TS + np.arange(5) * 16.0).tolist()
+    assert batch.x.tolist() == [0, 3, 6, 9, 12] and batch.y.tolist() == [0, 2, 4, 6, 8]
+    assert batch.take([0, 4]).x.tolist() == [0, 12]
+
+
+@pytest.mark.parametrize('body, message', [
+    (b'MM', 'shorter than header'),
+    (b'XX' + payload()[2:], 'Bad magic'),
+    (payload()[:-1], 'does not match header'),
+    (with_base_ts(payload(), float('nan')), 'base_ts'),
+    (with_base_ts(payload(), float('inf')), 'base_ts'),
+    (with_base_ts(payload(), 1e300), 'base_ts'),
+    (with_base_ts(payload(), -1.0), 'base_ts'),
+])
+def test_decode_rejects_malformed_payloads(body, message):
+    with pytest.raises(CodecError, match=message):
+        decode_mouse_moves(body)
+
+
+def raw_payload(x0, dx, count=65536):
+    """A batch of ``count`` points each moving ``dx`` px right, built by hand."""
+    sid, url = SESSION.encode(), b'/a'
+    header = HEADER.pack(b'MM', 1, 0, BASE_TS, x0, 0, count, len(sid), len(url))
+    triples = np.tile(np.array([1, dx, 0], dtype='<i2'), count)
+    return header + sid + url + triples.tobytes()
+
+
+def test_long_batches_decode_without_overflow():
+    batch = decode_mouse_moves(raw_payload(0, 32767))
+
+    assert batch.x[-1] == 65536 * 32767 and batch.x.dtype == np.int32
+    assert batch.t[-1] == BASE_TS + 65536
+
+
+def test_coordinates_beyond_int32_are_rejected():
+    with pytest.raises(CodecError, match='int32'):
+        decode_mouse_moves(raw_payload(2 ** 31 - 1, 1, count=2))
+
+
+def test_encode_rejects_deltas_outside_int16():
+    with pytest.raises(CodecError):
+        encode_mouse_moves(SESSION, '/a', [0, 1], [0, 40000], [0, 0])
+
+
+def test_invalid_base_ts_is_a_client_error(client):
+    body = with_base_ts(payload(), struct.unpack('<d', struct.pack('<Q', 0x7ff8000000000001))[0])
+
+    response = client.post('/api/tracking/events/', body, content_type=MOUSE_MOVES_CONTENT_TYPE)
+
+    assert response.status_code == 400
+
+
+def test_ingest_writes_columns_to_bucket_only_trajectories(mongo, settings):
+    settings.TRACKING_TRAJECTORIES = {**settings.TRACKING_TRAJECTORIES, 'ENABLED': True, 'KEEP_EVENTS': False}
+    settings.TRACKING_SIMPLIFY = {**settings.TRACKING_SIMPLIFY, 'ENABLED': True, 'METHOD': 'rdp'}
+
+    summary = ingest_mouse_moves(decode_mouse_moves(payload(count=50)), CONTEXT)
+
+    # A straight line keeps its two ends, the first standing for 49 points
+    assert summary == {'inserted': 50, 'failed': 0, 'shed': 0, 'simplified': 48}
+    assert 'events' not in mongo
+    (bucket,) = mongo['trajectories'].docs
+    assert bucket['x'] == [0, 147] and bucket['w'] == [49, 1] and bucket['count'] == 2
+
+
+def test_ingest_writes_weighted_documents(mongo, settings):
+    settings.TRACKING_SIMPLIFY = {**settings.TRACKING_SIMPLIFY, 'ENABLED': True, 'METHOD': 'rdp'}
+
+    summary = ingest_mouse_moves(decode_mouse_moves(payload(count=10)), CONTEXT)
+
+    assert summary['inserted'] == 10 and summary['simplified'] == 8
+    first, last = mongo['events'].docs
+    assert first['weight'] == 9 and 'weight' not in last
+    assert first['client_timestamp'].isoformat() == '2026-10-18T12:00:00'
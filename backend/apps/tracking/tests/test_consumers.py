@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from pymongo.errors import AutoReconnect
+
+from apps.tracking.consumers import LiveTrackingConsumer, TrackingConsumer, session_group
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+def test_only_stored_events_reach_live_viewers(mongo, settings):
+    settings.TRACKING_WEBSOCKET = {**settings.TRACKING_WEBSOCKET, 'FLUSH_SIZE': 3}
+    events = [
+        {'session_id': SESSION, 'event_type': 'mouse_click', 'seq': 1, 'data': {'x': 1, 'y': 2}},
+        {'session_id': SESSION, 'event_type': 'mouse_click', 'seq': 2, 'data': {'x': 'left', 'y': 2}},
+        {'session_id': SESSION, 'event_type': 'mouse_click', 'seq': 1, 'data': {'x': 1, 'y': 2}},
+    ]
+
+    async def scenario():
+        layer = get_channel_layer()
+        viewer = await layer.new_channel()
+        await layer.group_add(session_group(SESSION), viewer)
+        producer = WebsocketCommunicator(TrackingConsumer.as_asgi(), '/ws/tracking/')
+        await producer.connect()
+        await producer.send_to(text_data=json.dumps({'seq': 7, 'events': events}))
+        ack = json.loads(await producer.receive_from())
+        published = await layer.receive(viewer)
+        await producer.disconnect()
+        return ack, published
+
+    ack, published = run(scenario())
+
+    assert ack['type'] == 'ack' and ack['inserted'] == 1 and ack['seqs'] == [7]
+    assert [event['seq'] for event in published['events']] == [1]
+
+
+@pytest.mark.parametrize('rate', ['fast', None, 'nan'])
+def test_invalid_rate_gets_an_error_frame(rate):
+    async def scenario():
+        viewer = WebsocketCommunicator(LiveTrackingConsumer.as_asgi(), '/ws/tracking/live/')
+        await viewer.connect()
+        await viewer.send_to(text_data=json.dumps({'action': 'subscribe', 'session_ids': [SESSION], 'rate_hz': rate}))
+        reply = json.loads(await viewer.receive_from())
+        await viewer.send_to(text_data=json.dumps({'action': 'subscribe', 'session_ids': [SESSION], 'rate_hz': 5}))
+        subscribed = json.loads(await viewer.receive_from())
+        await viewer.disconnect()
+        return reply, subscribed
+
+    reply, subscribed = run(scenario())
+
+    assert reply['type'] == 'error' and 'rate_hz' in reply['error']
+    assert subscribed == {'type': 'subscribed', 'subscriptions': 1, 'rate_hz': 5.0, 'sample': 1.0}
+
+
+def test_unexpected_ingestion_errors_are_nacked(mongo, settings, monkeypatch):
+    settings.TRACKING_WEBSOCKET = {**settings.TRACKING_WEBSOCKET, 'FLUSH_INTERVAL_MS': 10}
+
+    def fail(items, context):
+        raise AutoReconnect('mongo:27017: connection refused')
+
+    monkeypatch.setattr('apps.tracking.consumers.ingest_events', fail)
+    event = {'session_id': SESSION, 'event_type': 'mouse_click', 'data': {'x': 1, 'y': 2}}
+
+    async def scenario():
+        producer = WebsocketCommunicator(TrackingConsumer.as_asgi(), '/ws/tracking/')
+        await producer.connect()
+        # Flushed by the timer task, not by the receive handler
+        await producer.send_to(text_data=json.dumps({'seq': 3, 'events': [event]}))
+        reply = json.loads(await producer.receive_from())
+        await producer.disconnect()
+        return reply
+
+    reply = run(scenario())
+
+    assert reply['type'] == 'nack' and reply['seqs'] == [3] and reply['status'] == 503
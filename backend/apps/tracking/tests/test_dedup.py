@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from apps.tracking import ingestion
+from apps.tracking.ingestion import ingest_events
+from apps.tracking.utils.dedup import DedupWindow, event_key, get_dedup_window
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+CONTEXT = {'user_agent': 'pytest', 'path': '/api/tracking/events/', 'method': 'POST'}
+
+
+def event(seq):
+    return {'session_id': SESSION, 'event_type': 'mouse_click', 'seq': seq, 'data': {'x': 1, 'y': 2}}
+
+
+def test_claim_reports_keys_repeated_within_a_batch():
+    window = DedupWindow(window_seconds=60, generations=4)
+
+    assert window.claim(['a', 'b', 'a'], now=0) == [True, True, False]
+    assert window.claim(['b', 'c'], now=1) == [False, True]
+    assert window.stats()['duplicates'] == 2
+
+
+def test_keys_expire_after_the_window():
+    start = time.monotonic()
+    window = DedupWindow(window_seconds=60, generations=4)
+    window.claim(['a'], now=start)
+
+    assert window.claim(['a'], now=start + 50) == [False]
+    # Every generation elapsed while idle is dropped
+    assert window.claim(['a'], now=start + 200) == [True]
+
+
+def test_full_generation_rotates_early():
+    window = DedupWindow(window_seconds=60, generations=2, max_keys=4)
+    window.claim(['a', 'b', 'c', 'd', 'e'], now=0)
+
+    assert window.stats()['early_rotations'] == 2
+    # The oldest generation was dropped to keep memory bounded
+    assert window.claim(['a', 'e'], now=0) == [True, False]
+
+
+def test_release_lets_a_retry_through():
+    window = DedupWindow()
+    window.claim([event_key(SESSION, 1)], now=0)
+    window.release([event_key(SESSION, 1)])
+
+    assert window.claim([event_key(SESSION, 1)], now=0) == [True]
+
+
+def test_disabled_window(settings):
+    settings.TRACKING_DEDUP = {'ENABLED': False}
+
+    assert get_dedup_window() is None
+
+
+def test_retried_events_are_not_written_twice(mongo):
+    first = ingest_events([event(1), event(2)], CONTEXT)
+    retry = ingest_events([event(2), event(3)], CONTEXT)
+
+    assert first['inserted'] == 2
+    assert retry['inserted'] == 1 and retry['duplicates'] == 1
+    assert retry['results'][0] == {'index': 0, 'status': 'success', 'duplicate': True}
+    assert sorted(doc['seq'] for doc in mongo['events'].docs) == [1, 2, 3]
+
+
+def test_failed_write_releases_its_keys(mongo, monkeypatch):
+    persist_documents = ingestion.persist_documents
+    monkeypatch.setattr(ingestion, 'persist_documents', lambda *args: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        ingest_events([event(1)], CONTEXT)
+    monkeypatch.setattr(ingestion, 'persist_documents', persist_documents)
+
+    summary = ingest_events([event(1)], CONTEXT)
+    assert summary['inserted'] == 1 and summary['duplicates'] == 0
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+
+from apps.tracking.broker import get_broker
+from apps.tracking.ingestion import (
+    decode_message, encode_message, ingest_events, load_messages, write_events,
+)
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+CONTEXT = {'user_agent': 'pytest', 'referer': '', 'path': '/api/tracking/events/',
+           'method': 'POST', 'ip_address': '127.0.0.1'}
+
+
+def event(event_type='mouse_click', seq=None, **data):
+    item = {'session_id': SESSION, 'event_type': event_type, 'url': 'http://localhost:3000/a',
+            'data': data or {'x': 10, 'y': 20}}
+    if seq is not None:
+        item['seq'] = seq
+    return item
+
+
+@pytest.fixture
+def memory_broker(settings):
+    settings.TRACKING_BROKER = {**settings.TRACKING_BROKER, 'BACKEND': 'memory'}
+    return get_broker()
+
+
+@pytest.fixture
+def bucket_only_moves(settings):
+    settings.TRACKING_TRAJECTORIES = {**settings.TRACKING_TRAJECTORIES, 'ENABLED': True, 'KEEP_EVENTS': False}
+
+
+def test_message_round_trip_keeps_naive_utc_datetimes():
+    now = datetime(2026, 10, 18, 12, 30, 15, 123000)
+    documents = [{'session_id': SESSION, 'event_type': 'page_view', 'timestamp': now, 'data': {}}]
+    message = decode_message(encode_message(documents, CONTEXT, now))
+
+    assert message['received_at'] == now
+    assert message['documents'][0]['timestamp'] == now
+    assert message['documents'][0]['timestamp'].tzinfo is None
+    assert message['context'] == {'user_agent': 'pytest', 'referer': ''}
+
+
+def test_write_events_inserts_documents(mongo):
+    now = datetime.utcnow()
+    documents = [{**event(), 'timestamp': now}, {**event('page_view', title='Home'), 'timestamp': now}]
+
+    assert write_events(documents) == {}
+    assert [doc['event_type'] for doc in mongo['events'].docs] == ['mouse_click', 'page_view']
+
+
+def test_write_events_sends_bucket_only_moves_to_trajectories(mongo, bucket_only_moves):
+    now = datetime.utcnow()
+    documents = [{**event('mouse_move'), 'timestamp': now}, {**event(), 'timestamp': now}]
+
+    assert write_events(documents) == {}
+    assert [doc['event_type'] for doc in mongo['events'].docs] == ['mouse_click']
+    (bucket,) = mongo['trajectories'].docs
+    assert bucket['count'] == 2 and bucket['e'] == [0, 1]
+
+
+def test_broker_round_trip_loads_events(mongo, memory_broker, bucket_only_moves):
+    items = [event('page_view', seq=1, title='Home'), event('mouse_move', seq=2), event(seq=3)]
+    summary = ingest_events(items, CONTEXT)
+
+    assert summary['inserted'] == 3
+    # Published only: nothing is written until the loader consumes the topic
+    assert 'events' not in mongo or not mongo['events'].docs
+
+    consumer = memory_broker.consumer()
+    values = [value for _, value in consumer.poll_batch(100, 0.1)]
+    assert load_messages(values) == {}
+    consumer.commit()
+
+    assert sorted(doc['event_type'] for doc in mongo['events'].docs) == ['mouse_click', 'page_view']
+    assert all(doc['timestamp'].tzinfo is None for doc in mongo['events'].docs)
+    (bucket,) = mongo['trajectories'].docs
+    assert bucket['bucket_start'].tzinfo is None and bucket['count'] == 2
+    assert mongo['sessions'].docs[0]['session_id'] == SESSION
+
+
+def test_ingest_events_reports_items_individually(mongo):
+    items = [event(), {'event_type': 'mouse_click'}, event('mouse_click', x='abc', y=1)]
+    summary = ingest_events(items, CONTEXT)
+
+    assert [result['status'] for result in summary['results']] == ['success', 'error', 'error']
+    assert summary['inserted'] == 1 and summary['rejected'] == 2
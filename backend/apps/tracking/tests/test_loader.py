@@ -0,0 +1,92 @@
+from datetime import datetime
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from pymongo.errors import AutoReconnect
+
+from apps.tracking import ingestion
+from apps.tracking.broker import get_broker, get_broker_settings
+from apps.tracking.ingestion import decode_messages, encode_message
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+COMMAND = 'apps.tracking.management.commands.consume_tracking_events'
+
+
+def message(event_type='page_view'):
+    now = datetime(2026, 10, 18, 12)
+    documents = [{'session_id': SESSION, 'event_type': event_type, 'timestamp': now, 'data': {}}]
+    return encode_message(documents, {'user_agent': 'pytest'}, now)
+
+
+POISON = [b'\xff not json', b'{"context": {}}', b'{"documents": "nope"}']
+
+
+@pytest.fixture
+def broker(settings):
+    settings.TRACKING_BROKER = {**settings.TRACKING_BROKER, 'BACKEND': 'memory'}
+    return get_broker()
+
+
+def consume(**options):
+    err = StringIO()
+    call_command('consume_tracking_events', max_batches=1, stdout=StringIO(), stderr=err, **options)
+    return err.getvalue()
+
+
+def test_decode_messages_skips_what_is_not_a_batch():
+    messages, skipped = decode_messages([message(), *POISON])
+
+    assert skipped == 3
+    assert [doc['event_type'] for doc in messages[0]['documents']] == ['page_view']
+
+
+def test_default_topic_is_not_the_sink_connector_topic():
+    assert get_broker_settings()['TOPIC'] == 'mouse-tracking-batches'
+
+
+def test_poison_messages_do_not_block_the_loader(mongo, broker):
+    for value in [POISON[0], message(), POISON[1]]:
+        broker.publish(SESSION.encode(), value)
+    consume()
+
+    assert [doc['event_type'] for doc in mongo['events'].docs] == ['page_view']
+    # Everything was committed: nothing is redelivered
+    assert broker.consumer().poll_batch(10, 0.05) == []
+
+
+def test_batch_failing_otherwise_is_loaded_message_by_message(mongo, broker, monkeypatch):
+    load_messages = ingestion.load_messages
+
+    def load(values):
+        documents = [doc for value in values for doc in ingestion.decode_message(value)['documents']]
+        if any(doc['event_type'] == 'mouse_click' for doc in documents):
+            raise KeyError('x')
+        return load_messages(values)
+
+    monkeypatch.setattr(f'{COMMAND}.load_messages', load)
+    for value in [message(), message('mouse_click'), message('scroll')]:
+        broker.publish(SESSION.encode(), value)
+    errors = consume()
+
+    assert sorted(doc['event_type'] for doc in mongo['events'].docs) == ['page_view', 'scroll']
+    assert 'Skipping a message that cannot be loaded' in errors
+
+
+def test_connection_errors_are_retried(mongo, broker, monkeypatch):
+    load_messages = ingestion.load_messages
+    calls = []
+
+    def load(values):
+        calls.append(len(values))
+        if len(calls) == 1:
+            raise AutoReconnect('mongo:27017: connection refused')
+        return load_messages(values)
+
+    monkeypatch.setattr(f'{COMMAND}.load_messages', load)
+    monkeypatch.setattr(f'{COMMAND}.time.sleep', lambda seconds: None)
+    broker.publish(SESSION.encode(), message())
+    consume()
+
+    assert calls == [1, 1]
+    assert len(mongo['events'].docs) == 1
@@ -0,0 +1,88 @@
+import gzip
+import json
+import zlib
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from apps.tracking.middleware import DecompressRequestMiddleware, brotli
+
+LIMIT = 1024
+BODY = json.dumps({'events': [{'session_id': 's', 'event_type': 'page_view'}] * 4}).encode()
+
+ENCODERS = {
+    'gzip': gzip.compress,
+    'deflate': zlib.compress,
+    'raw-deflate': lambda data: zlib.compress(data)[2:-4],
+    'br': lambda data: brotli.compress(data),
+}
+
+
+@pytest.fixture
+def middleware(settings):
+    settings.TRACKING_DECOMPRESSION = {'MAX_DECOMPRESSED_BYTES': LIMIT}
+    return DecompressRequestMiddleware(lambda request: HttpResponse(request.body))
+
+
+def post(middleware, body, encoding, path='/api/tracking/events/'):
+    request = RequestFactory().post(path, body, content_type='application/json',
+                                    HTTP_CONTENT_ENCODING=encoding)
+    return middleware(request)
+
+
+@pytest.mark.parametrize('name', ['gzip', 'deflate', 'raw-deflate', 'br'])
+def test_compressed_bodies_are_inflated(middleware, name):
+    if name == 'br' and brotli is None:
+        pytest.skip('brotli not installed')
+    encoding = 'deflate' if name == 'raw-deflate' else name
+    response = post(middleware, ENCODERS[name](BODY), encoding)
+
+    assert response.status_code == 200
+    assert response.content == BODY
+
+
+@pytest.mark.parametrize('name', ['gzip', 'deflate', 'raw-deflate', 'br'])
+def test_bodies_inflating_past_the_limit_are_rejected(middleware, name):
+    if name == 'br' and brotli is None:
+        pytest.skip('brotli not installed')
+    encoding = 'deflate' if name == 'raw-deflate' else name
+    # A few hundred bytes on the wire, far more once inflated
+    response = post(middleware, ENCODERS[name](b' ' * (LIMIT * 100)), encoding)
+
+    assert response.status_code == 413
+
+
+def test_body_at_the_limit_is_accepted(middleware):
+    response = post(middleware, gzip.compress(b'x' * LIMIT), 'gzip')
+
+    assert response.status_code == 200 and len(response.content) == LIMIT
+
+
+def test_truncated_and_unknown_bodies(middleware):
+    assert post(middleware, gzip.compress(BODY)[:-10], 'gzip').status_code == 400
+    assert post(middleware, BODY, 'compress').status_code == 415
+
+
+def test_other_paths_are_left_alone(middleware):
+    body = gzip.compress(BODY)
+    response = post(middleware, body, 'gzip', path='/admin/')
+
+    assert response.content == body
+
+
+def test_multi_member_gzip_is_inflated_whole(middleware):
+    response = post(middleware, gzip.compress(BODY[:40]) + gzip.compress(BODY[40:]), 'gzip')
+
+    assert response.status_code == 200 and response.content == BODY
+
+
+def test_gzip_members_share_the_size_limit(middleware):
+    half = gzip.compress(b'x' * (LIMIT // 2 + 1))
+
+    assert post(middleware, half + half, 'gzip').status_code == 413
+
+
+@pytest.mark.parametrize('name', ['gzip', 'deflate'])
+def test_trailing_garbage_is_rejected(middleware, name):
+    assert post(middleware, ENCODERS[name](BODY) + b'garbage', name).status_code == 400
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+import pytest
+from bson import ObjectId
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from conftest import FakeCollections
+
+COMMAND = 'apps.tracking.management.commands.migrate_events_timeseries'
+START = datetime(2026, 10, 18, 12, tzinfo=timezone.utc)
+
+
+class FakeDatabase(FakeCollections):
+    def __init__(self):
+        super().__init__()
+        self.types = {}
+
+    def list_collection_names(self):
+        return list(self)
+
+    def list_collections(self, filter):
+        name = filter['name']
+        return [{'name': name, 'type': self.types.get(name, 'collection')}] if name in self else []
+
+    def create_collection(self, name, **options):
+        self.types[name] = 'timeseries' if 'timeseries' in options else 'collection'
+        return self[name]
+
+
+def event(seconds, **fields):
+    """A plain event whose ObjectId was generated ``seconds`` after START."""
+    generated = START + timedelta(seconds=seconds)
+    object_id = ObjectId(ObjectId.from_datetime(generated).binary[:4] + ObjectId().binary[4:])
+    return {'_id': object_id, 'session_id': 's', 'event_type': 'page_view',
+            'timestamp': generated.replace(tzinfo=None), **fields}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    database['events'].docs = [event(0), event(1), event(2, timestamp=None), event(3)]
+    monkeypatch.setattr(f'{COMMAND}.get_mongo_db', lambda: database)
+    return database
+
+
+def migrate(**options):
+    out = StringIO()
+    call_command('migrate_events_timeseries', batch_size=2, stdout=out, **options)
+    return out.getvalue()
+
+
+def copied_ids(db):
+    return sorted(doc['_id'] for doc in db['events_ts'].docs)
+
+
+def test_copies_events_into_a_timeseries_collection(db):
+    output = migrate()
+
+    assert db.types['events_ts'] == 'timeseries'
+    assert 'Copied 3 event(s)' in output and 'skipped 1 event(s) without a timestamp' in output
+    assert copied_ids(db) == sorted(doc['_id'] for doc in db['events'].docs if doc['timestamp'])
+    assert db['events_ts'].docs[0]['meta'] == {'session_id': 's', 'event_type': 'page_view'}
+
+
+def test_resume_catches_up_with_out_of_order_ids(db):
+    migrate()
+    # Written after the copy, but one id was generated before the last copied one
+    late = [event(2.5), event(10)]
+    db['events'].docs.extend(late)
+    output = migrate()
+
+    assert 'Copied 2 event(s)' in output
+    assert copied_ids(db) == sorted(doc['_id'] for doc in db['events'].docs if doc['timestamp'])
+
+
+def test_verify_compares_counts_before_the_cutover(db):
+    migrate()
+    output = migrate(verify=True)
+
+    assert 'Verified 3 event(s) (1 without a timestamp not copied)' in output
+    assert 'MONGODB_EVENTS_COLLECTION=events_ts' in output
+    assert db['schema_versions'].find_one({'_id': 'events_timeseries_migration'}) is None
+
+
+def test_verify_fails_on_events_missed_by_the_copy(db):
+    migrate()
+    # An id older than the resume overlap is never read again
+    db['events'].docs.append(event(-3600))
+
+    with pytest.raises(CommandError, match='events_ts holds 3 event'):
+        migrate(verify=True)
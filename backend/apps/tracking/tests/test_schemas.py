@@ -0,0 +1,26 @@
+import pytest
+
+from apps.tracking.schemas import get_validator, validate_batch
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+
+
+@pytest.mark.parametrize('session_id', [{'id': SESSION}, [SESSION], 42, 'not-a-uuid'])
+def test_malformed_session_ids_are_rejected_per_event(session_id):
+    items = [{'session_id': session_id, 'event_type': 'page_view'}, {'session_id': SESSION, 'event_type': 'page_view'}]
+    (rejected, error), (accepted, _) = validate_batch(items)
+
+    assert rejected is None and error == 'session_id must be a UUID string'
+    assert accepted['session_id'] == SESSION
+
+
+def test_validators_follow_schema_settings(settings):
+    assert get_validator('heartbeat') is not None
+
+    settings.TRACKING_SCHEMA = {'STRICT_EVENT_TYPES': True}
+    assert get_validator('heartbeat') is None
+    (_, error), = validate_batch([{'session_id': SESSION, 'event_type': 'heartbeat'}])
+    assert error == 'heartbeat: Unknown event_type: heartbeat'
+
+    settings.TRACKING_SCHEMA = {'STRICT_EVENT_TYPES': False}
+    assert get_validator('heartbeat') is not None
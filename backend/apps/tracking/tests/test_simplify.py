@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+
+from apps.tracking.ingestion import build_event_document, parse_client_timestamp
+from apps.tracking.simplify import SIMPLIFY_DEFAULTS, simplify_mouse_moves, simplify_points
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+CONTEXT = {'user_agent': 'pytest', 'path': '/api/tracking/events/', 'method': 'POST'}
+THRESHOLD = {**SIMPLIFY_DEFAULTS, 'METHOD': 'threshold', 'MIN_DISTANCE_PX': 10.0, 'MAX_INTERVAL_MS': 1000}
+
+
+def move(x, y, timestamp=None):
+    item = {'session_id': SESSION, 'event_type': 'mouse_move', 'data': {'x': x, 'y': y}}
+    if timestamp is not None:
+        item['timestamp'] = timestamp
+    return build_event_document(item, CONTEXT, datetime(2026, 10, 18, 12))
+
+
+def test_rdp_keeps_the_corner_and_weights_dropped_points():
+    kept, weights = simplify_points([0, 5, 10, 10, 10], [0, 0, 0, 5, 10])
+
+    assert kept.tolist() == [0, 2, 4]
+    assert weights.tolist() == [2, 2, 1]
+
+
+def test_simplify_mouse_moves_maps_dropped_points_to_their_owner():
+    documents = [move(x, 0) for x in range(5)] + [move(4, 50)]
+    stored, owners = simplify_mouse_moves(documents)
+
+    assert [doc['data']['x'] for doc in stored] == [0, 4, 4]
+    assert stored[0]['weight'] == 4 and 'weight' not in stored[2]
+    assert owners == [0, 0, 0, 0, 1, 2]
+
+
+@pytest.mark.parametrize('value, expected', [
+    (1792324800000, datetime(2026, 10, 18, 12)),
+    ('2026-10-18T12:00:00.500Z', datetime(2026, 10, 18, 12, 0, 0, 500000)),
+    ('2026-10-18T14:00:00+02:00', datetime(2026, 10, 18, 12)),
+    ('yesterday', None),
+    (-1, None),
+    (True, None),
+])
+def test_parse_client_timestamp(value, expected):
+    assert parse_client_timestamp(value) == expected
+
+
+def test_threshold_uses_the_tracker_timestamp():
+    # The cursor barely moves, but two seconds pass between the middle points
+    timestamps = ['2026-10-18T12:00:00.000Z', '2026-10-18T12:00:00.100Z',
+                  '2026-10-18T12:00:02.100Z', '2026-10-18T12:00:02.200Z']
+    documents = [move(i, 0, timestamp) for i, timestamp in enumerate(timestamps)]
+    stored, _ = simplify_mouse_moves(documents, THRESHOLD)
+
+    assert [doc['data']['x'] for doc in stored] == [0, 2, 3]
+
+
+def test_threshold_is_distance_only_without_timestamps():
+    documents = [move(i, 0) for i in range(4)]
+    stored, owners = simplify_mouse_moves(documents, THRESHOLD)
+
+    assert [doc['data']['x'] for doc in stored] == [0, 3]
+    assert owners == [0, 0, 0, 1]
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+
+from apps.tracking.utils.trajectory_store import bucket_updates
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+
+
+def point(timestamp, x=1, y=2, event_type='mouse_move', **extra):
+    return {'session_id': SESSION, 'event_type': event_type, 'url': '/a', 'timestamp': timestamp,
+            'data': {'x': x, 'y': y}, **extra}
+
+
+def test_bucket_updates_groups_points_by_window():
+    start = datetime(2026, 10, 18, 12, 0, 0)
+    documents = [point(start + timedelta(seconds=1)), point(start + timedelta(seconds=2), event_type='mouse_click'),
+                 point(start + timedelta(seconds=301)), point(start, event_type='page_view')]
+    updates, members = bucket_updates(documents, window_seconds=300, max_points=1000)
+
+    assert members == [[0, 1], [2]]
+    first = updates[0]._doc
+    assert updates[0]._filter['bucket_start'] == start
+    assert first['$push']['t']['$each'] == [1000, 2000]
+    assert first['$push']['e']['$each'] == [0, 1]
+
+
+def test_bucket_updates_accepts_tz_aware_timestamps():
+    start = datetime(2026, 10, 18, 12, 0, 0)
+    aware = (start + timedelta(seconds=5)).replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=7)))
+    updates, members = bucket_updates([point(aware), point(start, client_timestamp=aware)], 300, 1000)
+
+    assert members == [[0, 1]]
+    assert updates[0]._filter['bucket_start'] == start
+    assert updates[0]._doc['$push']['t']['$each'] == [5000, 5000]
+    assert updates[0]._doc['$min']['t_min'].tzinfo is None
+
+
+def test_bucket_updates_splits_full_buckets():
+    start = datetime(2026, 10, 18, 12, 0, 0)
+    updates, members = bucket_updates([point(start + timedelta(seconds=i)) for i in range(5)], 300, 2)
+
+    assert members == [[0, 1], [2, 3], [4]]
+    assert [update._filter['count'] for update in updates] == [{'$lte': 0}, {'$lte': 0}, {'$lte': 1}]
@@ -0,0 +1,46 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from apps.tracking.models import Session
+from apps.tracking.views import get_ingest_executor, run_in_ingest_thread
+
+SESSION = '6f1c2a8e-2f4b-4c38-9a43-9b1f2f1a0c11'
+
+
+@pytest.mark.django_db
+def test_session_detail_keeps_mongo_events_keys(client, mongo, settings):
+    settings.TRACKING_EVENT_STORE = {**getattr(settings, 'TRACKING_EVENT_STORE', {}), 'BACKEND': 'mongo'}
+    Session.objects.create(session_id=SESSION, user_agent='pytest', ip_address='127.0.0.1')
+    mongo['events'].docs.extend([
+        {'session_id': SESSION, 'event_type': 'page_view', 'timestamp': datetime(2026, 10, 18, 12, 0, 1),
+         'url': '/a', 'data': {'title': 'A'}},
+        {'session_id': SESSION, 'event_type': 'mouse_click', 'timestamp': datetime(2026, 10, 18, 12, 0, 0),
+         'url': '/a', 'data': {'x': 1, 'y': 2}},
+    ])
+
+    response = client.get(f'/api/tracking/sessions/{SESSION}/')
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body['events_count'] == body['mongo_events_count'] == 2
+    assert [event['event_type'] for event in body['mongo_events']] == ['mouse_click', 'page_view']
+    assert body['mongo_events'][0]['data'] == {'x': 1, 'y': 2}
+    assert body['mongo_events'][1]['session_id'] == SESSION
+
+
+
+def test_ingest_threads_close_their_db_connections(monkeypatch):
+    calls = []
+    monkeypatch.setattr('apps.tracking.views.close_old_connections',
+                        lambda: calls.append(('close', threading.get_ident())))
+
+    def ingest():
+        calls.append(('ingest', threading.get_ident()))
+
+    executor, _ = get_ingest_executor()
+    executor.submit(run_in_ingest_thread, ingest).result()
+
+    assert [name for name, _ in calls] == ['close', 'ingest', 'close']
+    assert len({thread for _, thread in calls}) == 1 and calls[0][1] != threading.get_ident()
@@ -1,9 +1,12 @@
 """URL configuration for the tracking app."""
 
+import os
 from django.urls import path
+from django.conf import settings
 from django.http import JsonResponse
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes, renderer_classes
 from rest_framework.response import Response
+from utils import fastjson
 from . import views
 
 def test_view(request):
@@ -11,15 +14,12 @@ def test_view(request):
     return JsonResponse({"status": "ok", "message": "API is working!"})
 
 @api_view(['POST'])
+@parser_classes(fastjson.PARSER_CLASSES)
+@renderer_classes(fastjson.RENDERER_CLASSES)
 def simple_event(request):
     """Simplified endpoint for tracking events."""
     try:
-        # Get session or create new one
-        session_id = request.data.get('session_id')
-        if not session_id:
-            return Response({"error": "Session ID is required"}, status=400)
-            
-        # Process the event directly
+        # Validation (session_id, event_type, data schema) happens in ingestion
         response = views.EventsView().process_event(request, request.data)
         return response
     except Exception as e:
@@ -28,7 +28,7 @@ def simple_event(request):
 @api_view(['GET'])
 def mongo_status(request):
     """Check MongoDB connection status."""
-    from utils.mongo_client import get_mongo_client
+    from utils.mongo_client import get_mongo_client, get_pool_stats, get_health
     
     try:
         client = get_mongo_client()
@@ -42,7 +42,7 @@ def mongo_status(request):
             client.admin.command('ping')
             
             # Lấy thông tin cơ bản về database
-            db = client['mouse_tracker']
+            db = client[settings.MONGODB_DB_NAME]
             collections = db.list_collection_names()
             
             stats = {}
@@ -51,9 +51,11 @@ def mongo_status(request):
             
             return Response({
                 "status": "connected",
-                "database": "mouse_tracker",
+                "database": settings.MONGODB_DB_NAME,
                 "collections": collections,
-                "stats": stats
+                "stats": stats,
+                "health": get_health(),
+                "pool": get_pool_stats()
             })
     except Exception as e:
         return Response({
@@ -61,13 +63,50 @@ def mongo_status(request):
             "error": str(e)
         }, status=500)
 
+@api_view(['GET'])
+def ingestion_metrics(request):
+    """Expose in-process ingestion counters.
+
+    Mongo pool, write-behind buffer, broker, dedup, admission, decompression and logging.
+    """
+    from utils.async_logging import get_log_stats
+    from utils.mongo_client import get_pool_stats, get_health
+    from .admission import get_admission_stats
+    from .broker import get_broker_stats
+    from .buffer import get_buffer_stats
+    from .middleware import get_decompression_stats
+    from .utils.dedup import get_dedup_window
+    from .utils.session_cache import get_session_cache
+    
+    dedup = get_dedup_window()
+    
+    return Response({
+        "pid": os.getpid(),
+        "mongo": {
+            "health": get_health(),
+            "pool": get_pool_stats()
+        },
+        "write_behind": get_buffer_stats(),
+        "broker": get_broker_stats(),
+        "session_cache": get_session_cache().stats(),
+        "dedup": dedup.stats() if dedup is not None else None,
+        "admission": get_admission_stats(),
+        "decompression": get_decompression_stats(),
+        "logging": get_log_stats()
+    })
+
+process_event_view = (
+    views.process_event_async if settings.TRACKING_ASYNC_INGESTION['ENABLED'] else views.process_event
+)
+
 urlpatterns = [
     path('health/', views.health_check, name='health_check'),
-    path('events/', views.process_event, name='process_event'),
+    path('events/', process_event_view, name='process_event'),
     path('sessions/', views.SessionView.as_view(), name='tracking-sessions-list'),
     path('sessions/<uuid:session_id>/', views.SessionView.as_view(), name='tracking-sessions-detail'),
     path('test/', test_view, name='tracking-test'),
     path('simple-event/', simple_event, name='tracking-simple-event'),
     path('mongo-status/', mongo_status, name='tracking-mongo-status'),
+    path('metrics/', ingestion_metrics, name='tracking-metrics'),
     path('sessions/<str:session_id>/', views.update_session, name='update_session'),
 ] 
\ No newline at end of file
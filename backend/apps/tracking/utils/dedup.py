@@ -0,0 +1,132 @@
+"""Time-windowed dedup set for client event keys.
+
+Trackers may tag events with a ``seq`` number; ``(session_id, seq)`` then
+identifies the event across retries. Keys seen in the last
+``WINDOW_SECONDS`` are remembered in a ring of ``GENERATIONS`` hash sets:
+lookups check every generation, inserts go to the newest one and the oldest
+generation is dropped wholesale when the ring rotates. Memory is bounded by
+``MAX_KEYS``; a generation that fills up early forces a rotation (shortening
+the effective window, which is counted in ``early_rotations``).
+
+The set is per process, so it catches retries that reach the same worker;
+it is a cheap filter, not a uniqueness guarantee.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+from django.conf import settings
+
+DEFAULTS = {
+    'ENABLED': True,
+    'WINDOW_SECONDS': 600,
+    'GENERATIONS': 4,
+    'MAX_KEYS': 200000,
+}
+
+
+def event_key(session_id, seq):
+    """Compact in-memory key for a client event id (stable within the process)."""
+    return hash((str(session_id), str(seq)))
+
+
+class DedupWindow:
+    """Thread-safe rotating set of recently seen keys."""
+
+    def __init__(self, window_seconds=600, generations=4, max_keys=200000):
+        self.generations = max(generations, 2)
+        self.rotate_every = window_seconds / self.generations
+        self.max_per_generation = max(max_keys // self.generations, 1)
+        self._sets = deque([set()], maxlen=self.generations)
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+        self.claimed = 0
+        self.early_rotations = 0
+
+    def _rotate(self, now):
+        if now - self._started >= self.rotate_every:
+            # Skip generations that elapsed while idle
+            skipped = int((now - self._started) // self.rotate_every)
+            for _ in range(min(skipped, self.generations)):
+                self._sets.append(set())
+            self._started = now
+        elif len(self._sets[-1]) >= self.max_per_generation:
+            self._sets.append(set())
+            self._started = now
+            self.early_rotations += 1
+
+    def claim(self, keys, now=None):
+        """Mark keys as seen; return a list of booleans, ``True`` for new keys.
+
+        A key repeated within ``keys`` is only new the first time.
+        """
+        now = time.monotonic() if now is None else now
+        claimed = []
+        with self._lock:
+            self._rotate(now)
+            current = self._sets[-1]
+            for key in keys:
+                if any(key in generation for generation in self._sets):
+                    self.duplicates += 1
+                    claimed.append(False)
+                    continue
+                current.add(key)
+                if len(current) >= self.max_per_generation:
+                    self._rotate(now)
+                    current = self._sets[-1]
+                claimed.append(True)
+            self.claimed += sum(claimed)
+        return claimed
+
+    def release(self, keys):
+        """Forget keys whose events were not persisted so a retry is accepted."""
+        with self._lock:
+            for key in keys:
+                for generation in self._sets:
+                    generation.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._sets.clear()
+            self._sets.append(set())
+
+    def stats(self):
+        with self._lock:
+            size = sum(len(generation) for generation in self._sets)
+        return {
+            'size': size,
+            'claimed': self.claimed,
+            'duplicates': self.duplicates,
+            'early_rotations': self.early_rotations,
+        }
+
+
+_window = None
+_window_pid = None
+_window_lock = threading.Lock()
+
+
+def get_dedup_settings():
+    return {**DEFAULTS, **getattr(settings, 'TRACKING_DEDUP', {})}
+
+
+def get_dedup_window():
+    """Return this process's dedup window, or ``None`` when disabled."""
+    global _window, _window_pid
+    config = get_dedup_settings()
+    if not config['ENABLED']:
+        return None
+    pid = os.getpid()
+    if _window is None or _window_pid != pid:
+        with _window_lock:
+            if _window is None or _window_pid != pid:
+                _window = DedupWindow(
+                    window_seconds=config['WINDOW_SECONDS'],
+                    generations=config['GENERATIONS'],
+                    max_keys=config['MAX_KEYS'],
+                )
+                _window_pid = pid
+    return _window
@@ -0,0 +1,65 @@
+"""Per-event-type retention policy for raw tracking events.
+
+``TRACKING_RETENTION['EVENT_TYPES']`` maps an event type to the number of
+days its raw events are kept (``DEFAULT_DAYS`` for the others, ``None`` =
+forever). Rollups are computed before anything expires (see
+:mod:`apps.analytics.retention`).
+
+Two ways of expiring raw events in Mongo, selected by ``MODE``:
+
+* ``delete``: the retention job deletes expired events itself, and only for
+  days whose rollups are already stored;
+* ``ttl``: ingestion stamps ``expire_at`` on every event and a TTL index on
+  that field lets Mongo expire them in the background. The retention job
+  then only has to keep rollups ahead of the shortest retention.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from pymongo import ASCENDING, IndexModel
+
+RETENTION_DEFAULTS = {
+    'ENABLED': True,
+    'MODE': 'delete',            # 'delete' or 'ttl'
+    'DEFAULT_DAYS': 90,
+    'EVENT_TYPES': {
+        'mouse_move': 7,
+        'scroll': 30,
+        'mouse_click': 90,
+        'page_view': 90,
+        'form_input': 90,
+    },
+    'DELETE_BATCH_SIZE': 5000,
+    'ROLLUP_DELAY_SECONDS': 3600,  # past midnight, > broker loader lag
+}
+
+EXPIRE_FIELD = 'expire_at'
+EXPIRY_INDEX = IndexModel([(EXPIRE_FIELD, ASCENDING)], expireAfterSeconds=0, name='expire_at_ttl')
+
+
+def get_retention_settings():
+    config = {**RETENTION_DEFAULTS, **getattr(settings, 'TRACKING_RETENTION', {})}
+    config['EVENT_TYPES'] = {**RETENTION_DEFAULTS['EVENT_TYPES'], **config['EVENT_TYPES']}
+    return config
+
+
+def retention_days(event_type, config=None):
+    """Days raw events of ``event_type`` are kept, or ``None`` to keep them."""
+    config = config or get_retention_settings()
+    return config['EVENT_TYPES'].get(event_type, config['DEFAULT_DAYS'])
+
+
+def ttl_enabled(config=None):
+    config = config or get_retention_settings()
+    return config['ENABLED'] and config['MODE'] == 'ttl'
+
+
+def stamp_expiry(documents, config=None):
+    """Set ``expire_at`` from each document's timestamp and event type (in place)."""
+    config = config or get_retention_settings()
+    for doc in documents:
+        days = retention_days(doc.get('event_type'), config)
+        if days is not None and doc.get('timestamp') is not None:
+            doc[EXPIRE_FIELD] = doc['timestamp'] + timedelta(days=days)
+    return documents
@@ -0,0 +1,210 @@
+"""MongoDB schema bootstrap: collections, indexes and schema version.
+
+The schema is applied once (at startup or with ``manage.py bootstrap_mongo``)
+and the applied version is recorded in the ``schema_versions`` collection,
+so the ingestion hot path never has to check for collections or indexes.
+With ``MONGODB_TIMESERIES['ENABLED']`` a missing ``events`` collection is
+created as a time-series collection (see :mod:`.timeseries`).
+"""
+
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from .mongo_client import get_mongo_db
+from .expiry import EXPIRY_INDEX, ttl_enabled
+from .timeseries import create_timeseries_collection, get_timeseries_settings, is_timeseries
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 4
+SCHEMA_ID = 'mouse_tracker'
+
+INDEXES = {
+    'sessions': [
+        IndexModel([('session_id', ASCENDING)], unique=True, name='session_id_unique'),
+        IndexModel([('last_activity', DESCENDING)], name='last_activity'),
+    ],
+    'events': [
+        IndexModel([('session_id', ASCENDING), ('timestamp', ASCENDING)], name='session_id_timestamp'),
+        IndexModel([('event_type', ASCENDING), ('timestamp', ASCENDING)], name='event_type_timestamp'),
+        IndexModel([('url', ASCENDING), ('timestamp', ASCENDING)], name='url_timestamp'),
+        IndexModel([('timestamp', ASCENDING)], name='timestamp'),
+    ],
+    'trajectories': [
+        IndexModel([('session_id', ASCENDING), ('bucket_start', ASCENDING), ('url', ASCENDING)],
+                   name='session_id_bucket_start_url'),
+    ],
+    'rollups': [
+        IndexModel([('kind', ASCENDING), ('heatmap_type', ASCENDING), ('day', ASCENDING)],
+                   name='kind_heatmap_type_day'),
+    ],
+    'aggregates': [
+        IndexModel([('kind', ASCENDING), ('heatmap_type', ASCENDING), ('url', ASCENDING)],
+                   name='kind_heatmap_type_url'),
+        IndexModel([('kind', ASCENDING), ('source', ASCENDING), ('count', DESCENDING)],
+                   name='kind_source_count'),
+        IndexModel([('kind', ASCENDING), ('last_seen', DESCENDING)], name='kind_last_seen'),
+    ],
+}
+
+# Mongo equivalents of the queries issued by apps/analytics/views.py and the
+# tracking read paths, used by ``check_query_plans`` to verify index usage.
+ANALYTICS_QUERIES = [
+    {
+        'name': 'session_mouse_analytics',
+        'collection': 'events',
+        'filter': {'session_id': '00000000-0000-0000-0000-000000000000',
+                   'event_type': {'$in': ['mouse_move', 'mouse_click']}},
+    },
+    {
+        'name': 'mouse_position_analytics',
+        'collection': 'events',
+        'filter': {'event_type': {'$in': ['mouse_move', 'mouse_click']},
+                   'timestamp': {'$gte': datetime(1970, 1, 1)}},
+        'sort': [('timestamp', DESCENDING)],
+        'limit': 1000,
+    },
+    {
+        'name': 'events_by_session',
+        'collection': 'events',
+        'filter': {'session_id': '00000000-0000-0000-0000-000000000000'},
+    },
+    {
+        'name': 'session_trajectory',
+        'collection': 'trajectories',
+        'filter': {'session_id': '00000000-0000-0000-0000-000000000000'},
+        'sort': [('bucket_start', ASCENDING)],
+    },
+    {
+        'name': 'session_lookup',
+        'collection': 'sessions',
+        'filter': {'session_id': '00000000-0000-0000-0000-000000000000'},
+    },
+]
+
+_bootstrapped = False
+
+
+def _collection_name(key):
+    return settings.MONGODB_COLLECTIONS.get(key, key)
+
+
+def get_schema_version(db):
+    """Return the schema version recorded in the database (0 if none)."""
+    doc = db[_collection_name('schema_versions')].find_one({'_id': SCHEMA_ID})
+    return doc['version'] if doc else 0
+
+
+def ensure_expiry_index(db):
+    """Create the ``expire_at`` TTL index when retention runs in ``ttl`` mode.
+
+    Checked on every bootstrap, not only on version upgrades, since TTL mode
+    is a setting that can be switched on after the schema was applied.
+    Returns ``True`` if the index is in place.
+    """
+    if not ttl_enabled():
+        return False
+    events_name = _collection_name('events')
+    if is_timeseries(db, events_name):
+        logger.warning("TTL mode is not supported on a time-series events collection; "
+                       "use MONGODB_TIMESERIES['EXPIRE_AFTER_SECONDS'] instead")
+        return False
+    db[events_name].create_indexes([EXPIRY_INDEX])
+    logger.info(f"Ensured TTL index on {events_name}.{EXPIRY_INDEX.document['name']}")
+    return True
+
+
+def bootstrap_schema(db=None, force=False):
+    """Create collections and indexes unless the current version is recorded.
+
+    Returns ``True`` if the schema was (re)applied.
+    """
+    db = db if db is not None else get_mongo_db()
+    if db is None:
+        raise RuntimeError('MongoDB is not available')
+
+    current = get_schema_version(db)
+    if current >= SCHEMA_VERSION and not force:
+        logger.info(f"MongoDB schema is up to date (version {current})")
+        ensure_expiry_index(db)
+        return False
+
+    existing = set(db.list_collection_names())
+    timeseries = get_timeseries_settings()
+    events_name = _collection_name('events')
+    for collection_name in settings.MONGODB_COLLECTIONS.values():
+        if collection_name not in existing:
+            if collection_name == events_name and timeseries['ENABLED']:
+                create_timeseries_collection(db, collection_name, timeseries)
+                logger.info(f"Created time-series collection: {collection_name}")
+            else:
+                db.create_collection(collection_name)
+                logger.info(f"Created collection: {collection_name}")
+    if timeseries['ENABLED'] and events_name in existing and not is_timeseries(db, events_name):
+        logger.warning(
+            f"{events_name} is a plain collection; run `manage.py migrate_events_timeseries` to convert it"
+        )
+
+    for key, indexes in INDEXES.items():
+        names = db[_collection_name(key)].create_indexes(indexes)
+        logger.info(f"Ensured indexes on {key}: {', '.join(names)}")
+    ensure_expiry_index(db)
+
+    db[_collection_name('schema_versions')].update_one(
+        {'_id': SCHEMA_ID},
+        {'$set': {'version': SCHEMA_VERSION, 'applied_at': datetime.utcnow()}},
+        upsert=True
+    )
+    logger.info(f"MongoDB schema bootstrapped to version {SCHEMA_VERSION}")
+    return True
+
+
+def ensure_schema():
+    """Bootstrap the schema at most once per process."""
+    global _bootstrapped
+    if _bootstrapped:
+        return
+    bootstrap_schema()
+    _bootstrapped = True
+
+
+def _plan_stages(plan):
+    """Flatten a query plan tree into ``(stage, index_name)`` pairs."""
+    stages = [(plan.get('stage'), plan.get('indexName'))]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get('inputStages', []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+def check_query_plans(db=None, queries=ANALYTICS_QUERIES):
+    """Explain each analytics query and report whether it uses an index."""
+    db = db if db is not None else get_mongo_db()
+    if db is None:
+        raise RuntimeError('MongoDB is not available')
+
+    report = []
+    for query in queries:
+        cursor = db[_collection_name(query['collection'])].find(query['filter'])
+        if query.get('sort'):
+            cursor = cursor.sort(query['sort'])
+        if query.get('limit'):
+            cursor = cursor.limit(query['limit'])
+
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = _plan_stages(plan)
+        indexes = sorted({index for stage, index in stages if index})
+        uses_index = any(stage == 'IXSCAN' for stage, _ in stages) \
+            and not any(stage == 'COLLSCAN' for stage, _ in stages)
+        report.append({
+            'name': query['name'],
+            'uses_index': uses_index,
+            'indexes': indexes,
+            'stages': [stage for stage, _ in stages],
+        })
+    return report
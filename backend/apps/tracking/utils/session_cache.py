@@ -0,0 +1,92 @@
+"""In-process cache of recently written tracking sessions.
+
+The ingestion path upserts a session document (``$setOnInsert`` for the
+creation fields, ``$max`` for ``last_activity``). This cache remembers when
+each session was last written so that, however many events arrive, a
+session is touched at most once per ``TOUCH_INTERVAL`` seconds.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+DEFAULTS = {
+    'MAX_SIZE': 100000,
+    'TTL': 3600,
+    'TOUCH_INTERVAL': 30,
+}
+
+
+class SessionCache:
+    """Thread-safe LRU cache with per-entry TTL."""
+
+    def __init__(self, max_size=100000, ttl=3600, touch_interval=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def should_touch(self, session_id, now=None):
+        """Return ``True`` if the session must be written now.
+
+        Unknown or expired sessions and sessions whose last write is older
+        than ``touch_interval`` are due; they are marked as written
+        immediately so concurrent requests do not write them twice.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            last_write = self._entries.get(session_id)
+            if last_write is not None and now - last_write < min(self.touch_interval, self.ttl):
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return False
+
+            self.misses += 1
+            self._entries[session_id] = now
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return True
+
+    def forget(self, session_ids):
+        """Drop sessions whose write failed so the next event retries it."""
+        with self._lock:
+            for session_id in session_ids:
+                self._entries.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {'size': size, 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_session_cache():
+    """Return this process's session cache."""
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                config = {**DEFAULTS, **getattr(settings, 'TRACKING_SESSION_CACHE', {})}
+                _cache = SessionCache(
+                    max_size=config['MAX_SIZE'],
+                    ttl=config['TTL'],
+                    touch_interval=config['TOUCH_INTERVAL'],
+                )
+                _cache_pid = pid
+    return _cache
@@ -0,0 +1,71 @@
+"""Opt-in MongoDB time-series layout for the ``events`` collection.
+
+With ``MONGODB_TIMESERIES['ENABLED']`` the schema bootstrap creates
+``events`` as a native time-series collection (``timeField`` ``timestamp``,
+``metaField`` ``meta``) stored with the ``zstd`` block compressor. Mongo
+buckets measurements by ``meta``, so every event also carries
+``meta: {session_id, event_type}``; the top-level ``session_id`` and
+``event_type`` are kept so existing queries and indexes work unchanged
+(repeated values compress to almost nothing inside a bucket). Secondary
+indexes on measurement fields need MongoDB 6.0+.
+
+An existing plain ``events`` collection is converted with
+``manage.py migrate_events_timeseries``.
+"""
+
+from django.conf import settings
+
+TIMESERIES_DEFAULTS = {
+    'ENABLED': False,
+    'GRANULARITY': 'seconds',
+    'BLOCK_COMPRESSOR': 'zstd',
+    'EXPIRE_AFTER_SECONDS': None,
+}
+
+META_FIELD = 'meta'
+TIME_FIELD = 'timestamp'
+
+
+def get_timeseries_settings():
+    return {**TIMESERIES_DEFAULTS, **getattr(settings, 'MONGODB_TIMESERIES', {})}
+
+
+def timeseries_enabled():
+    return get_timeseries_settings()['ENABLED']
+
+
+def timeseries_options(config=None):
+    """Keyword arguments for ``Database.create_collection``."""
+    config = config or get_timeseries_settings()
+    options = {
+        'timeseries': {
+            'timeField': TIME_FIELD,
+            'metaField': META_FIELD,
+            'granularity': config['GRANULARITY'],
+        },
+    }
+    if config['BLOCK_COMPRESSOR']:
+        options['storageEngine'] = {
+            'wiredTiger': {'configString': f"block_compressor={config['BLOCK_COMPRESSOR']}"}
+        }
+    if config['EXPIRE_AFTER_SECONDS']:
+        options['expireAfterSeconds'] = int(config['EXPIRE_AFTER_SECONDS'])
+    return options
+
+
+def create_timeseries_collection(db, name, config=None):
+    return db.create_collection(name, **timeseries_options(config))
+
+
+def is_timeseries(db, name):
+    """``True`` if ``name`` exists and is a time-series collection."""
+    for info in db.list_collections(filter={'name': name}):
+        return info.get('type') == 'timeseries'
+    return False
+
+
+def add_meta(documents):
+    """Set the ``meta`` field the time-series collection buckets on (in place)."""
+    for doc in documents:
+        doc[META_FIELD] = {'session_id': doc.get('session_id'), 'event_type': doc.get('event_type')}
+    return documents
@@ -0,0 +1,267 @@
+"""Bucketed per-session cursor trajectories in Mongo.
+
+Positional events (``mouse_move`` and ``mouse_click``) are additionally
+stored in the ``trajectories`` collection using the bucket pattern: one
+document per session, page URL and ``WINDOW_SECONDS`` window, holding
+parallel arrays::
+
+    {session_id, url, bucket_start, count,
+     t: [ms since bucket_start], x: [...], y: [...], e: [type code], w: [weight],
+     t_min, t_max, x_min, x_max, y_min, y_max}
+
+Batches are appended with one ``UpdateOne`` per bucket (``$push``/``$each``
+for the arrays, ``$inc`` for ``count``, ``$min``/``$max`` for the bounds)
+and a single unordered ``bulk_write``. A bucket holds at most ``MAX_POINTS``
+points; when full, the next append upserts a sibling document for the same
+window. Reading a session is then a handful of document fetches that
+:func:`read_session_trajectory` turns into NumPy arrays.
+
+With ``KEEP_EVENTS`` off, ``mouse_move`` is written to the buckets only
+(clicks still go to ``events`` as well, for funnels and click heatmaps).
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.conf import settings
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .mongo_client import get_collection
+
+logger = logging.getLogger(__name__)
+
+TRAJECTORY_DEFAULTS = {
+    'ENABLED': False,
+    'WINDOW_SECONDS': 300,
+    'MAX_POINTS': 1000,
+    'KEEP_EVENTS': True,
+}
+
+EVENT_TYPE_CODES = {'mouse_move': 0, 'mouse_click': 1}
+EVENT_TYPES = {code: event_type for event_type, code in EVENT_TYPE_CODES.items()}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def get_trajectory_settings():
+    return {**TRAJECTORY_DEFAULTS, **getattr(settings, 'TRACKING_TRAJECTORIES', {})}
+
+
+def trajectories_enabled():
+    return get_trajectory_settings()['ENABLED']
+
+
+class Trajectory:
+    """Columnar points of one session, ordered by time."""
+
+    __slots__ = ('session_id', 't', 'x', 'y', 'event_type', 'weight', 'url')
+
+    def __init__(self, session_id, t, x, y, event_type, weight, url):
+        self.session_id = session_id
+        self.t = t                     # float64 epoch milliseconds
+        self.x = x                     # float64
+        self.y = y                     # float64
+        self.event_type = event_type   # int8 codes, see EVENT_TYPE_CODES
+        self.weight = weight           # int32 points represented (see simplify)
+        self.url = url                 # object array, one URL per point
+
+    def __len__(self):
+        return len(self.t)
+
+    def timestamps(self):
+        """``t`` as ``datetime64[ms]``."""
+        return self.t.astype('datetime64[ms]')
+
+    def event_type_names(self):
+        return np.array([EVENT_TYPES[code] for code in self.event_type.tolist()], dtype=object)
+
+
+def naive_utc(value):
+    """``value`` as a naive UTC datetime (naive input is assumed to be UTC)."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _point_time(doc):
+    return naive_utc(doc.get('client_timestamp') or doc['timestamp'])
+
+
+def _epoch_ms(value):
+    return (value - _EPOCH).total_seconds() * 1000.0
+
+
+def _from_epoch_ms(value):
+    return _EPOCH + timedelta(milliseconds=value)
+
+
+def point_updates(session_id, url, t, x, y, e, w, window_seconds, max_points):
+    """Bucket upserts for columnar points of one session and URL.
+
+    ``t`` is in epoch milliseconds. Returns ``(updates, members)`` where
+    ``members[i]`` is the array of the point indexes carried by ``updates[i]``.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    x, y, e, w = (np.asarray(column) for column in (x, y, e, w))
+    epoch_seconds = np.floor(t / 1000.0)
+    starts = (epoch_seconds - epoch_seconds % window_seconds) * 1000.0
+
+    updates = []
+    members = []
+    for start in dict.fromkeys(starts.tolist()):
+        indexes = np.flatnonzero(starts == start)
+        bucket_start = _from_epoch_ms(start)
+        for chunk_start in range(0, len(indexes), max_points):
+            chunk = indexes[chunk_start:chunk_start + max_points]
+            t_chunk, x_chunk, y_chunk = t[chunk], x[chunk], y[chunk]
+            updates.append(UpdateOne(
+                {
+                    'session_id': str(session_id),
+                    'url': url,
+                    'bucket_start': bucket_start,
+                    'count': {'$lte': max_points - len(chunk)},
+                },
+                {
+                    '$push': {
+                        't': {'$each': np.floor(t_chunk - start).astype(np.int64).tolist()},
+                        'x': {'$each': x_chunk.tolist()},
+                        'y': {'$each': y_chunk.tolist()},
+                        'e': {'$each': e[chunk].tolist()},
+                        'w': {'$each': w[chunk].tolist()},
+                    },
+                    '$inc': {'count': len(chunk)},
+                    '$min': {'t_min': _from_epoch_ms(t_chunk.min()),
+                             'x_min': x_chunk.min().item(), 'y_min': y_chunk.min().item()},
+                    '$max': {'t_max': _from_epoch_ms(t_chunk.max()),
+                             'x_max': x_chunk.max().item(), 'y_max': y_chunk.max().item()},
+                },
+                upsert=True
+            ))
+            members.append(chunk)
+    return updates, members
+
+
+def bucket_updates(documents, window_seconds, max_points):
+    """Group positional documents into bucket upserts.
+
+    Returns ``(updates, members)`` where ``members[i]`` lists the indexes
+    (in ``documents``) of the points carried by ``updates[i]``.
+    """
+    groups = {}
+    for index, doc in enumerate(documents):
+        if doc['event_type'] in EVENT_TYPE_CODES:
+            groups.setdefault((str(doc['session_id']), doc.get('url', '')), []).append(index)
+
+    updates = []
+    members = []
+    for (session_id, url), indexes in groups.items():
+        docs = [documents[i] for i in indexes]
+        group_updates, group_members = point_updates(
+            session_id, url,
+            [_epoch_ms(_point_time(doc)) for doc in docs],
+            [doc['data']['x'] for doc in docs],
+            [doc['data']['y'] for doc in docs],
+            [EVENT_TYPE_CODES[doc['event_type']] for doc in docs],
+            [doc.get('weight', 1) for doc in docs],
+            window_seconds, max_points,
+        )
+        updates.extend(group_updates)
+        members.extend([indexes[i] for i in chunk.tolist()] for chunk in group_members)
+    return updates, members
+
+
+def _write_updates(updates, members):
+    """Run bucket upserts; returns ``{index: error}`` for the points of failed updates."""
+    if not updates:
+        return {}
+
+    collection = get_collection('trajectories')
+    if collection is None:
+        raise RuntimeError('Failed to connect to MongoDB')
+
+    try:
+        collection.bulk_write(updates, ordered=False)
+    except BulkWriteError as e:
+        failures = {}
+        for error in e.details.get('writeErrors', []):
+            message = error.get('errmsg', 'Failed to append trajectory')
+            failures.update({index: message for index in members[error['index']]})
+        return failures
+    return {}
+
+
+def append_trajectories(documents, config=None):
+    """Append the positional events of ``documents`` to their buckets.
+
+    Returns a dict mapping the index of every document whose bucket update
+    failed to the error; connection errors propagate.
+    """
+    config = config or get_trajectory_settings()
+    return _write_updates(*bucket_updates(documents, config['WINDOW_SECONDS'], config['MAX_POINTS']))
+
+
+def append_mouse_moves(session_id, url, t, x, y, weights, config=None):
+    """Append columnar ``mouse_move`` points (``t`` in epoch ms) to their buckets.
+
+    Same return value as :func:`append_trajectories`, indexed by point.
+    """
+    config = config or get_trajectory_settings()
+    codes = np.full(len(t), EVENT_TYPE_CODES['mouse_move'], dtype=np.int64)
+    updates, members = point_updates(
+        session_id, url, t, x, y, codes, weights, config['WINDOW_SECONDS'], config['MAX_POINTS']
+    )
+    return _write_updates(updates, [chunk.tolist() for chunk in members])
+
+
+def read_session_trajectory(session_id, start=None, end=None, url=None):
+    """Read a session's buckets into a :class:`Trajectory`.
+
+    ``start``/``end`` (datetimes) select whole buckets overlapping the
+    range and then trim the points to it.
+    """
+    query = {'session_id': str(session_id)}
+    if url is not None:
+        query['url'] = url
+    if start is not None:
+        query['t_max'] = {'$gte': start}
+    if end is not None:
+        query['t_min'] = {'$lte': end}
+
+    collection = get_collection('trajectories')
+    buckets = list(collection.find(query).sort('bucket_start', 1)) if collection is not None else []
+
+    columns = {'t': [], 'x': [], 'y': [], 'e': [], 'w': [], 'url': []}
+    for bucket in buckets:
+        base_ms = (bucket['bucket_start'] - _EPOCH).total_seconds() * 1000.0
+        count = len(bucket['t'])
+        columns['t'].append(base_ms + np.asarray(bucket['t'], dtype=np.float64))
+        columns['x'].append(np.asarray(bucket['x'], dtype=np.float64))
+        columns['y'].append(np.asarray(bucket['y'], dtype=np.float64))
+        columns['e'].append(np.asarray(bucket['e'], dtype=np.int8))
+        columns['w'].append(np.asarray(bucket.get('w') or [1] * count, dtype=np.int32))
+        columns['url'].append(np.full(count, bucket.get('url', ''), dtype=object))
+
+    empty = {'t': np.float64, 'x': np.float64, 'y': np.float64, 'e': np.int8, 'w': np.int32, 'url': object}
+    arrays = {
+        name: np.concatenate(parts) if parts else np.empty(0, dtype=empty[name])
+        for name, parts in columns.items()
+    }
+
+    # Sibling buckets of a window may interleave; order by time (stable)
+    order = np.argsort(arrays['t'], kind='stable')
+    if start is not None or end is not None:
+        t = arrays['t'][order]
+        keep = np.ones(len(t), dtype=bool)
+        if start is not None:
+            keep &= t >= (naive_utc(start) - _EPOCH).total_seconds() * 1000.0
+        if end is not None:
+            keep &= t <= (naive_utc(end) - _EPOCH).total_seconds() * 1000.0
+        order = order[keep]
+
+    return Trajectory(
+        str(session_id),
+        arrays['t'][order], arrays['x'][order], arrays['y'][order],
+        arrays['e'][order], arrays['w'][order], arrays['url'][order],
+    )
@@ -1,63 +1,68 @@
 """Views for the tracking app."""
 
+import os
 import uuid
 import json
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.parsers import JSONParser
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, HttpResponseNotAllowed
 from django.core.exceptions import ValidationError
 from django.conf import settings
-from .utils.mongo_client import get_collection, ensure_collections
+from django.db import close_old_connections
+from .utils.mongo_client import get_collection
+from .utils.trajectory_store import read_session_trajectory, trajectories_enabled
 from datetime import datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
-from .models import Session, Event
-from utils.mongo_client import save_event, save_session, get_events_by_session
+from .models import Session
+from .ingestion import (
+    IngestionError, extract_events, request_context, ingest_events, ingest_mouse_moves,
+    batch_status, get_client_ip
+)
+from .admission import register_pressure_source
+from .store import get_event_store
+from .codec import MOUSE_MOVES_CONTENT_TYPE, CodecError, decode_mouse_moves
+from utils import fastjson
+from utils.async_logging import log_payload
+from utils.mongo_client import save_event, save_session
 
 logger = logging.getLogger(__name__)
 
+# Các trường của mỗi event trong "mongo_events" của SessionView
+SESSION_EVENT_COLUMNS = ('session_id', 'event_type', 'timestamp', 'url', 'data')
+
 class EventsView(APIView):
     """API endpoint for tracking events."""
+    parser_classes = fastjson.PARSER_CLASSES
+    renderer_classes = fastjson.RENDERER_CLASSES
     
     def post(self, request, format=None):
         """Handle POST requests to save tracking events."""
         try:
-            # Log raw request data for debugging
-            logger.info(f"Raw request data type: {type(request.data)}")
-            logger.info(f"Raw request data: {request.data}")
-            
-            # Handle các cấu trúc dữ liệu khác nhau
-            data = request.data
+            # Log raw request data for debugging (sampled)
+            log_payload(logger, "Raw request data", request.data)
             
-            # Check if data contains an "events" array
-            if isinstance(data, dict) and 'events' in data and isinstance(data['events'], list):
-                logger.info("Processing events array from object")
-                responses = []
-                for item in data['events']:
-                    response = self.process_event(request, item)
-                    responses.append(response.data)
-                return Response({"results": responses}, status=status.HTTP_201_CREATED)
+            # Handle các cấu trúc dữ liệu khác nhau: object đơn, list, hoặc {"events": [...]}
+            items, is_batch = extract_events(request.data)
+            if not is_batch:
+                logger.debug("Processing single event")
+                return self.process_event(request, items[0])
             
-            # Handle both list and dictionary input
-            elif isinstance(data, list):
-                # Xử lý trường hợp data là list
-                logger.info("Processing list of events")
-                responses = []
-                for item in data:
-                    response = self.process_event(request, item)
-                    responses.append(response.data)
-                return Response({"results": responses}, status=status.HTTP_201_CREATED)
-            else:
-                # Xử lý trường hợp data là dictionary
-                logger.info("Processing single event")
-                return self.process_event(request, data)
+            logger.debug(f"Processing batch of {len(items)} events")
+            summary = ingest_events(items, request_context(request), default_event_type='unknown')
+            return Response({"results": summary['results']}, status=status.HTTP_201_CREATED)
                 
+        except IngestionError as e:
+            logger.error(f"Error ingesting tracking events: {str(e)}")
+            return Response({"error": str(e)}, status=e.status, headers=e.headers)
         except Exception as e:
             logger.exception(f"Error processing tracking event: {str(e)}")
             return Response(
@@ -68,62 +73,17 @@ class EventsView(APIView):
     def process_event(self, request, data):
         """Process a single tracking event."""
         try:
-            if not isinstance(data, dict):
-                logger.error(f"Invalid data type: {type(data)}")
-                return Response(
-                    {"error": f"Invalid data format. Expected dictionary, got {type(data)}"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-            # Get or create session
-            session_id = data.get('session_id')
-            if not session_id:
-                logger.error("Session ID is missing")
-                return Response(
-                    {"error": "Session ID is required"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-            try:
-                # Ensure MongoDB collections exist
-                ensure_collections()
-                
-                # Get sessions collection
-                sessions_collection = get_collection('sessions')
-                if not sessions_collection:
-                    return Response({'error': 'Failed to connect to MongoDB'}, status=500)
-                
-                # Check if session exists
-                session = sessions_collection.find_one({'session_id': session_id})
-                if not session:
-                    # Create new session
-                    session_data = {
-                        'session_id': session_id,
-                        'user_agent': request.META.get('HTTP_USER_AGENT', ''),
-                        'referrer': request.META.get('HTTP_REFERER', ''),
-                        'created_at': datetime.utcnow()
-                    }
-                    sessions_collection.insert_one(session_data)
-                    logger.info(f"Created new session: {session_id}")
-                
-                # Get events collection
-                events_collection = get_collection('events')
-                if not events_collection:
-                    return Response({'error': 'Failed to connect to MongoDB'}, status=500)
-                
-                # Save event
-                event_data = {
-                    'session_id': session_id,
-                    'event_type': data.get('event_type', 'unknown'),
-                    'data': data,
-                    'timestamp': datetime.utcnow()
-                }
-                events_collection.insert_one(event_data)
-                
+            summary = ingest_events([data], request_context(request), default_event_type='unknown')
+            result = summary['results'][0]
+            if result['status'] == 'success':
                 return Response({'status': 'success'})
-            except Exception as e:
-                logger.exception(f"Error processing event: {str(e)}")
-                return Response({'error': str(e)}, status=500)
+            
+            if summary['rejected']:
+                logger.error(f"Invalid event: {result['error']}")
+                return Response({"error": result['error']}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'error': result['error']}, status=500)
+        except IngestionError as e:
+            return Response({'error': str(e)}, status=e.status, headers=e.headers)
         except Exception as e:
             logger.exception(f"Error in process_event: {str(e)}")
             return Response(
@@ -133,15 +93,11 @@ class EventsView(APIView):
     
     def get_client_ip(self, request):
         """Get client IP address from request."""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR', '0.0.0.0')
-        return ip
+        return get_client_ip(request)
 
 class SessionView(APIView):
     """API endpoint for managing tracking sessions."""
+    renderer_classes = fastjson.RENDERER_CLASSES
     
     def get(self, request, session_id=None, format=None):
         """Get session info."""
@@ -150,12 +106,19 @@ class SessionView(APIView):
                 # Get specific session
                 try:
                     session = Session.objects.get(session_id=session_id)
-                    events_count = Event.objects.filter(session=session).count()
                     
-                    # Lấy thêm events từ MongoDB nếu có
-                    mongo_events = get_events_by_session(session_id)
+                    # Events của session, đọc từ event store đã cấu hình
+                    store = get_event_store()
+                    events = store.read_session(session_id, columns=SESSION_EVENT_COLUMNS)
+                    events_count = len(events['timestamp'])
+                    # Giữ nguyên các key mongo_events cũ: mỗi event là một dict
+                    rows = dict(events, timestamp=events['timestamp'].tolist())
+                    session_events = [
+                        {name: rows[name][i] for name in SESSION_EVENT_COLUMNS}
+                        for i in range(events_count)
+                    ]
                     
-                    return Response({
+                    payload = {
                         "session_id": str(session.session_id),
                         "user_agent": session.user_agent,
                         "ip_address": session.ip_address,
@@ -164,9 +127,23 @@ class SessionView(APIView):
                         "end_time": session.end_time,
                         "is_active": session.is_active,
                         "events_count": events_count,
-                        "mongo_events_count": len(mongo_events),
-                        "mongo_events": mongo_events
-                    })
+                        "mongo_events_count": events_count,
+                        "mongo_events": session_events,
+                    }
+                    
+                    # Quỹ đạo chuột dạng cột, đọc từ các bucket trajectory
+                    if trajectories_enabled():
+                        trajectory = read_session_trajectory(session_id)
+                        payload["trajectory"] = {
+                            "points": len(trajectory),
+                            "t": trajectory.t,
+                            "x": trajectory.x,
+                            "y": trajectory.y,
+                            "event_type": trajectory.event_type_names().tolist(),
+                            "weight": trajectory.weight,
+                        }
+                    
+                    return Response(payload)
                 except Session.DoesNotExist:
                     return Response(
                         {"error": "Session not found"}, 
@@ -180,8 +157,9 @@ class SessionView(APIView):
                 )
                 
                 data = []
+                store = get_event_store()
                 for session in page:
-                    events_count = Event.objects.filter(session=session).count()
+                    events_count = store.count_session(session.session_id)
                     data.append({
                         "session_id": str(session.session_id),
                         "user_agent": session.user_agent[:50] + "..." if len(session.user_agent) > 50 else session.user_agent,
@@ -292,12 +270,7 @@ class SessionView(APIView):
     
     def get_client_ip(self, request):
         """Get client IP address from request."""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR', '0.0.0.0')
-        return ip
+        return get_client_ip(request)
     
     # Add pagination mixin
     @property
@@ -329,125 +302,185 @@ def health_check(request):
     """Health check endpoint for Docker"""
     return JsonResponse({"status": "healthy", "timestamp": datetime.utcnow().isoformat()})
 
+def ingest_request_body(body, context, content_type=None):
+    """Parse and ingest a raw tracking payload.
+    
+    Shared by the sync and async ``/events/`` views; returns
+    ``(payload, http_status, headers)`` so callers only build the response.
+    JSON is the default; ``application/x-mouse-moves`` bodies are decoded
+    with :mod:`.codec`.
+    """
+    if content_type == MOUSE_MOVES_CONTENT_TYPE:
+        return ingest_binary_body(body, context)
+    
+    try:
+        data = fastjson.loads(body)
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON decode error: {str(e)}")
+        log_payload(logger, "Invalid request body", body, error=True)
+        return {'error': 'Invalid JSON data'}, 400, {}
+    
+    # Log raw request body for debugging (sampled)
+    log_payload(logger, "Raw request body", body)
+    
+    items, is_batch = extract_events(data)
+    if is_batch and not items:
+        return {'error': 'Empty array'}, 400, {}
+    
+    try:
+        summary = ingest_events(items, context)
+    except IngestionError as e:
+        logger.error(f"Failed to ingest events: {str(e)}")
+        return {'error': str(e)}, e.status, e.headers
+    
+    if not is_batch:
+        result = summary['results'][0]
+        if result['status'] == 'success':
+            return {'status': 'success'}, 200, {}
+        if summary['rejected']:
+            logger.error(f"Invalid event: {result['error']}")
+            return {'error': result['error']}, 400, {}
+        logger.error(f"Failed to save event: {result['error']}")
+        return {'error': 'Failed to save event'}, 500, {}
+    
+    # Batch: trả về kết quả cho từng event
+    label, http_status = batch_status(summary)
+    return {
+        'status': label,
+        'inserted': summary['inserted'],
+        'failed': summary['failed'],
+        'duplicates': summary['duplicates'],
+        'shed': summary['shed'],
+        'results': summary['results']
+    }, http_status, {}
+
+def ingest_binary_body(body, context):
+    """Decode and ingest a delta-encoded ``mouse_move`` batch."""
+    try:
+        batch = decode_mouse_moves(body)
+    except CodecError as e:
+        logger.error(f"Binary decode error: {str(e)}")
+        return {'error': f'Invalid mouse_move payload: {str(e)}'}, 400, {}
+    
+    try:
+        summary = ingest_mouse_moves(batch, context)
+    except IngestionError as e:
+        logger.error(f"Failed to ingest mouse moves: {str(e)}")
+        return {'error': str(e)}, e.status, e.headers
+    
+    label, http_status = ('success', 200) if not summary['failed'] else (
+        ('partial', 200) if summary['inserted'] else ('error', 500)
+    )
+    return {'status': label, **summary}, http_status, {}
+
+def _json_response(payload, status, headers):
+    response = HttpResponse(fastjson.dumps(payload), status=status, content_type='application/json')
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def process_event(request):
+    """Ingest a single event, a list of events or an ``{"events": [...]}`` batch."""
     try:
-        # Log raw request body for debugging
-        logger.info(f"Raw request body: {request.body}")
-        
-        try:
-            data = json.loads(request.body)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {str(e)}")
-            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
-            
-        logger.info(f"Parsed event data: {data}")
-        
-        # Ensure collections exist
-        ensure_collections()
-        
-        # Get collections
-        sessions_collection = get_collection('sessions')
-        events_collection = get_collection('events')
-        
-        # Validate and transform data
-        if isinstance(data, list):
-            if not data:
-                return JsonResponse({'error': 'Empty array'}, status=400)
-            data = data[0]  # Take first item if array
-            logger.info(f"Using first item from array: {data}")
-        
-        # Validate data
-        if not isinstance(data, dict):
-            logger.error(f"Invalid data type: {type(data)}")
-            return JsonResponse({'error': 'Invalid data format. Expected JSON object'}, status=400)
-            
-        # Get or create session
-        session_id = data.get('session_id')
-        if not session_id:
-            logger.error("Missing session_id in request")
-            return JsonResponse({'error': 'session_id is required'}, status=400)
-            
-        # Get event data
-        event_type = data.get('event_type')
-        event_data = data.get('data', {})
-        event_url = data.get('url', '')  # Get URL from event data
-        
-        if not event_type:
-            logger.error("Missing event_type in request")
-            return JsonResponse({'error': 'event_type is required'}, status=400)
-            
-        # Get or create session
-        session = sessions_collection.find_one({'session_id': session_id})
-        if not session:
-            session = {
-                'session_id': session_id,
-                'created_at': datetime.utcnow(),
-                'last_activity': datetime.utcnow(),
-                'user_agent': request.headers.get('User-Agent', ''),
-                'referer': request.headers.get('Referer', '')
-            }
-            try:
-                sessions_collection.insert_one(session)
-                logger.info(f"Created new session: {session_id}")
-            except Exception as e:
-                logger.error(f"Failed to save session to MongoDB: {session_id}")
-                logger.error(str(e))
-                return JsonResponse({'error': 'Failed to create session'}, status=500)
-        else:
-            # Update last activity
-            try:
-                sessions_collection.update_one(
-                    {'session_id': session_id},
-                    {'$set': {'last_activity': datetime.utcnow()}}
+        return _json_response(*ingest_request_body(
+            request.body, request_context(request), request.content_type
+        ))
+    except Exception as e:
+        logger.error(f"Error processing event: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+_ingest_executor = None
+_ingest_executor_pid = None
+_ingest_slots = None
+_ingest_in_flight = 0
+_ingest_executor_lock = threading.Lock()
+
+def get_ingest_executor():
+    """Return the bounded thread pool (and its admission semaphore) for async ingestion."""
+    global _ingest_executor, _ingest_executor_pid, _ingest_slots
+    pid = os.getpid()
+    if _ingest_executor is None or _ingest_executor_pid != pid:
+        with _ingest_executor_lock:
+            if _ingest_executor is None or _ingest_executor_pid != pid:
+                config = settings.TRACKING_ASYNC_INGESTION
+                _ingest_executor = ThreadPoolExecutor(
+                    max_workers=config['MAX_WORKERS'],
+                    thread_name_prefix='tracking-ingest'
                 )
-            except Exception as e:
-                logger.error(f"Failed to update session activity: {session_id}")
-                logger.error(str(e))
-        
-        # Save event with URL from event data
-        try:
-            event = {
-                'session_id': session_id,
-                'event_type': event_type,
-                'data': event_data,
-                'timestamp': datetime.utcnow(),
-                'url': event_url,  # Use URL from event data
-                'path': request.path,
-                'method': request.method,
-                'user_agent': request.headers.get('User-Agent', '')
-            }
-            events_collection.insert_one(event)
-            logger.info(f"Saved event for session {session_id}: {event_type} at URL: {event_url}")
-        except Exception as e:
-            logger.error(f"Failed to save event: {session_id}")
-            logger.error(str(e))
-            return JsonResponse({'error': 'Failed to save event'}, status=500)
-        
-        return JsonResponse({'status': 'success'})
-        
+                _ingest_slots = threading.BoundedSemaphore(config['MAX_PENDING'])
+                _ingest_executor_pid = pid
+    return _ingest_executor, _ingest_slots
+
+def run_in_ingest_thread(function, *args):
+    """Run ``function`` on a pool thread with request-like DB connection handling.
+
+    Pool threads are not request threads, so Django never closes the ORM
+    connections (SQLite store, session upserts) they open.
+    """
+    close_old_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+def async_ingestion_pressure():
+    """Share of ``MAX_PENDING`` async ingestion slots in use (admission control signal)."""
+    return _ingest_in_flight / max(settings.TRACKING_ASYNC_INGESTION['MAX_PENDING'], 1)
+
+register_pressure_source('async_ingestion', async_ingestion_pressure)
+
+async def process_event_async(request):
+    """Async variant of ``process_event`` for the ASGI stack.
+    
+    The request is parsed on the event loop and the blocking Mongo work is
+    offloaded to a bounded thread pool, so idle keep-alive tracker
+    connections do not hold a worker thread. When ``MAX_PENDING`` requests
+    are already in flight the view answers 503 instead of queueing.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    
+    global _ingest_in_flight
+    executor, slots = get_ingest_executor()
+    if not slots.acquire(blocking=False):
+        return _json_response(
+            {'error': 'Too many in-flight tracking requests'}, 503,
+            {'Retry-After': str(settings.TRACKING_ASYNC_INGESTION['RETRY_AFTER'])}
+        )
+    _ingest_in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            executor, run_in_ingest_thread, ingest_request_body, request.body, request_context(request),
+            request.content_type
+        )
+        return _json_response(*result)
     except Exception as e:
         logger.error(f"Error processing event: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
+    finally:
+        _ingest_in_flight -= 1
+        slots.release()
+
+# Django 4.2's csrf_exempt/require_http_methods wrappers are sync-only, so the
+# async view is marked exempt directly and checks the method itself.
+process_event_async.csrf_exempt = True
 
 @csrf_exempt
 @require_http_methods(["PATCH"])
 def update_session(request, session_id):
     try:
-        # Log raw request body for debugging
-        logger.info(f"Raw request body for session {session_id}: {request.body}")
-        
         try:
-            data = json.loads(request.body)
+            data = fastjson.loads(request.body)
         except json.JSONDecodeError as e:
             logger.error(f"JSON decode error: {str(e)}")
+            log_payload(logger, f"Invalid request body for session {session_id}", request.body, error=True)
             return JsonResponse({'error': 'Invalid JSON data'}, status=400)
-            
-        logger.info(f"Parsed update data: {data}")
         
-        # Ensure collections exist
-        ensure_collections()
+        # Log raw request body for debugging (sampled)
+        log_payload(logger, f"Raw request body for session {session_id}", request.body)
         
         # Get sessions collection
         sessions_collection = get_collection('sessions')
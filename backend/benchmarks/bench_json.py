@@ -0,0 +1,133 @@
+"""
+Benchmark: DRF's JSONRenderer/JSONParser vs utils.fastjson.
+
+Covers the payload shapes of the tracking and analytics endpoints: an
+ingestion batch, a session_mouse_analytics result (heatmap points plus a
+192x108 grid) and raw Mongo event documents (the old ``json_util``
+round-trip in get_events_by_session vs rendering them directly).
+
+Chạy từ thư mục backend:
+
+    python benchmarks/bench_json.py
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('MONGODB_BOOTSTRAP_ON_STARTUP', '0')
+
+import django
+
+django.setup()
+
+from bson import ObjectId, json_util
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from utils import fastjson
+
+
+def ingestion_batch(count=2000):
+    session_id = str(uuid.uuid4())
+    return json.dumps([
+        {
+            'session_id': session_id,
+            'event_type': 'mouse_move',
+            'timestamp': 1_700_000_000_000 + i * 16,
+            'url': 'http://localhost:3000/tracking-demo',
+            'data': {'x': i % 1920, 'y': i % 1080, 'window_width': 1920, 'window_height': 1080},
+        }
+        for i in range(count)
+    ]).encode('utf-8')
+
+
+def analytics_result(rng):
+    grid = rng.random((108, 192))
+    return {
+        'session_id': str(uuid.uuid4()),
+        'events_count': 20000,
+        'metrics': {
+            'min_x': np.int64(0), 'max_x': np.int64(1919),
+            'avg_speed': np.float64(812.5),
+            'heatmap': grid.tolist(),
+        },
+        'grid': grid,
+        'heatmap': {
+            'width': 1000,
+            'height': 800,
+            'points': [
+                {'x': int(x), 'y': int(y), 'value': float(v)}
+                for x, y, v in zip(rng.integers(0, 1000, 20000), rng.integers(0, 800, 20000), rng.random(20000))
+            ],
+            'max_value': 1.0,
+        },
+    }
+
+
+def mongo_documents(count=5000):
+    now = datetime.utcnow()
+    return [
+        {
+            '_id': ObjectId(),
+            'session_id': str(uuid.uuid4()),
+            'event_type': 'mouse_move',
+            'data': {'x': i % 1920, 'y': i % 1080},
+            'timestamp': now + timedelta(milliseconds=i),
+            'url': 'http://localhost:3000/tracking-demo',
+        }
+        for i in range(count)
+    ]
+
+
+def best_of(fn, repeat=10):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def report(name, baseline, fast):
+    (base_time, base_bytes), (fast_time, fast_bytes) = baseline, fast
+    print(f"{name}")
+    print(f"  baseline: {base_time * 1000:8.2f} ms  {base_bytes / base_time / 1e6:8.1f} MB/s")
+    print(f"  fastjson: {fast_time * 1000:8.2f} ms  {fast_bytes / fast_time / 1e6:8.1f} MB/s"
+          f"  ({base_time / fast_time:.1f}x)")
+
+
+def main():
+    rng = np.random.default_rng(42)
+    drf_renderer, fast_renderer = JSONRenderer(), fastjson.FastJSONRenderer()
+    drf_parser, fast_parser = JSONParser(), fastjson.FastJSONParser()
+    print(f"orjson: {'yes' if fastjson.orjson is not None else 'no (stdlib fallback)'}\n")
+
+    body = ingestion_batch()
+    base = best_of(lambda: drf_parser.parse(io.BytesIO(body)))[0]
+    fast = best_of(lambda: fast_parser.parse(io.BytesIO(body)))[0]
+    report('parse ingestion batch (2000 events)', (base, len(body)), (fast, len(body)))
+
+    result = analytics_result(rng)
+    # DRF's encoder handles the ndarray via tolist(); same data, same shape
+    base, out = best_of(lambda: drf_renderer.render(result))
+    fast, fast_out = best_of(lambda: fast_renderer.render(result))
+    report('render session_mouse_analytics result', (base, len(out)), (fast, len(fast_out)))
+
+    docs = mongo_documents()
+    base, out = best_of(lambda: drf_renderer.render(json.loads(json_util.dumps(docs))))
+    fast, fast_out = best_of(lambda: fast_renderer.render(docs))
+    report('render mongo_events (json_util round-trip vs direct)', (base, len(out)), (fast, len(fast_out)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: JSON vs delta-encoded binary payloads for mouse_move batches.
+
+Chạy từ thư mục backend:
+
+    python benchmarks/bench_mouse_moves.py [points]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apps.tracking.codec import encode_mouse_moves, decode_mouse_moves
+
+
+def make_points(count, seed=42):
+    """Random-walk cursor trajectory sampled every ~100 ms."""
+    rng = np.random.default_rng(seed)
+    t = 1_700_000_000_000 + np.cumsum(rng.integers(80, 120, count)).astype(np.float64)
+    x = np.clip(960 + np.cumsum(rng.integers(-25, 26, count)), 0, 1919)
+    y = np.clip(540 + np.cumsum(rng.integers(-25, 26, count)), 0, 1079)
+    return t, x, y
+
+
+def json_payload(session_id, url, t, x, y):
+    return json.dumps([
+        {
+            'event_type': 'mouse_move',
+            'timestamp': int(ts),
+            'url': url,
+            'session_id': session_id,
+            'data': {'x': int(px), 'y': int(py), 'window_width': 1920, 'window_height': 1080},
+        }
+        for ts, px, py in zip(t, x, y)
+    ]).encode('utf-8')
+
+
+def parse_json(body):
+    events = json.loads(body)
+    xs, ys = [], []
+    for event in events:
+        data = event.get('data', {})
+        if 'x' in data and 'y' in data:
+            xs.append(float(data['x']))
+            ys.append(float(data['y']))
+    return np.array(xs), np.array(ys)
+
+
+def timeit(fn, *args, repeat=20):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    session_id = str(uuid.uuid4())
+    url = 'http://localhost:3000/tracking-demo'
+    t, x, y = make_points(count)
+
+    json_body = json_payload(session_id, url, t, x, y)
+    binary_body = encode_mouse_moves(session_id, url, t, x, y)
+
+    decoded = decode_mouse_moves(binary_body)
+    assert np.array_equal(decoded.x, x) and np.array_equal(decoded.y, y)
+
+    json_time = timeit(parse_json, json_body)
+    binary_time = timeit(decode_mouse_moves, binary_body)
+
+    print(f"Points:            {count}")
+    print(f"JSON payload:      {len(json_body):>10} bytes ({len(json_body) / count:.1f} B/point)")
+    print(f"Binary payload:    {len(binary_body):>10} bytes ({len(binary_body) / count:.1f} B/point)")
+    print(f"Size ratio:        {len(json_body) / len(binary_body):.1f}x")
+    print(f"JSON parse:        {json_time * 1000:.3f} ms")
+    print(f"Binary decode:     {binary_time * 1000:.3f} ms")
+    print(f"Parse speedup:     {json_time / binary_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
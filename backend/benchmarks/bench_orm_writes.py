@@ -0,0 +1,117 @@
+"""
+Benchmark: Event writes through the ORM, row by row vs batched, with and
+without the SQLite pragmas of utils.sqlite_tuning.
+
+"row by row" is the old list path of EventViewSet.create: one
+EventSerializer.save() (session lookup + INSERT + commit) per event.
+"bulk" is apps.tracking.bulk.bulk_create_events: one IN query for the
+sessions and bulk_create in one transaction. Every scenario runs against a
+fresh database file in a temporary directory.
+
+Chạy từ thư mục backend:
+
+    python benchmarks/bench_orm_writes.py [events]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('MONGODB_BOOTSTRAP_ON_STARTUP', '0')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+
+from apps.api.serializers import EventSerializer
+from apps.tracking.bulk import bulk_create_events
+from apps.tracking.models import Event, Session
+from utils.sqlite_tuning import PRAGMA_DEFAULTS
+
+SESSIONS = 50
+
+
+def make_events(count, session_ids):
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    return [{
+        'session_id': session_ids[i % len(session_ids)],
+        'event_type': 'mouse_click',
+        'timestamp': start + timedelta(milliseconds=i),
+        'url': f'http://localhost:3000/page/{i % 20}',
+        'data': {'x': i % 1920, 'y': i % 1080, 'button': 0},
+    } for i in range(count)]
+
+
+def use_database(path, pragmas):
+    connection.close()
+    settings.SQLITE_PRAGMAS = pragmas
+    connection.settings_dict['NAME'] = path
+    call_command('migrate', verbosity=0)
+    session_ids = [str(uuid.uuid4()) for _ in range(SESSIONS)]
+    Session.objects.bulk_create([
+        Session(session_id=session_id, user_agent='bench', ip_address='127.0.0.1') for session_id in session_ids
+    ])
+    return session_ids
+
+
+def row_by_row(events):
+    for event in events:
+        serializer = EventSerializer(data={
+            'session': event['session_id'],
+            'event_type': event['event_type'],
+            'timestamp': event['timestamp'].isoformat(),
+            'url': event['url'],
+            'data': event['data'],
+        })
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+
+def bulk(events, batch_size=500):
+    for start in range(0, len(events), batch_size):
+        bulk_create_events(events[start:start + batch_size])
+
+
+def run(directory, name, pragmas, writer, count):
+    session_ids = use_database(os.path.join(directory, f'{name}.sqlite3'), pragmas)
+    events = make_events(count, session_ids)
+    started = time.perf_counter()
+    writer(events)
+    elapsed = time.perf_counter() - started
+    assert Event.objects.count() == count
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal = cursor.fetchone()[0]
+    return count / elapsed, journal
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    scenarios = [
+        ('row_default', {}, row_by_row),
+        ('row_wal', PRAGMA_DEFAULTS, row_by_row),
+        ('bulk_default', {}, bulk),
+        ('bulk_wal', PRAGMA_DEFAULTS, bulk),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        results = {name: run(directory, name, pragmas, writer, count) for name, pragmas, writer in scenarios}
+        connection.close()
+
+    baseline = results['row_default'][0]
+    print(f"Events: {count} ({SESSIONS} sessions, bulk batches of 500)")
+    print(f"{'':16}{'journal':>10}{'rows/s':>12}{'speedup':>10}")
+    for name, (rate, journal) in results.items():
+        print(f"{name:16}{journal:>10}{rate:>12.0f}{rate / baseline:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark: plain vs time-series (zstd) ``events`` collection.
+
+Loads the same synthetic events into a plain collection (default snappy
+compression, current indexes) and a time-series collection created by
+apps.tracking.utils.timeseries, then compares on-disk size and the range
+scans issued by MousePositionAnalyticsView (mouse events of the last 7 / 30
+days, newest first, limit 1000) plus a full 7-day scan.
+
+Cần một MongoDB thật (6.0+). Chạy từ thư mục backend:
+
+    MONGODB_URI=mongodb://localhost:27017/ python benchmarks/bench_timeseries.py [events] [--keep]
+"""
+
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('MONGODB_BOOTSTRAP_ON_STARTUP', '0')
+
+import django
+
+django.setup()
+
+from apps.tracking.utils.mongo_schema import INDEXES
+from apps.tracking.utils.timeseries import (
+    TIMESERIES_DEFAULTS, add_meta, create_timeseries_collection
+)
+
+DB_NAME = 'bench_timeseries'
+EVENT_TYPES = np.array(['mouse_move', 'mouse_click', 'scroll', 'page_view', 'form_input'])
+EVENT_WEIGHTS = np.array([0.80, 0.08, 0.07, 0.03, 0.02])
+MOUSE_TYPES = ['mouse_move', 'mouse_click']
+
+
+def make_events(count, days=30, sessions=2000, seed=42):
+    """Sessions of consecutive events spread over ``days``, like tracker traffic."""
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    starts = rng.uniform(0, days * 86400, sessions)
+    owners = np.sort(rng.integers(0, sessions, count))
+    offsets = rng.exponential(0.5, count)
+    event_types = rng.choice(EVENT_TYPES, count, p=EVENT_WEIGHTS)
+    xs = rng.integers(0, 1920, count)
+    ys = rng.integers(0, 1080, count)
+
+    events = []
+    elapsed = {}
+    for i in range(count):
+        owner = int(owners[i])
+        elapsed[owner] = elapsed.get(owner, 0.0) + float(offsets[i])
+        event_type = str(event_types[i])
+        data = {'x': int(xs[i]), 'y': int(ys[i])} if event_type in MOUSE_TYPES else {}
+        events.append({
+            'session_id': session_ids[owner],
+            'event_type': event_type,
+            'data': data,
+            'timestamp': now - timedelta(seconds=float(starts[owner])) + timedelta(seconds=elapsed[owner]),
+            'url': f'http://localhost:3000/page/{owner % 50}',
+            'path': '/api/tracking/events/',
+            'method': 'POST',
+            'user_agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+        })
+    return events, now
+
+
+def load(collection, events, batch_size=10000):
+    started = time.perf_counter()
+    for start in range(0, len(events), batch_size):
+        collection.insert_many([dict(e) for e in events[start:start + batch_size]], ordered=False)
+    return time.perf_counter() - started
+
+
+def timeit(fn, repeat=10):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def analytics_query(collection, since, limit=1000):
+    return list(collection.find(
+        {'event_type': {'$in': MOUSE_TYPES}, 'timestamp': {'$gte': since}},
+        {'_id': 0, 'event_type': 1, 'timestamp': 1, 'url': 1, 'session_id': 1, 'data': 1}
+    ).sort('timestamp', -1).limit(limit))
+
+
+def full_scan(collection, since):
+    return list(collection.find(
+        {'event_type': {'$in': MOUSE_TYPES}, 'timestamp': {'$gte': since}},
+        {'_id': 0, 'timestamp': 1, 'data': 1}
+    ))
+
+
+def mb(value):
+    return f"{value / 1048576:.1f} MB"
+
+
+def ms(value):
+    return f"{value * 1000:.1f} ms"
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 200000
+    keep = '--keep' in sys.argv
+    client = MongoClient(os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/'))
+    client.drop_database(DB_NAME)
+    db = client[DB_NAME]
+
+    events, now = make_events(count)
+
+    db.create_collection('events_plain')
+    db.events_plain.create_indexes(INDEXES['events'])
+    create_timeseries_collection(db, 'events_ts', {**TIMESERIES_DEFAULTS, 'ENABLED': True})
+    db.events_ts.create_indexes(INDEXES['events'])
+
+    plain_load = load(db.events_plain, events)
+    ts_load = load(db.events_ts, add_meta([dict(e) for e in events]))
+
+    db.command('fsync')
+    sizes = {}
+    for name in ('events_plain', 'events_ts'):
+        stats = db.command('collStats', name)
+        # Time-series stats describe the internal bucket collection
+        sizes[name] = (stats.get('storageSize', 0), stats.get('totalIndexSize', 0))
+
+    since_7d = now - timedelta(days=7)
+    since_30d = now - timedelta(days=30)
+    timings = {}
+    for name in ('events_plain', 'events_ts'):
+        collection = db[name]
+        timings[name] = (
+            timeit(lambda: analytics_query(collection, since_7d)),
+            timeit(lambda: analytics_query(collection, since_30d)),
+            timeit(lambda: full_scan(collection, since_7d), repeat=3),
+        )
+
+    print(f"Events:                   {count}")
+    print(f"{'':26}{'plain':>14}{'time-series':>14}{'ratio':>8}")
+
+    def row(label, plain, ts, fmt):
+        ratio = plain / ts if ts else float('inf')
+        print(f"{label:26}{fmt(plain):>14}{fmt(ts):>14}{ratio:>7.1f}x")
+
+    row('Load', plain_load, ts_load, ms)
+    row('Storage size', sizes['events_plain'][0], sizes['events_ts'][0], mb)
+    row('Index size', sizes['events_plain'][1], sizes['events_ts'][1], mb)
+    row('Analytics 7d (limit)', timings['events_plain'][0], timings['events_ts'][0], ms)
+    row('Analytics 30d (limit)', timings['events_plain'][1], timings['events_ts'][1], ms)
+    row('Mouse events 7d (full)', timings['events_plain'][2], timings['events_ts'][2], ms)
+
+    if not keep:
+        client.drop_database(DB_NAME)
+
+
+if __name__ == '__main__':
+    main()
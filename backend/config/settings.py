@@ -43,6 +43,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'apps.tracking.middleware.DecompressRequestMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -81,6 +82,18 @@ DATABASES = {
     }
 }
 
+# PRAGMAs run on every new SQLite connection (utils/sqlite_tuning.py): WAL
+# journal, synchronous=NORMAL and memory-mapped reads. Set SQLITE_TUNING=0 to
+# keep SQLite's defaults.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,
+    'busy_timeout': 5000,
+} if os.environ.get('SQLITE_TUNING', '1') == '1' else {}
+
 # Cấu hình MongoDB đã được chuyển sang utils/mongo_client.py
 # Sử dụng pymongo trực tiếp thay vì thông qua djongo
 
@@ -144,6 +157,7 @@ CORS_ALLOWED_HEADERS = [
     'accept',
     'accept-encoding',
     'authorization',
+    'content-encoding',
     'content-type',
     'dnt',
     'origin',
@@ -151,6 +165,8 @@ CORS_ALLOWED_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
+# django-cors-headers reads CORS_ALLOW_HEADERS; trackers need content-encoding
+CORS_ALLOW_HEADERS = CORS_ALLOWED_HEADERS
 
 # Logging Configuration
 LOGGING = {
@@ -190,9 +206,26 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'utils': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
+# The tracking loggers above are switched to a bounded queue drained by a
+# writer thread at startup (utils.async_logging); request payloads are only
+# logged for 1 in PAYLOAD_SAMPLE_RATE requests, or only with errors.
+TRACKING_LOGGING = {
+    'ASYNC': os.environ.get('TRACKING_ASYNC_LOGGING', '1') == '1',
+    'LOGGERS': ['apps.tracking', 'utils'],
+    'QUEUE_SIZE': 10000,        # records beyond this are dropped (and counted)
+    'PAYLOAD_MODE': os.environ.get('TRACKING_PAYLOAD_LOGGING', 'sample'),  # all | sample | errors | off
+    'PAYLOAD_SAMPLE_RATE': int(os.environ.get('TRACKING_PAYLOAD_SAMPLE_RATE', 100)),
+    'PAYLOAD_MAX_CHARS': 2000,
+}
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -212,8 +245,89 @@ MONGODB_URI = os.environ.get('MONGODB_URI', 'mongodb://mongo:27017/mouse_tracker
 MONGODB_DB_NAME = 'mouse_tracker'
 MONGODB_COLLECTIONS = {
     'sessions': 'sessions',
-    'events': 'events',
-    'analytics': 'analytics'
+    # Points to the time-series copy after `manage.py migrate_events_timeseries --verify`
+    'events': os.environ.get('MONGODB_EVENTS_COLLECTION', 'events'),
+    'analytics': 'analytics',
+    'trajectories': 'trajectories',
+    'rollups': 'rollups',
+    'aggregates': 'aggregates',
+    'schema_versions': 'schema_versions'
+}
+
+# Collections/indexes are created by `manage.py bootstrap_mongo` as a deploy
+# step (see Dockerfile). Enable to also check the recorded schema version in
+# AppConfig.ready(), i.e. in every process that loads Django.
+MONGODB_BOOTSTRAP_ON_STARTUP = os.environ.get('MONGODB_BOOTSTRAP_ON_STARTUP', '0') == '1'
+
+# Create `events` as a time-series collection (timeField timestamp, metaField
+# meta = {session_id, event_type}) with zstd block compression. Existing plain
+# collections are converted with `manage.py migrate_events_timeseries`.
+MONGODB_TIMESERIES = {
+    'ENABLED': os.environ.get('MONGODB_TIMESERIES', '0') == '1',
+    'GRANULARITY': 'seconds',
+    'BLOCK_COMPRESSOR': os.environ.get('MONGODB_BLOCK_COMPRESSOR', 'zstd'),
+    'EXPIRE_AFTER_SECONDS': None,
+}
+
+# Store every tracking read and write goes through: 'mongo' (events collection,
+# trajectory buckets) or 'sqlite' (Django Event model). Scans yield columnar
+# chunks of CHUNK_SIZE events.
+TRACKING_EVENT_STORE = {
+    'BACKEND': os.environ.get('TRACKING_EVENT_STORE', 'mongo'),
+    'CHUNK_SIZE': int(os.environ.get('TRACKING_EVENT_STORE_CHUNK_SIZE', 10000)),
+}
+
+# Tiered retention of raw events (days per event type, None = keep forever).
+# `apply_retention` rolls every closed day up into `rollups` (heatmap grids,
+# hourly counts, paths, funnels) before raw events of that day may expire.
+# MODE 'delete' deletes expired events in batches; 'ttl' stamps `expire_at` at
+# ingestion and lets a TTL index expire Mongo events. A day is rolled up
+# ROLLUP_DELAY_SECONDS after it ends; keep it above the broker loader's lag
+# (consume_tracking_events) so late inserts are counted.
+TRACKING_RETENTION = {
+    'ENABLED': os.environ.get('TRACKING_RETENTION', '1') == '1',
+    'MODE': os.environ.get('TRACKING_RETENTION_MODE', 'delete'),
+    'DEFAULT_DAYS': 90,
+    'EVENT_TYPES': {
+        'mouse_move': 7,
+        'scroll': 30,
+        'mouse_click': 90,
+        'page_view': 90,
+        'form_input': 90,
+    },
+    'DELETE_BATCH_SIZE': 5000,
+    'ROLLUP_DELAY_SECONDS': int(os.environ.get('TRACKING_ROLLUP_DELAY_SECONDS', 3600)),
+}
+
+# Columnar archive written by `manage.py archive_events`: Parquet files
+# partitioned by date=/event_type=, replacing the per-event JSON files of the
+# HDFS sink connector. PATH may be a local directory or a pyarrow URI
+# (hdfs://...). SOURCE is the events change stream or the broker topic.
+TRACKING_ARCHIVE = {
+    'PATH': os.environ.get('TRACKING_ARCHIVE_PATH', str(BASE_DIR / 'archive')),
+    'SOURCE': os.environ.get('TRACKING_ARCHIVE_SOURCE', 'change_stream'),
+    'FLUSH_ROWS': int(os.environ.get('TRACKING_ARCHIVE_FLUSH_ROWS', 100000)),
+    'FLUSH_SECONDS': int(os.environ.get('TRACKING_ARCHIVE_FLUSH_SECONDS', 60)),
+    'COMPRESSION': 'zstd',
+    'CONSUMER_GROUP': os.environ.get('TRACKING_ARCHIVE_CONSUMER_GROUP', 'mouse-tracker-archiver'),
+}
+
+# Offline batch analytics (`manage.py batch_analytics`, task
+# generate_batch_analysis) over archived Parquet/JSON-lines files. PATH
+# defaults to the archive above; WORKERS processes read partitions in parallel.
+ANALYTICS_BATCH = {
+    'PATH': os.environ.get('ANALYTICS_BATCH_PATH') or None,
+    'WORKERS': int(os.environ.get('ANALYTICS_BATCH_WORKERS', os.cpu_count() or 1)),
+    'SESSION_LOOKBACK_DAYS': 1,
+}
+
+# Incremental aggregates (`manage.py aggregate_events`): per-URL heatmap
+# cells, per-session summaries and page transitions updated from the events
+# change stream, flushed as batched $inc upserts into `aggregates`.
+TRACKING_AGGREGATOR = {
+    'FLUSH_EVENTS': int(os.environ.get('TRACKING_AGGREGATOR_FLUSH_EVENTS', 5000)),
+    'FLUSH_SECONDS': float(os.environ.get('TRACKING_AGGREGATOR_FLUSH_SECONDS', 2)),
+    'SESSION_CACHE_SIZE': 100000,
 }
 
 # MongoDB client settings
@@ -228,4 +342,151 @@ MONGODB_CLIENT_SETTINGS = {
     'w': 'majority',
     'wtimeout': 2500,
     'readPreference': 'secondaryPreferred'
-} 
\ No newline at end of file
+}
+
+# Interval (seconds) of the background health probe on the shared MongoDB client.
+# Set to 0 to disable the probe.
+MONGODB_HEALTH_CHECK_INTERVAL = int(os.environ.get('MONGODB_HEALTH_CHECK_INTERVAL', 30))
+
+# Write-behind buffer for tracking events: ingestion returns as soon as events
+# are queued and a background thread flushes them in bulk.
+TRACKING_WRITE_BEHIND = {
+    'ENABLED': os.environ.get('TRACKING_WRITE_BEHIND', '0') == '1',
+    'FLUSH_SIZE': 500,          # flush when this many events are pending
+    'FLUSH_INTERVAL_MS': 200,   # ...or when the oldest event has waited this long
+    'MAX_PENDING': 50000,       # memory bound; beyond this requests are rejected
+    'FULL_STATUS': 503,         # HTTP status returned when the buffer is full (503 or 429)
+    'RETRY_AFTER': 1,           # seconds, sent in the Retry-After header
+    'DRAIN_TIMEOUT': 10,        # seconds allowed to drain the buffer on shutdown
+}
+
+# Known-session cache used by ingestion: a session document is upserted at
+# most once per TOUCH_INTERVAL seconds, however many events it receives.
+TRACKING_SESSION_CACHE = {
+    'MAX_SIZE': 100000,     # LRU bound on cached session ids
+    'TTL': 3600,            # seconds before a cached session is re-upserted unconditionally
+    'TOUCH_INTERVAL': 30,   # seconds between last_activity updates for one session
+}
+
+# Async /api/tracking/events/ view for the ASGI stack (daphne/uvicorn). Mongo
+# work is offloaded to a bounded thread pool; requests beyond MAX_PENDING get 503.
+TRACKING_ASYNC_INGESTION = {
+    'ENABLED': os.environ.get('TRACKING_ASYNC_INGESTION', '0') == '1',
+    'MAX_WORKERS': 32,      # threads doing blocking Mongo writes
+    'MAX_PENDING': 2000,    # in-flight requests admitted before answering 503
+    'RETRY_AFTER': 1,       # seconds, sent in the Retry-After header
+}
+
+# Per-event-type data schemas (apps.tracking.schemas). Unknown event types
+# are validated as 'custom' unless STRICT_EVENT_TYPES is set.
+TRACKING_SCHEMA = {
+    'STRICT_EVENT_TYPES': os.environ.get('TRACKING_STRICT_EVENT_TYPES', '0') == '1',
+}
+
+# Events tagged with a client ``seq`` are deduplicated on (session_id, seq)
+# for WINDOW_SECONDS so tracker retries do not write the same event twice.
+TRACKING_DEDUP = {
+    'ENABLED': os.environ.get('TRACKING_DEDUP', '1') == '1',
+    'WINDOW_SECONDS': 600,
+    'GENERATIONS': 4,
+    'MAX_KEYS': 200000,
+}
+
+# Token buckets per session and per client IP (events/second, burst size).
+# Under load mouse_move is shed first; page_view, mouse_click and form_input
+# are always admitted. Shed counters are exposed on /api/tracking/metrics/.
+TRACKING_ADMISSION = {
+    'ENABLED': os.environ.get('TRACKING_ADMISSION', '1') == '1',
+    'SESSION_RATE': int(os.environ.get('TRACKING_SESSION_RATE', '50')),
+    'SESSION_BURST': 500,
+    'IP_RATE': int(os.environ.get('TRACKING_IP_RATE', '200')),
+    'IP_BURST': 2000,
+    'SHED_MOVES_AT': 0.75,
+    'SHED_OTHERS_AT': 0.95,
+}
+
+# mouse_move runs are simplified per session before they are written (RDP or
+# distance/time thresholds); kept points store the number of points they
+# stand for in ``weight`` so heatmaps can reweight.
+TRACKING_SIMPLIFY = {
+    'ENABLED': os.environ.get('TRACKING_SIMPLIFY', '1') == '1',
+    'METHOD': os.environ.get('TRACKING_SIMPLIFY_METHOD', 'rdp'),
+    'TOLERANCE_PX': float(os.environ.get('TRACKING_SIMPLIFY_TOLERANCE_PX', '3')),
+    'MIN_DISTANCE_PX': 10.0,
+    'MAX_INTERVAL_MS': 1000,
+}
+
+# Bucketed per-session trajectories (apps.tracking.utils.trajectory_store):
+# mouse_move/mouse_click points are also appended to one document per
+# session, URL and WINDOW_SECONDS. With KEEP_EVENTS off, mouse_move is only
+# stored in the buckets.
+TRACKING_TRAJECTORIES = {
+    'ENABLED': os.environ.get('TRACKING_TRAJECTORIES', '0') == '1',
+    'WINDOW_SECONDS': 300,
+    'MAX_POINTS': 1000,
+    'KEEP_EVENTS': os.environ.get('TRACKING_TRAJECTORIES_KEEP_EVENTS', '1') == '1',
+}
+
+# Compressed tracker bodies (Content-Encoding: gzip, deflate, br) are inflated
+# by apps.tracking.middleware; larger inflated bodies are rejected with 413.
+TRACKING_DECOMPRESSION = {
+    'PATH_PREFIX': '/api/tracking/',
+    'MAX_DECOMPRESSED_BYTES': int(os.environ.get('TRACKING_MAX_DECOMPRESSED_BYTES', 10 * 1024 * 1024)),
+}
+
+# Ingestion backend: 'mongo' writes inline (or via the write-behind buffer);
+# 'kafka' only publishes validated events keyed by session_id and the
+# consume_tracking_events command bulk-loads them into MongoDB. 'memory' is
+# an in-process stand-in for tests. The topic carries batch envelopes, so it
+# must not be one the Mongo sink connector reads (curl/init.json).
+TRACKING_BROKER = {
+    'BACKEND': os.environ.get('TRACKING_INGESTION_BACKEND', 'mongo'),
+    'TOPIC': os.environ.get('TRACKING_KAFKA_TOPIC', 'mouse-tracking-batches'),
+    'BOOTSTRAP_SERVERS': os.environ.get('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092'),
+    'LINGER_MS': 20,                # producer batching window
+    'BATCH_MESSAGES': 10000,
+    'ACKS': '1',                    # leader ack, reported asynchronously
+    'COMPRESSION': 'lz4',
+    'QUEUE_MAX_MESSAGES': 100000,   # local producer queue; beyond this requests get FULL_STATUS
+    'CONSUMER_GROUP': 'mouse-tracker-mongo-loader',
+    'CONSUMER_BATCH_SIZE': 1000,    # messages per Mongo bulk write in the loader
+    'CONSUMER_TIMEOUT_MS': 500,
+    'FULL_STATUS': 503,
+    'RETRY_AFTER': 1,
+    'DRAIN_TIMEOUT': 10,            # seconds to deliver queued messages on shutdown
+}
+
+# Channels: Redis when REDIS_HOST is set, otherwise an in-process layer
+# (enough for a single ASGI worker in development).
+if os.environ.get('REDIS_HOST'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [(os.environ['REDIS_HOST'], int(os.environ.get('REDIS_PORT', 6379)))],
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# WebSocket ingestion channel (ws/tracking/): events are buffered per
+# connection and written in bulk, then acknowledged by frame sequence number.
+TRACKING_WEBSOCKET = {
+    'FLUSH_SIZE': 200,          # events buffered per connection before a bulk write
+    'FLUSH_INTERVAL_MS': 250,   # max time an event waits in the connection buffer
+    'MAX_FRAME_EVENTS': 1000,   # larger frames are rejected with a nack
+}
+
+# Live viewers (ws/tracking/live/) subscribe to session ids or URLs; updates
+# are throttled to rate_hz messages/second with mouse moves coalesced.
+TRACKING_LIVE = {
+    'DEFAULT_RATE_HZ': 10,
+    'MAX_RATE_HZ': 30,
+    'MAX_SUBSCRIPTIONS': 50,        # topics per viewer connection
+    'MAX_EVENTS_PER_TICK': 100,     # non-coalesced events per message; extra are dropped
+}
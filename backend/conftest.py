@@ -0,0 +1,192 @@
+"""Shared pytest fixtures.
+
+Tests never talk to MongoDB or Kafka: the ``mongo`` fixture routes every
+``get_collection`` call to in-memory :class:`FakeCollection` objects and
+the broker runs on the ``memory`` backend.
+"""
+
+import copy
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from pymongo import ReplaceOne
+
+
+def _get(doc, path):
+    for part in path.split('.'):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def _set(doc, path, function):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = function(doc.get(parts[-1]))
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        value = _get(doc, key)
+        if isinstance(condition, dict) and condition and all(op.startswith('$') for op in condition):
+            for op, operand in condition.items():
+                if op == '$in' and value not in operand:
+                    return False
+                if op == '$lte' and not (value is not None and value <= operand):
+                    return False
+                if op == '$gte' and not (value is not None and value >= operand):
+                    return False
+                if op == '$type' and not (operand == 'date' and isinstance(value, datetime)):
+                    return False
+                if op == '$exists' and (value is not None) != operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor(list):
+    """Matched documents, with the ``sort``/``limit`` chaining of a pymongo cursor."""
+
+    def sort(self, key, direction=1):
+        super().sort(key=lambda doc: (_get(doc, key) is None, _get(doc, key)), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        return FakeCursor(self[:count]) if count else self
+
+
+class FakeSession:
+    """A client session whose transactions roll back the documents of one collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def with_transaction(self, callback):
+        snapshot = copy.deepcopy(self.collection.docs)
+        try:
+            return callback(self)
+        except Exception:
+            self.collection.docs = snapshot
+            raise
+
+
+class FakeCollection:
+    """The subset of ``pymongo.collection.Collection`` used by the tracking code."""
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self.bulk_writes = 0
+        self._next_id = 0
+        self.database = SimpleNamespace(client=SimpleNamespace(start_session=lambda: FakeSession(self)))
+
+    def _insert(self, doc):
+        if '_id' not in doc:
+            self._next_id += 1
+            doc['_id'] = self._next_id
+        self.docs.append(doc)
+
+    def insert_many(self, documents, ordered=True):
+        for doc in documents:
+            self._insert(doc)
+
+    def _update(self, query, update, upsert):
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return
+            doc = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            for key, value in update.get('$setOnInsert', {}).items():
+                _set(doc, key, lambda old, value=value: value)
+            self._insert(doc)
+        for key, value in update.get('$inc', {}).items():
+            _set(doc, key, lambda old, value=value: (old or 0) + value)
+        for key, value in update.get('$min', {}).items():
+            _set(doc, key, lambda old, value=value: value if old is None else min(old, value))
+        for key, value in update.get('$max', {}).items():
+            _set(doc, key, lambda old, value=value: value if old is None else max(old, value))
+        for key, value in update.get('$set', {}).items():
+            _set(doc, key, lambda old, value=value: value)
+        for key, value in update.get('$push', {}).items():
+            _set(doc, key, lambda old, value=value: (old or []) + list(value['$each']))
+
+    def bulk_write(self, requests, ordered=True, session=None):
+        self.bulk_writes += 1
+        for request in requests:
+            if isinstance(request, ReplaceOne):
+                self.replace_one(request._filter, request._doc, request._upsert)
+            else:
+                self._update(request._filter, request._doc, request._upsert)
+
+    def update_one(self, query, update, upsert=False, session=None):
+        self._update(query, update, upsert)
+
+    def replace_one(self, query, document, upsert=False, session=None):
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+        self._insert(copy.deepcopy(document))
+
+    def create_indexes(self, indexes):
+        return [index.document['name'] for index in indexes]
+
+    def delete_one(self, query):
+        for index, doc in enumerate(self.docs):
+            if matches(doc, query):
+                del self.docs[index]
+                return
+
+    def count_documents(self, query):
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    def find(self, query=None, projection=None, sort=None, **options):
+        cursor = FakeCursor(copy.deepcopy(doc) for doc in self.docs if matches(doc, query or {}))
+        for key, direction in reversed(sort or []):
+            cursor.sort(key, direction)
+        return cursor
+
+    def find_one(self, query=None, projection=None):
+        found = self.find(query)
+        return found[0] if found else None
+
+
+class FakeCollections(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection(name)
+        return collection
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """``{name: FakeCollection}``, created on demand, behind every ``get_collection``."""
+    collections = FakeCollections()
+    monkeypatch.setattr('apps.tracking.utils.mongo_client.get_shared_collection', collections.__getitem__)
+    return collections
+
+
+@pytest.fixture(autouse=True)
+def no_health_probe(settings):
+    """No background pings of a server that is not there (tests start their own probe)."""
+    settings.MONGODB_HEALTH_CHECK_INTERVAL = 0
+
+
+@pytest.fixture(autouse=True)
+def fresh_singletons(monkeypatch):
+    """Per-process singletons are rebuilt from the (possibly overridden) settings in every test."""
+    for target in (
+        'apps.tracking.broker._broker',
+        'apps.tracking.admission._controller',
+        'apps.tracking.store._store',
+        'apps.tracking.buffer._buffer',
+        'apps.tracking.utils.dedup._window',
+        'apps.tracking.utils.session_cache._cache',
+    ):
+        monkeypatch.setattr(target, None)
@@ -0,0 +1,204 @@
+"""Non-blocking logging for the ingestion hot path.
+
+``install_queue_logging`` swaps the handlers of the configured loggers (by
+default ``apps.tracking`` and ``utils``) for a single bounded queue; a
+dedicated writer thread formats records and feeds the original console and
+file handlers. Request threads only enqueue, and when the queue is full the
+record is dropped and counted instead of blocking.
+
+Request payloads go through :func:`log_payload`, which formats them only
+for 1 in ``PAYLOAD_SAMPLE_RATE`` calls (``sample``), only alongside errors
+(``errors``), always (``all``) or never (``off``).
+"""
+
+import os
+import queue
+import atexit
+import logging
+import itertools
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+LOGGING_DEFAULTS = {
+    'ASYNC': True,
+    'LOGGERS': ['apps.tracking', 'utils'],
+    'QUEUE_SIZE': 10000,
+    'PAYLOAD_MODE': 'sample',       # 'all', 'sample', 'errors' or 'off'
+    'PAYLOAD_SAMPLE_RATE': 100,     # log 1 in N payloads in 'sample' mode
+    'PAYLOAD_MAX_CHARS': 2000,
+}
+
+
+def get_logging_settings():
+    return {**LOGGING_DEFAULTS, **getattr(settings, 'TRACKING_LOGGING', {})}
+
+
+class LogVolumeStats:
+    """Counters for records enqueued, dropped and payloads logged or skipped."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            'enqueued': 0,
+            'dropped': 0,
+            'written': 0,
+            'payloads_logged': 0,
+            'payloads_skipped': 0,
+        }
+        self._levels = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def record(self, levelname):
+        with self._lock:
+            self._counters['enqueued'] += 1
+            self._levels[levelname] = self._levels.get(levelname, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['by_level'] = dict(self._levels)
+        return stats
+
+
+log_stats = LogVolumeStats()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that never blocks the caller.
+
+    Records are passed to the writer thread as-is; message formatting and
+    I/O happen there, not on the request thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_stats.incr('dropped')
+            return
+        log_stats.record(record.levelname)
+
+
+class CountingListener(QueueListener):
+    def handle(self, record):
+        super().handle(record)
+        log_stats.incr('written')
+
+
+_listener = None
+_queue_handler = None
+_listener_lock = threading.Lock()
+
+
+def install_queue_logging(config=None):
+    """Route the configured loggers through one queue and a writer thread.
+
+    Idempotent; the original handlers keep their levels and formatters.
+    """
+    global _listener, _queue_handler
+    config = config or get_logging_settings()
+    if not config['ASYNC']:
+        return None
+
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+
+        handlers = []
+        loggers = [logging.getLogger(name) for name in config['LOGGERS']]
+        for logger in loggers:
+            for handler in logger.handlers:
+                if handler not in handlers:
+                    handlers.append(handler)
+        if not handlers:
+            return None
+
+        log_queue = queue.Queue(maxsize=config['QUEUE_SIZE'])
+        _queue_handler = DroppingQueueHandler(log_queue)
+        for logger in loggers:
+            if logger.handlers:
+                logger.handlers = [_queue_handler]
+
+        _listener = CountingListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_queue_logging)
+        return _listener
+
+
+def stop_queue_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _restart_after_fork():
+    """Give a forked child a queue and writer thread of its own.
+
+    The child inherits the queue handler but not the parent's writer thread;
+    without a new listener its records would fill the queue and be dropped.
+    Records still queued in the parent are the parent's to write.
+    """
+    global _listener, _listener_lock
+    _listener_lock = threading.Lock()
+    log_stats._lock = threading.Lock()
+    if _listener is None:
+        return
+    parent = _listener
+    log_queue = queue.Queue(maxsize=parent.queue.maxsize)
+    _queue_handler.queue = log_queue
+    _listener = CountingListener(log_queue, *parent.handlers, respect_handler_level=parent.respect_handler_level)
+    _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+_payload_counter = itertools.count()
+
+
+def log_payload(logger, label, payload, error=False, level=logging.INFO):
+    """Log a request payload according to ``PAYLOAD_MODE``.
+
+    ``error=True`` marks payloads logged because something went wrong with
+    them; those are kept in every mode but ``off``. The payload is only
+    formatted when it is actually logged.
+    """
+    config = get_logging_settings()
+    mode = config['PAYLOAD_MODE']
+    if error:
+        keep = mode != 'off'
+        level = logging.WARNING
+    elif mode == 'all':
+        keep = True
+    elif mode == 'sample':
+        keep = next(_payload_counter) % max(config['PAYLOAD_SAMPLE_RATE'], 1) == 0
+    else:
+        keep = False
+
+    if not keep or not logger.isEnabledFor(level):
+        log_stats.incr('payloads_skipped')
+        return
+    log_stats.incr('payloads_logged')
+    text = str(payload)
+    if len(text) > config['PAYLOAD_MAX_CHARS']:
+        text = f"{text[:config['PAYLOAD_MAX_CHARS']]}... ({len(text)} chars)"
+    logger.log(level, "%s: %s", label, text, stacklevel=2)
+
+
+def get_log_stats():
+    stats = log_stats.snapshot()
+    stats['async'] = _listener is not None
+    stats['queue_depth'] = _listener.queue.qsize() if _listener is not None else 0
+    return stats
@@ -0,0 +1,95 @@
+"""Fast JSON encoding/decoding for tracking and analytics endpoints.
+
+Backed by ``orjson`` when it is installed (falling back to the standard
+library otherwise). Besides the usual JSON types it serialises datetimes,
+UUIDs, ``bson.ObjectId``, ``Decimal`` and NumPy arrays/scalars natively, so
+analytics results and raw Mongo documents can be rendered without a
+``json_util`` round-trip or ``.tolist()`` copies.
+"""
+
+import json
+import uuid
+import datetime
+import decimal
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+try:
+    from bson import ObjectId
+except ImportError:  # pragma: no cover - pymongo is a hard dependency
+    ObjectId = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+def default(obj):
+    """Serialise types the encoder does not handle itself (same output as DRF's encoder)."""
+    if ObjectId is not None and isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime.datetime):
+        representation = obj.isoformat()
+        if representation.endswith('+00:00'):
+            representation = representation[:-6] + 'Z'
+        return representation
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'tolist'):
+        # NumPy scalars and arrays orjson cannot serialise directly
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Serialise ``obj`` to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    """Parse JSON from ``bytes``/``str``; raises ``ValueError`` on invalid input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """DRF renderer using :func:`dumps` (compact output, no indentation)."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """DRF parser using :func:`loads`."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+# Drop-in replacements for DRF's default renderer/parser lists
+RENDERER_CLASSES = [FastJSONRenderer, BrowsableAPIRenderer]
+PARSER_CLASSES = [FastJSONParser, FormParser, MultiPartParser]
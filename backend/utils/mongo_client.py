@@ -1,79 +1,295 @@
-"""MongoDB client utility for direct access to the database."""
+"""MongoDB client utility for direct access to the database.
 
-import pymongo
+A single ``MongoClient`` is shared by every code path in the process. It is
+created lazily on first use, recreated after ``fork()`` (gunicorn/celery
+prefork workers must never reuse the parent's sockets), and monitored by a
+background health probe instead of pinging the server on every call.
+"""
+
+import os
+import time
 import logging
-import json
-import traceback
+import threading
 from datetime import datetime
-from bson import json_util
+
+import pymongo
+from pymongo import monitoring
 from django.conf import settings
 
+from utils.async_logging import log_payload
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_MONGODB_URI = 'mongodb://localhost:27017/'
+DEFAULT_DB_NAME = 'mouse_tracker'
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+
+# A checkout slower than this is counted as having waited for a connection
+# (either because the pool was exhausted or a new socket had to be opened).
+POOL_WAIT_THRESHOLD_SECONDS = 0.001
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_database_cache = {}
+_collection_cache = {}
+
+_health = {}
+_health_thread = None
+_health_stop = threading.Event()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collect connection pool counters for the shared client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {
+                'connections_created': 0,
+                'connections_closed': 0,
+                'checkouts': 0,
+                'checkins': 0,
+                'checkout_failures': 0,
+                'waits': 0,
+                'wait_seconds_total': 0.0,
+                'wait_seconds_max': 0.0,
+                'pool_cleared': 0,
+            }
+
+    def _incr(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['in_use'] = stats['checkouts'] - stats['checkins']
+        return stats
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr('pool_cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr('connections_created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr('connections_closed')
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        self._incr('checkout_failures')
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        with self._lock:
+            self.stats['checkouts'] += 1
+            if started is None:
+                return
+            waited = time.perf_counter() - started
+            if waited >= POOL_WAIT_THRESHOLD_SECONDS:
+                self.stats['waits'] += 1
+                self.stats['wait_seconds_total'] += waited
+                if waited > self.stats['wait_seconds_max']:
+                    self.stats['wait_seconds_max'] = waited
+
+    def connection_checked_in(self, event):
+        self._incr('checkins')
+
+
+pool_stats = PoolStatsListener()
+
+
+def _reset_health():
+    _health.update({
+        'healthy': None,
+        'last_check': None,
+        'last_error': None,
+        'latency_ms': None,
+    })
+
+
+_reset_health()
+
+
+def _reset_after_fork():
+    """Drop the inherited client in a forked child; it is rebuilt lazily."""
+    global _client, _client_pid, _client_lock, _health_thread, _health_stop
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+    _database_cache.clear()
+    _collection_cache.clear()
+    _health_thread = None
+    _health_stop = threading.Event()
+    # The parent's probe results say nothing about this process's client
+    _reset_health()
+    pool_stats.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _client_options():
+    options = dict(getattr(settings, 'MONGODB_CLIENT_SETTINGS', {}))
+    # Do not open sockets or start monitor threads until the first operation,
+    # so a client created before a fork is never shared with the child.
+    options.setdefault('connect', False)
+    options['event_listeners'] = list(options.get('event_listeners', [])) + [pool_stats]
+    return options
+
+
 def get_mongo_client():
-    """Get a MongoDB client instance."""
-    try:
-        # In ra thông báo debug
-        print("Đang thử kết nối đến MongoDB...")
-        logger.info("Đang thử kết nối đến MongoDB...")
-        
-        # Thử nhiều cách kết nối khác nhau
-        mongo_urls = [
-            'mongodb://localhost:27017/',
-            'mongodb://127.0.0.1:27017/',
-            'mongodb://0.0.0.0:27017/'
-        ]
-        
-        client = None
-        last_error = None
-        
-        for url in mongo_urls:
-            try:
-                print(f"Thử kết nối với {url}...")
-                client = pymongo.MongoClient(url, serverSelectionTimeoutMS=5000)
-                # Kiểm tra kết nối
-                client.admin.command('ping')
-                print(f"✅ Kết nối thành công đến MongoDB với URL: {url}")
-                logger.info(f"MongoDB connection successful with URL: {url}")
-                break
-            except Exception as e:
-                print(f"Không kết nối được với {url}: {str(e)}")
-                last_error = e
-                client = None
-        
-        if client is None:
-            logger.error(f"MongoDB connection failed with all URLs. Last error: {str(last_error)}")
-            traceback.print_exc()
+    """Get the process-wide MongoDB client, creating it on first use."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is not None and _client_pid == pid:
+            return _client
+        if _client_pid is not None and _client_pid != pid:
+            # Fork without register_at_fork support: never reuse parent state.
+            _reset_after_fork()
+
+        uri = getattr(settings, 'MONGODB_URI', DEFAULT_MONGODB_URI)
+        try:
+            client = pymongo.MongoClient(uri, **_client_options())
+        except Exception as e:
+            logger.error(f"MongoDB client creation failed: {str(e)}")
             return None
-            
-        return client
-    except Exception as e:
-        logger.error(f"MongoDB connection failed: {str(e)}")
-        print(f"❌ Lỗi kết nối MongoDB: {str(e)}")
-        traceback.print_exc()
-        # Trả về None nếu kết nối thất bại
-        return None
 
-def get_database():
+        _client = client
+        _client_pid = pid
+        logger.info("Created shared MongoDB client (pid %s)", pid)
+        _start_health_probe()
+        return _client
+
+
+def get_database(db_name=None):
     """Get the MongoDB database instance."""
+    db_name = db_name or getattr(settings, 'MONGODB_DB_NAME', DEFAULT_DB_NAME)
+    db = _database_cache.get(db_name)
+    if db is not None and _client_pid == os.getpid():
+        return db
+
     client = get_mongo_client()
     if client is None:
         logger.error("Failed to get MongoDB client")
         return None
-    
-    db_name = 'mouse_tracker'
-    logger.info(f"Using MongoDB database: {db_name}")
-    return client[db_name]
+
+    db = client[db_name]
+    _database_cache[db_name] = db
+    return db
+
 
 def get_collection(collection_name):
     """Get a specific MongoDB collection."""
+    collection = _collection_cache.get(collection_name)
+    if collection is not None and _client_pid == os.getpid():
+        return collection
+
     db = get_database()
     if db is None:
         logger.error("Failed to get MongoDB database")
         return None
-    
-    logger.info(f"Using MongoDB collection: {collection_name}")
-    return db[collection_name]
+
+    collections = getattr(settings, 'MONGODB_COLLECTIONS', {})
+    collection = db[collections.get(collection_name, collection_name)]
+    _collection_cache[collection_name] = collection
+    return collection
+
+
+def check_health():
+    """Ping the server once and record the result."""
+    client = get_mongo_client()
+    started = time.perf_counter()
+    try:
+        if client is None:
+            raise RuntimeError("MongoDB client is not available")
+        client.admin.command('ping')
+        _health.update({
+            'healthy': True,
+            'last_error': None,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+        })
+    except Exception as e:
+        if _health['healthy'] is not False:
+            logger.error(f"MongoDB health probe failed: {str(e)}")
+        _health.update({'healthy': False, 'last_error': str(e), 'latency_ms': None})
+    _health['last_check'] = datetime.utcnow()
+    return _health['healthy']
+
+
+def _health_probe_loop(stop_event, interval):
+    while not stop_event.is_set():
+        check_health()
+        stop_event.wait(interval)
+
+
+def _start_health_probe():
+    global _health_thread, _health_stop
+    interval = getattr(settings, 'MONGODB_HEALTH_CHECK_INTERVAL', DEFAULT_HEALTH_CHECK_INTERVAL)
+    if not interval or (_health_thread is not None and _health_thread.is_alive()):
+        return
+    # A fresh event per probe, so a probe stopped by close_mongo_client can be restarted
+    _health_stop = threading.Event()
+    _health_thread = threading.Thread(
+        target=_health_probe_loop,
+        args=(_health_stop, interval),
+        name='mongo-health-probe',
+        daemon=True,
+    )
+    _health_thread.start()
+
+
+def is_mongo_healthy():
+    """Return the last health probe result (``None`` if not probed yet)."""
+    return _health['healthy']
+
+
+def get_health():
+    """Return a copy of the last health probe state."""
+    return dict(_health)
+
+
+def get_pool_stats():
+    """Return connection pool counters for the shared client."""
+    return pool_stats.snapshot()
+
+
+def close_mongo_client():
+    """Close the shared client and stop the health probe."""
+    global _client, _client_pid, _health_thread
+    with _client_lock:
+        _health_stop.set()
+        _health_thread = None
+        _reset_health()
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+        _database_cache.clear()
+        _collection_cache.clear()
 
 def save_event(event_data):
     """Save event data to MongoDB."""
@@ -81,7 +297,6 @@ def save_event(event_data):
         collection = get_collection('events')
         if collection is None:
             logger.error("Failed to get events collection")
-            print("❌ Không thể lưu event vào MongoDB: Collection không tồn tại")
             return False
         
         # Đảm bảo timestamp là đối tượng datetime
@@ -97,18 +312,15 @@ def save_event(event_data):
         if 'session_id' in event_data and not isinstance(event_data['session_id'], str):
             event_data['session_id'] = str(event_data['session_id'])
         
-        # In ra dữ liệu đang lưu
-        print(f"Đang lưu event vào MongoDB: {event_data}")
+        # Ghi log dữ liệu đang lưu (lấy mẫu)
+        log_payload(logger, "Saving event to MongoDB", event_data)
         
         # Lưu event vào MongoDB
         result = collection.insert_one(event_data)
-        logger.info(f"Event saved to MongoDB with ID: {result.inserted_id}")
-        print(f"✅ Event đã được lưu vào MongoDB với ID: {result.inserted_id}")
+        logger.debug(f"Event saved to MongoDB with ID: {result.inserted_id}")
         return True
     except Exception as e:
         logger.exception(f"Error saving event to MongoDB: {str(e)}")
-        print(f"❌ Lỗi khi lưu event vào MongoDB: {str(e)}")
-        traceback.print_exc()
         return False
 
 def save_session(session_data):
@@ -117,7 +329,6 @@ def save_session(session_data):
         collection = get_collection('sessions')
         if collection is None:
             logger.error("Failed to get sessions collection")
-            print("❌ Không thể lưu session vào MongoDB: Collection không tồn tại")
             return False
         
         # Đảm bảo timestamp là đối tượng datetime
@@ -133,18 +344,15 @@ def save_session(session_data):
         if 'session_id' in session_data and not isinstance(session_data['session_id'], str):
             session_data['session_id'] = str(session_data['session_id'])
         
-        # In ra dữ liệu đang lưu
-        print(f"Đang lưu session vào MongoDB: {session_data}")
+        # Ghi log dữ liệu đang lưu (lấy mẫu)
+        log_payload(logger, "Saving session to MongoDB", session_data)
         
         # Lưu session vào MongoDB
         result = collection.insert_one(session_data)
         logger.info(f"Session saved to MongoDB with ID: {result.inserted_id}")
-        print(f"✅ Session đã được lưu vào MongoDB với ID: {result.inserted_id}")
         return True
     except Exception as e:
         logger.exception(f"Error saving session to MongoDB: {str(e)}")
-        print(f"❌ Lỗi khi lưu session vào MongoDB: {str(e)}")
-        traceback.print_exc()
         return False
 
 def get_events_by_session(session_id):
@@ -155,11 +363,8 @@ def get_events_by_session(session_id):
             logger.error("Failed to get events collection")
             return []
         
-        events = list(collection.find({'session_id': str(session_id)}))
-        # Chuyển đổi ObjectId thành string để có thể serialize
-        return json.loads(json_util.dumps(events))
+        # ObjectId/datetime được serialize trực tiếp bởi utils.fastjson
+        return list(collection.find({'session_id': str(session_id)}))
     except Exception as e:
         logger.exception(f"Error getting events from MongoDB: {str(e)}")
-        print(f"❌ Lỗi khi lấy events từ MongoDB: {str(e)}")
-        traceback.print_exc()
         return [] 
\ No newline at end of file
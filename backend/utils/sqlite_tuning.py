@@ -0,0 +1,49 @@
+"""PRAGMAs applied to every new SQLite connection.
+
+Django's SQLite backend runs with the default rollback journal and
+``synchronous=FULL``: every committed write transaction fsyncs the database
+and the journal, and readers block writers. ``install_sqlite_pragmas``
+hooks ``connection_created`` so each connection switches to write-ahead
+logging (readers no longer block the writer, commits append to the WAL),
+``synchronous=NORMAL`` (fsync at checkpoints only; still safe against
+corruption in WAL mode) and memory-mapped reads.
+
+The pragmas come from ``SQLITE_PRAGMAS``; an empty dict disables them.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+PRAGMA_DEFAULTS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,           # KiB (negative) of page cache per connection
+    'busy_timeout': 5000,           # ms to wait for the write lock
+}
+
+
+def get_sqlite_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', PRAGMA_DEFAULTS)
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """``connection_created`` receiver; a no-op for other database vendors."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = get_sqlite_pragmas()
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+
+
+def install_sqlite_pragmas():
+    """Apply the pragmas to every SQLite connection opened from now on (idempotent)."""
+    connection_created.connect(apply_pragmas, dispatch_uid='utils.sqlite_tuning')
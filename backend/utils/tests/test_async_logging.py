@@ -0,0 +1,43 @@
+import logging
+import os
+
+import pytest
+
+from utils import async_logging
+
+
+@pytest.fixture
+def file_logger(tmp_path, monkeypatch):
+    # Leave the listener installed at startup alone
+    monkeypatch.setattr(async_logging, '_listener', None)
+    monkeypatch.setattr(async_logging, '_queue_handler', None)
+    logger = logging.getLogger('tests.async_logging')
+    handler = logging.FileHandler(tmp_path / 'tracking.log')
+    logger.handlers = [handler]
+    logger.propagate = False
+    async_logging.install_queue_logging({'ASYNC': True, 'LOGGERS': [logger.name], 'QUEUE_SIZE': 10})
+    yield logger, tmp_path / 'tracking.log'
+    async_logging.stop_queue_logging()
+    handler.close()
+    logger.handlers = []
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_child_writes_its_records(file_logger):
+    logger, path = file_logger
+    logger.warning('from the parent')
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            logger.warning('from the child')
+            async_logging.stop_queue_logging()
+            code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    async_logging.stop_queue_logging()
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert sorted(path.read_text().splitlines()) == ['from the child', 'from the parent']
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from utils import mongo_client
+
+
+@pytest.fixture
+def probe(monkeypatch, settings):
+    """A health probe that records its calls instead of pinging a server."""
+    settings.MONGODB_HEALTH_CHECK_INTERVAL = 60
+    calls = threading.Semaphore(0)
+
+    def check_health():
+        mongo_client._health.update({'healthy': True, 'latency_ms': 1.0})
+        calls.release()
+        return True
+
+    monkeypatch.setattr(mongo_client, 'check_health', check_health)
+    mongo_client.close_mongo_client()
+    yield calls
+    mongo_client.close_mongo_client()
+
+
+def test_probe_restarts_after_close(probe):
+    mongo_client._start_health_probe()
+    assert probe.acquire(timeout=2)
+    first = mongo_client._health_thread
+
+    mongo_client.close_mongo_client()
+    first.join(timeout=2)
+    assert not first.is_alive()
+    assert mongo_client.get_health()['healthy'] is None
+
+    mongo_client._start_health_probe()
+    assert probe.acquire(timeout=2)
+    assert mongo_client._health_thread is not first and mongo_client._health_thread.is_alive()
+    assert mongo_client.get_health()['healthy'] is True
+
+
+def test_fork_handler_resets_health_and_stop_event():
+    mongo_client._health.update({'healthy': False, 'last_error': 'parent'})
+    stop = mongo_client._health_stop
+    stop.set()
+
+    mongo_client._reset_after_fork()
+
+    assert mongo_client.get_health() == {'healthy': None, 'last_check': None, 'last_error': None, 'latency_ms': None}
+    assert mongo_client._health_stop is not stop and not mongo_client._health_stop.is_set()